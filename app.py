@@ -2,504 +2,314 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
-import re
-import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
 import requests
+import threading
+import time
+import uuid
 from io import BytesIO
 import altair as alt
-import openpyxl
-
-API_KEY = ""
-
-PROMPT_TEMPLATE_BASE = """
-Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
-1) SCR : X€
-2) MCR : X€
-3) Ratio de solvabilité : X%
-
-IMPORTANT : 
-- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
-- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
-- Donne uniquement les chiffres, sans aucune explication
-- Respecte EXACTEMENT le format demandé
-"""
-
-PROMPT_TEMPLATE_FONDS_PROPRES = """
-Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
-1) Éléments éligibles (total des fonds propres) : X€
-2) Capital et primes : X€
-3) Réserve de réconciliation : X€
-4) Dettes subordonnées : X€
-5) Fonds excédentaires : X€
-
-IMPORTANT : 
-- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
-- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
-- Pour le capital et primes, si tu trouves ces éléments séparément (capital social + primes d'émission), additionne-les et donne uniquement le total
-- Donne uniquement les chiffres, sans aucune explication ni détail
-- Respecte EXACTEMENT le format demandé
-- N'ajoute pas de tirets, de puces ou d'autres caractères
-- N'ajoute pas de texte explicatif
-"""
-
-PROMPT_TEMPLATE_SCR_DETAIL = """
-Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
-1) SCR Risque de Marché : X€
-2) SCR Risque de Contrepartie : X€
-3) SCR Risque de Souscription Vie : X€
-4) SCR Risque de Souscription Santé : X€
-5) SCR Risque de Souscription Non-Vie : X€
-6) SCR Risque Opérationnel : X€
-7) Effet de Diversification : X€
-
-IMPORTANT : 
-- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
-- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
-- Donne uniquement les chiffres, sans aucune explication
-- Respecte EXACTEMENT le format demandé
-- Si une valeur n'est pas disponible, indique "Non disponible"
-- Pour l'Effet de Diversification, indique la valeur avec un signe négatif si c'est une réduction du SCR
-"""
-
-PROMPT_TEMPLATE_ACTIFS = """
-Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
-1) Total des actifs : X€
-2) Obligations : X€
-3) Actions : X€
-4) Fonds d'investissement : X€
-5) Produits dérivés : X€
-6) Immobilier : X€
-7) Trésorerie et dépôts : X€
-8) Participations : X€
-9) Autres actifs : X€
-
-IMPORTANT : 
-- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
-- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
-- Donne uniquement les chiffres, sans aucune explication
-- Respecte EXACTEMENT le format demandé
-- Si une valeur n'est pas disponible, indique "Non disponible"
-- Les informations peuvent etre présentées sous différentes normes ou catégories (comme Solvabilité 1, Solvabilité 2, IFRS, etc.), choisit toujours la colonne "Solvabilité 2 ou Solvabilité II"
-- Pour le total des actifs, cherche le "Total de l'actif" ou "Total actif"
-- Les obligations peuvent aussi être appelées "Titres obligataires" ou "Titres à revenu fixe"
-- Les actions peuvent aussi être appelées "Titres de participation" ou "Titres à revenu variable"
-- Les fonds d'investissement peuvent aussi être appelés "OPCVM" ou "Fonds communs de placement"
-- IMPORTANT : Les informations peuvent se trouver à plusieurs endroits différents dans le document, comme "Actifs",  "Investissements", "Placements" ou "Portefeuille d'investissement".
-"""
-
-QUESTION_TEMPLATE_BASE = """
-Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
-0) Nom de la société : 
-1) SCR : 
-2) MCR : 
-3) Ratio de solvabilité : 
-"""
-
-QUESTION_TEMPLATE_FONDS_PROPRES = """
-Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
-1) Éléments éligibles (total des fonds propres) : 
-2) Capital et primes : 
-3) Réserve de réconciliation : 
-4) Dettes subordonnées : 
-5) Fonds excédentaires : 
-
-Pour le capital et primes, si tu trouves ces éléments séparément (capital social + primes d'émission), additionne-les et donne uniquement le total.
-"""
-
-QUESTION_TEMPLATE_SCR_DETAIL = """
-Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
-1) SCR Risque de Marché : 
-2) SCR Risque de Contrepartie : 
-3) SCR Risque de Souscription Vie : 
-4) SCR Risque de Souscription Santé : 
-5) SCR Risque de Souscription Non-Vie : 
-6) SCR Risque Opérationnel : 
-7) Effet de Diversification : 
-"""
-
-QUESTION_TEMPLATE_ACTIFS = """
-Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
-1) Total des actifs : 
-2) Obligations : 
-3) Actions : 
-4) Fonds d'investissement : 
-5) Produits dérivés : 
-6) Immobilier : 
-7) Trésorerie et dépôts : 
-8) Participations : 
-9) Autres actifs : 
-"""
-
-def convert_value(value_str, unit_pattern):
-    """
-    Convertit une valeur textuelle en valeur numérique en tenant compte de l'unité.
+
+from sfcr_core import (
+    EXTRACTION_MODE_COMBINED,
+    EXTRACTION_MODE_SECTIONS,
+    EXTRACTION_SECTIONS,
+    JOB_DONE,
+    JOB_FAILED,
+    MAX_PARALLEL_PDFS,
+    PAGE_SELECTION_MAX_PAGES,
+    PAGE_SELECTION_MIN_PAGES,
+    PREDEFINED_ANALYSES,
+    PROMPT_TEMPLATE_BASE,
+    QUESTION_TEMPLATE_BASE,
+    ResultsStore,
+    SECTION_LABELS,
+    PdfReader,
+    CROSS_CHECKS,
+    ChatStream,
+    ask_all_documents,
+    compute_file_hash,
+    cross_check,
+    format_page_ranges,
+    get_chatpdf_client,
+    get_job_manager,
+    get_prepared_analyses,
+    get_response_cache_stats,
+    list_history,
+    load_from_history,
+    perf_recorder,
+    save_prepared_analysis,
+    timed,
+    write_excel_report,
+)
+
+# Intervalle, en secondes, entre deux mises à jour de l'affichage pendant la réception d'une
+# réponse : chaque mise à jour permet à Streamlit d'interrompre l'exécution après « Annuler »
+ANSWER_POLL_INTERVAL = 0.25
+
+def stream_answer(pdf_file, question, use_cache=True, doc_hash=None):
+    """
+    Affiche la réponse de ChatPDF au fur et à mesure de sa réception, avec un bouton
+    d'annulation. La réponse est lue dans un thread séparé et l'affichage est mis à jour
+    pendant l'attente : cliquer sur « Annuler », même avant le premier fragment, réexécute
+    l'application et annule la réponse ; le texte déjà reçu reste affiché par display_last_answer.
+    La réponse complète à une analyse prédéfinie remplace celle préparée pour le document.
     
     Args:
-        value_str (str): La chaîne de caractères contenant la valeur numérique
-        unit_pattern (str): La chaîne complète contenant l'unité (€, M€, Md€)
-    
-    Returns:
-        float: La valeur convertie en euros, ou np.nan si la conversion échoue
+        pdf_file: Le fichier PDF obtenu via st.file_uploader
+        question (str): La question à poser
+        use_cache (bool): Si False, ignore le cache des réponses
+        doc_hash (str, optional): L'empreinte du document, pour enregistrer les analyses prédéfinies
     """
-    if "Non disponible" in value_str:
-        return np.nan
-        
-    value_str = value_str.replace(" ", "").replace(",", ".")
+    st.button("Annuler", key="cancel_question", on_click=cancel_answer)
+    stream = ChatStream(pdf_file, question, use_cache=use_cache)
+    st.session_state.last_answer = {"question": question, "stream": stream}
+    st.write("Réponse :")
+    waiting = st.empty()
     try:
-        value = float(value_str)
-        if "Md€" in unit_pattern or "milliard" in unit_pattern:
-            return value * 1_000_000_000
-        elif "M€" in unit_pattern or "million" in unit_pattern:
-            return value * 1_000_000
-        else:
-            return value
-    except ValueError:
-        return np.nan
+        st.write_stream(answer_fragments(stream, waiting))
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        st.error(f"Erreur lors de la requête à ChatPDF : {e}")
+        return
+    
+    if not stream.text:
+        st.error("Désolé, je n'ai pas pu obtenir de réponse.")
+    else:
+        st.caption(answer_timing_caption(stream))
+        if stream.complete and doc_hash and question in PREDEFINED_ANALYSES.values():
+            save_prepared_analysis(doc_hash, question, stream.text)
 
-def parse_base_text(text):
+def cancel_answer():
     """
-    Extrait les informations de base (nom de société, SCR, MCR, ratio de solvabilité) 
-    à partir du texte fourni par l'API ChatPDF.
+    Annule la réponse en cours de réception (rappel du bouton « Annuler »).
+    """
+    last_answer = st.session_state.get("last_answer")
+    if last_answer and "stream" in last_answer:
+        last_answer["stream"].cancel()
+
+def answer_fragments(stream, waiting):
+    """
+    Produit les fragments d'une réponse pour st.write_stream. Tant qu'aucun fragment n'arrive,
+    la durée d'attente est affichée dans waiting et rafraîchie toutes les ANSWER_POLL_INTERVAL
+    secondes ; une exécution interrompue annule la réponse.
     
     Args:
-        text (str): Le texte brut contenant les informations à extraire
+        stream (ChatStream): La réponse
+        waiting: L'emplacement (st.empty) où afficher l'attente
     
-    Returns:
-        DataFrame: Un DataFrame contenant les informations extraites
+    Yields:
+        str: Les fragments de texte
     """
-    patterns = {
-        'company': r"0\)\s*Nom de la société\s*:\s*(.+)",
-        'scr': r"1\)\s*SCR\s*:\s*([\d\s]+)€",
-        'mcr': r"2\)\s*MCR\s*:\s*([\d\s]+)€",
-        'ratio': r"3\)\s*Ratio de solvabilité\s*:\s*([\d,\.]+)\s*%"
-    }
-    
-    data = []
-    current_entry = {
-        'Société': None,
-        'SCR (€)': np.nan,
-        'MCR (€)': np.nan,
-        'Ratio de solvabilité (%)': np.nan
-    }
-    
-    for line in text.splitlines():
-        for key, pattern in patterns.items():
-            match = re.search(pattern, line)
-            if match:
-                if key == 'company':
-                    if current_entry['Société'] is not None:
-                        data.append(current_entry.copy())
-                    current_entry = {
-                        'Société': match.group(1).strip(), 
-                        'SCR (€)': np.nan, 
-                        'MCR (€)': np.nan, 
-                        'Ratio de solvabilité (%)': np.nan
-                    }
-                elif key == 'scr':
-                    current_entry['SCR (€)'] = int(match.group(1).replace(" ", ""))
-                elif key == 'mcr':
-                    current_entry['MCR (€)'] = int(match.group(1).replace(" ", ""))
-                elif key == 'ratio':
-                    current_entry['Ratio de solvabilité (%)'] = float(match.group(1).replace(",", "."))
-    
-    if current_entry['Société'] is not None:
-        data.append(current_entry)
-    return pd.DataFrame(data)
-
-def parse_fonds_propres_text(text):
-    """
-    Extrait les informations sur les fonds propres à partir du texte fourni par l'API ChatPDF.
-    Gère différents formats de présentation des valeurs (€, M€, Md€).
+    start = time.perf_counter()
+    try:
+        for chunk in stream.poll(ANSWER_POLL_INTERVAL):
+            if chunk is None:
+                if stream.chunks:
+                    waiting.empty()
+                else:
+                    waiting.caption(f"En attente de la réponse… {time.perf_counter() - start:.0f} s")
+                continue
+            waiting.empty()
+            yield chunk
+    finally:
+        stream.cancel()
+
+def answer_timing_caption(stream):
+    """
+    Formate le délai avant le premier fragment et la durée totale d'une réponse.
     
     Args:
-        text (str): Le texte brut contenant les informations à extraire
+        stream (ChatStream): La réponse
     
     Returns:
-        DataFrame: Un DataFrame contenant les informations sur les fonds propres
-    """
-    patterns = {
-        'elements_eligibles': r"1\)\s*Éléments éligibles[^:]*:\s*([\d\s,\.]+)(?:€|Md€|M€)",
-        'capital_primes': r"2\)\s*Capital et primes\s*:\s*([\d\s,\.]+)(?:€|Md€|M€)",
-        'reserve_reconciliation': r"3\)\s*Réserve de réconciliation\s*:\s*([\d\s,\.]+)(?:€|Md€|M€)",
-        'dettes_subordonnees': r"4\)\s*Dettes subordonnées\s*:\s*([\d\s,\.]+)(?:€|Md€|M€)",
-        'fonds_excedentaires': r"5\)\s*Fonds excédentaires\s*:\s*([\d\s,\.]+)(?:€|Md€|M€)"
-    }
-    
-    # Patterns alternatifs pour capturer les valeurs en milliards ou millions
-    alt_patterns = {
-        'elements_eligibles': r"Éléments éligibles[^:]*:\s*([\d\s,\.]+)\s*(?:Md€|milliards|milliard)",
-        'capital_primes': r"Capital et primes\s*:\s*([\d\s,\.]+)\s*(?:Md€|milliards|milliard)",
-        'reserve_reconciliation': r"Réserve de réconciliation\s*:\s*([\d\s,\.]+)\s*(?:Md€|milliards|milliard)",
-        'dettes_subordonnees': r"Dettes subordonnées\s*:\s*([\d\s,\.]+)\s*(?:Md€|milliards|milliard)",
-        'fonds_excedentaires': r"Fonds excédentaires\s*:\s*([\d\s,\.]+)\s*(?:Md€|milliards|milliard)"
-    }
-    
-    # Patterns pour millions
-    million_patterns = {
-        'elements_eligibles': r"Éléments éligibles[^:]*:\s*([\d\s,\.]+)\s*(?:M€|millions|million)",
-        'capital_primes': r"Capital et primes\s*:\s*([\d\s,\.]+)\s*(?:M€|millions|million)",
-        'reserve_reconciliation': r"Réserve de réconciliation\s*:\s*([\d\s,\.]+)\s*(?:M€|millions|million)",
-        'dettes_subordonnees': r"Dettes subordonnées\s*:\s*([\d\s,\.]+)\s*(?:M€|millions|million)",
-        'fonds_excedentaires': r"Fonds excédentaires\s*:\s*([\d\s,\.]+)\s*(?:M€|millions|million)"
-    }
-    
-    data = []
-    current_entry = {
-        'Éléments éligibles (€)': np.nan,
-        'Capital et primes (€)': np.nan,
-        'Réserve de réconciliation (€)': np.nan,
-        'Dettes subordonnées (€)': np.nan,
-        'Fonds excédentaires (€)': np.nan
-    }
-    
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text)
-        if match:
-            value_str = match.group(1)
-            unit_pattern = match.group(0)
-            value = convert_value(value_str, unit_pattern)
-            
-            if key == 'elements_eligibles':
-                current_entry['Éléments éligibles (€)'] = value
-            elif key == 'capital_primes':
-                current_entry['Capital et primes (€)'] = value
-            elif key == 'reserve_reconciliation':
-                current_entry['Réserve de réconciliation (€)'] = value
-            elif key == 'dettes_subordonnees':
-                current_entry['Dettes subordonnées (€)'] = value
-            elif key == 'fonds_excedentaires':
-                current_entry['Fonds excédentaires (€)'] = value
-    
-    for key, pattern in alt_patterns.items():
-        column_mapping = {
-            'elements_eligibles': 'Éléments éligibles (€)',
-            'capital_primes': 'Capital et primes (€)',
-            'reserve_reconciliation': 'Réserve de réconciliation (€)',
-            'dettes_subordonnees': 'Dettes subordonnées (€)',
-            'fonds_excedentaires': 'Fonds excédentaires (€)'
-        }
-        
-        column_name = column_mapping[key]
-        
-        if pd.isna(current_entry[column_name]):
-            match = re.search(pattern, text)
-            if match:
-                value_str = match.group(1)
-                unit_pattern = match.group(0)
-                value = convert_value(value_str, unit_pattern)
-                current_entry[column_name] = value
-    
-    for key, pattern in million_patterns.items():
-        column_name = column_mapping[key]
-        
-        if pd.isna(current_entry[column_name]):
-            match = re.search(pattern, text)
-            if match:
-                value_str = match.group(1)
-                unit_pattern = match.group(0)
-                value = convert_value(value_str, unit_pattern)
-                current_entry[column_name] = value
-    
-    if pd.isna(current_entry['Éléments éligibles (€)']):
-        match = re.search(r"Éléments éligibles.*?(\d[\d\s,\.]+)(?:€|Md€|M€)", text, re.IGNORECASE)
-        if match:
-            value_str = match.group(1)
-            unit_pattern = match.group(0)
-            current_entry['Éléments éligibles (€)'] = convert_value(value_str, unit_pattern)
-    
-    data.append(current_entry)
-    return pd.DataFrame(data)
+        str: Le texte à afficher
+    """
+    if stream.from_cache:
+        return "Réponse lue dans le cache"
+    if stream.ttft is None:
+        return "Aucun fragment reçu"
+    return f"Premier fragment après {stream.ttft:.1f} s, réponse complète en {stream.elapsed:.1f} s"
 
-def parse_scr_detail_text(text):
+def display_last_answer():
+    """
+    Réaffiche la dernière réponse de la session, y compris une réponse interrompue par « Annuler ».
     """
-    Extrait les détails des composantes du SCR à partir du texte fourni par l'API ChatPDF.
+    last_answer = st.session_state.get("last_answer")
+    if not last_answer:
+        return
+    if "prepared_at" in last_answer:
+        st.write("Réponse :")
+        st.write(last_answer["text"])
+        st.caption(f"Analyse préparée le {time.strftime('%d/%m/%Y à %H:%M', time.localtime(last_answer['prepared_at']))}")
+        return
+    if not last_answer["stream"].text:
+        return
+    
+    stream = last_answer["stream"]
+    stream.cancel()
+    st.write("Réponse :")
+    st.write(stream.text)
+    if stream.complete:
+        st.caption(answer_timing_caption(stream))
+    else:
+        st.caption(f"Réponse interrompue après {stream.elapsed or 0:.1f} s")
+
+def document_hash(name, uploaded_files):
+    """
+    Retourne l'empreinte d'un document de la session : celle de son extraction, sinon celle
+    calculée sur le fichier chargé.
     
     Args:
-        text (str): Le texte brut contenant les informations à extraire
+        name (str): Le nom du document dans les résultats
+        uploaded_files (list): Les fichiers obtenus via st.file_uploader
     
     Returns:
-        DataFrame: Un DataFrame contenant les composantes détaillées du SCR
-    """
-    patterns = {
-        'scr_marche': r"1\)\s*SCR Risque de Marché\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'scr_contrepartie': r"2\)\s*SCR Risque de Contrepartie\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'scr_vie': r"3\)\s*SCR Risque de Souscription Vie\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'scr_sante': r"4\)\s*SCR Risque de Souscription Santé\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'scr_non_vie': r"5\)\s*SCR Risque de Souscription Non-Vie\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'scr_operationnel': r"6\)\s*SCR Risque Opérationnel\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'effet_diversification': r"7\)\s*Effet de Diversification\s*:\s*([\-]?[\d\s,\.]+)(?:€|Md€|M€|Non disponible)"
-    }
-    
-    data = []
-    current_entry = {
-        'SCR Risque de Marché (€)': np.nan,
-        'SCR Risque de Contrepartie (€)': np.nan,
-        'SCR Risque de Souscription Vie (€)': np.nan,
-        'SCR Risque de Souscription Santé (€)': np.nan,
-        'SCR Risque de Souscription Non-Vie (€)': np.nan,
-        'SCR Risque Opérationnel (€)': np.nan,
-        'Effet de Diversification (€)': np.nan
-    }
-    
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text)
-        if match:
-            value_str = match.group(1)
-            unit_pattern = match.group(0)
-            value = convert_value(value_str, unit_pattern)
-            
-            column_mapping = {
-                'scr_marche': 'SCR Risque de Marché (€)',
-                'scr_contrepartie': 'SCR Risque de Contrepartie (€)',
-                'scr_vie': 'SCR Risque de Souscription Vie (€)',
-                'scr_sante': 'SCR Risque de Souscription Santé (€)',
-                'scr_non_vie': 'SCR Risque de Souscription Non-Vie (€)',
-                'scr_operationnel': 'SCR Risque Opérationnel (€)',
-                'effet_diversification': 'Effet de Diversification (€)'
-            }
-            
-            current_entry[column_mapping[key]] = value
+        str: L'empreinte SHA-256, ou None si le document n'est ni extrait ni chargé dans la session
+    """
+    doc_hashes = st.session_state.setdefault("doc_hashes", {})
+    if name not in doc_hashes:
+        pdf_file = next((f for f in uploaded_files or [] if f.name == name), None)
+        if pdf_file is None:
+            return None
+        doc_hashes[name] = compute_file_hash(pdf_file)
+    return doc_hashes[name]
+
+def show_prepared_analysis(label, prepared):
+    """
+    Place la question d'une analyse prédéfinie dans la zone de saisie et, si sa réponse a déjà
+    été préparée pour le document, l'affiche sans interroger ChatPDF.
     
-    data.append(current_entry)
-    return pd.DataFrame(data)
+    Args:
+        label (str): Le libellé de l'analyse prédéfinie
+        prepared (dict): Les analyses préparées du document (voir get_prepared_analyses)
+    """
+    prompt = PREDEFINED_ANALYSES[label]
+    st.session_state.user_question = prompt
+    if prompt in prepared:
+        answer, prepared_at = prepared[prompt]
+        st.session_state.last_answer = {"question": prompt, "text": answer, "prepared_at": prepared_at}
 
-def parse_actifs_text(text):
+def question_label(question):
     """
-    Extrait les informations sur la composition des actifs à partir du texte fourni par l'API ChatPDF.
-    Calcule automatiquement le total des actifs si celui-ci n'est pas disponible mais que les composantes le sont.
+    Retourne l'intitulé court d'une question : le libellé de l'analyse prédéfinie
+    correspondante, sinon la question elle-même.
     
     Args:
-        text (str): Le texte brut contenant les informations à extraire
+        question (str): Le texte de la question
     
     Returns:
-        DataFrame: Un DataFrame contenant les informations sur les actifs
-    """
-    patterns = {
-        'total_actifs': r"1\)\s*Total des actifs\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'obligations': r"2\)\s*Obligations\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'actions': r"3\)\s*Actions\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'fonds': r"4\)\s*Fonds d'investissement\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'derives': r"5\)\s*Produits dérivés\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'immobilier': r"6\)\s*Immobilier\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'tresorerie': r"7\)\s*Trésorerie et dépôts\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'participations': r"8\)\s*Participations\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)",
-        'autres': r"9\)\s*Autres actifs\s*:\s*([\d\s,\.]+)(?:€|Md€|M€|Non disponible)"
-    }
-    
-    data = []
-    current_entry = {
-        'Total des actifs (€)': np.nan,
-        'Obligations (€)': np.nan,
-        'Actions (€)': np.nan,
-        'Fonds d\'investissement (€)': np.nan,
-        'Produits dérivés (€)': np.nan,
-        'Immobilier (€)': np.nan,
-        'Trésorerie et dépôts (€)': np.nan,
-        'Participations (€)': np.nan,
-        'Autres actifs (€)': np.nan
-    }
-    
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text)
-        if match:
-            value_str = match.group(1)
-            unit_pattern = match.group(0)
-            value = convert_value(value_str, unit_pattern)
-            
-            column_mapping = {
-                'total_actifs': 'Total des actifs (€)',
-                'obligations': 'Obligations (€)',
-                'actions': 'Actions (€)',
-                'fonds': 'Fonds d\'investissement (€)',
-                'derives': 'Produits dérivés (€)',
-                'immobilier': 'Immobilier (€)',
-                'tresorerie': 'Trésorerie et dépôts (€)',
-                'participations': 'Participations (€)',
-                'autres': 'Autres actifs (€)'
-            }
-            
-            current_entry[column_mapping[key]] = value
-
-    if pd.isna(current_entry['Total des actifs (€)']):
-        components = [
-            current_entry['Obligations (€)'],
-            current_entry['Actions (€)'],
-            current_entry['Fonds d\'investissement (€)'],
-            current_entry['Produits dérivés (€)'],
-            current_entry['Immobilier (€)'],
-            current_entry['Trésorerie et dépôts (€)'],
-            current_entry['Participations (€)'],
-            current_entry['Autres actifs (€)']
-        ]
-        
-        valid_components = [c for c in components if not pd.isna(c)]
-        
-        if valid_components:  
-            current_entry['Total des actifs (€)'] = sum(valid_components)
-    
-    data.append(current_entry)
-    return pd.DataFrame(data)
+        str: L'intitulé de la question
+    """
+    return next((label for label, prompt in PREDEFINED_ANALYSES.items() if prompt == question), question)
 
-def add_pdf_from_file(uploaded_file):
+def build_answer_grid(grid, results, latency_question=None):
     """
-    Télécharge un fichier PDF vers l'API ChatPDF et obtient un identifiant unique.
-    
-    Cette fonction prend un fichier PDF téléchargé via Streamlit, l'envoie à l'API ChatPDF
-    et retourne l'identifiant source qui sera utilisé pour interroger le document.
+    Construit la grille des réponses aux questions posées à tous les PDFs : une ligne par
+    document, une colonne par question, dans l'ordre où elles ont été posées.
     
     Args:
-        uploaded_file: L'objet fichier PDF obtenu via st.file_uploader
+        grid (dict): Les DocumentAnswer par couple (nom du PDF, question)
+        results (ResultsStore): La table des résultats de la session
+        latency_question (str, optional): Une question dont la durée de réponse de chaque
+            document est ajoutée dans la colonne "Durée (s)"
     
     Returns:
-        str: L'identifiant source (source_id) du PDF dans l'API ChatPDF, ou None en cas d'erreur
+        DataFrame: Les colonnes "Fichier" et "Société", puis une colonne par question
     """
-    url = "https://api.chatpdf.com/v1/sources/add-file"
-    headers = {"x-api-key": API_KEY}
-    
-    try:
-        files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
-        response = requests.post(url, headers=headers, files=files)
-        response.raise_for_status() 
-        return response.json()["sourceId"]
-    except Exception as e:
-        st.error(f"Erreur lors du téléchargement du PDF: {str(e)}")
-        return None
+    names = [name for name in results.files() if any(name == answered for answered, _ in grid)]
+    if not names:
+        return pd.DataFrame()
+    
+    df = results.frame(names, with_keys=True)[["Fichier", "Société"]].astype(str)
+    for question in dict.fromkeys(question for _, question in grid):
+        cells = [grid.get((name, question)) for name in names]
+        df[question_label(question)] = [
+            None if cell is None else (cell.answer if cell.error is None else f"Échec : {cell.error}")
+            for cell in cells
+        ]
+        if question == latency_question:
+            df["Durée (s)"] = [None if cell is None else round(cell.elapsed, 2) for cell in cells]
+    return df
+
+def cancel_answer_all():
+    """
+    Annule la question posée à tous les PDFs (rappel du bouton « Annuler ») : les questions
+    pas encore envoyées sont abandonnées.
+    """
+    cancel = st.session_state.get("ask_all_cancel")
+    if cancel is not None:
+        cancel.set()
 
-def chat_with_pdf(source_id, question, prompt=None):
+def answer_all_documents(pdf_files, question, results, use_cache=True):
     """
-    Envoie une question à l'API ChatPDF et retourne la réponse.
+    Pose la même question à tous les PDFs chargés, simultanément, et met à jour la grille des
+    réponses à l'arrivée de chacune avec la durée de réponse de chaque document. L'affichage
+    est rafraîchi pendant l'attente pour que « Annuler » interrompe l'exécution sans délai.
     
     Args:
-        source_id (str): L'identifiant source du PDF
+        pdf_files (list): Les fichiers obtenus via st.file_uploader
         question (str): La question à poser
-        prompt (str, optional): Un prompt spécifique à utiliser
-    
-    Returns:
-        str: La réponse de l'API ChatPDF, ou None en cas d'erreur
+        results (ResultsStore): La table des résultats de la session
+        use_cache (bool): Si False, ignore le cache des réponses
     """
-    url = "https://api.chatpdf.com/v1/chats/message"
-    headers = {"x-api-key": API_KEY, "Content-Type": "application/json"}
-    
-    messages = []
-    if prompt:
-        messages.append({"role": "assistant", "content": prompt})
-    messages.append({"role": "user", "content": question})
-    
-    data = {"sourceId": source_id, "messages": messages}
-    
+    grid = st.session_state.setdefault("answer_grid", {})
+    for pdf_file in pdf_files:
+        grid.pop((pdf_file.name, question), None)
+    st.session_state.grid_question = question
+    
+    cancel = st.session_state.ask_all_cancel = threading.Event()
+    st.button("Annuler", key="cancel_question_all", on_click=cancel_answer_all)
+    progress = st.progress(0.0, text=f"0 réponse sur {len(pdf_files)}")
+    table = st.empty()
+    answers = ask_all_documents(
+        pdf_files, question, use_cache=use_cache, cancel=cancel, poll_interval=ANSWER_POLL_INTERVAL
+    )
+    nb_answers = 0
     try:
-        response = requests.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        content = response.json()["content"]
-        
-        return content
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erreur lors de la requête à ChatPDF : {e}")
-        if e.response is not None:
-            st.error(f"Réponse du serveur : {e.response.text}")
-        return None
+        for cell in answers:
+            if cell is None:
+                # Mise à jour sans changement : permet à Streamlit d'interrompre l'exécution après « Annuler »
+                progress.progress(nb_answers / len(pdf_files), text=f"{nb_answers} réponse(s) sur {len(pdf_files)}")
+                continue
+            nb_answers += 1
+            grid[(cell.name, question)] = cell
+            progress.progress(nb_answers / len(pdf_files), text=f"{nb_answers} réponse(s) sur {len(pdf_files)}")
+            table.dataframe(build_answer_grid(grid, results, latency_question=question), hide_index=True)
+    finally:
+        answers.close()
+    progress.empty()
+    table.empty()
+
+def display_answer_grid(results):
+    """
+    Affiche la grille des réponses aux questions posées à tous les PDFs et permet de
+    l'exporter avec les données extraites.
+    
+    Args:
+        results (ResultsStore): La table des résultats de la session
+    """
+    grid = st.session_state.get("answer_grid")
+    if not grid:
+        return
+    df_grid = build_answer_grid(grid, results, latency_question=st.session_state.get("grid_question"))
+    if df_grid.empty:
+        return
+    
+    st.subheader("Réponses par document")
+    st.dataframe(df_grid, hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        download_excel(
+            results.frame(),
+            filename="questions_sfcr.xlsx",
+            answers=df_grid.drop(columns="Durée (s)", errors="ignore"),
+            key="download_answers"
+        )
+    with col2:
+        if st.button("Effacer les réponses"):
+            st.session_state.answer_grid = {}
+            st.rerun()
 
 def compute_additional_statistics(df):
     stats = {}
@@ -579,101 +389,61 @@ def display_data(df_solvency, show_full_analysis=False):
         ax.grid(True)
         fig.tight_layout()
         st.pyplot(fig)
-        st.subheader("Graphique interactif Altair")
-        chart_type = st.sidebar.radio("Type de graphique interactif", ("Barres", "Lignes", "Scatter"))
-        color = st.sidebar.color_picker("Choisissez la couleur", "#1f77b4")
-        metric = st.selectbox("Sélectionnez la métrique", ("SCR (€)", "MCR (€)", "Ratio de solvabilité (%)"))
-        display_altair_chart(df_solvency, metric, chart_type, color)
+        plt.close(fig)
+        display_interactive_chart(df_solvency)
 
-def download_excel(df, filename="analyse_sfcr.xlsx"):
+@st.fragment
+def display_interactive_chart(df_solvency):
     """
-    Crée un fichier Excel contenant les données extraites et le rend téléchargeable.
-    Organise les données en plusieurs onglets thématiques et ajuste automatiquement la largeur des colonnes.
-    Exclut la ligne "Moyenne" du fichier Excel.
+    Affiche le graphique interactif Altair et ses réglages. Modifier le type, la couleur
+    ou la métrique ne réexécute que cette partie de la page.
+    
+    Args:
+        df_solvency (DataFrame): Le DataFrame contenant les données à afficher
+    """
+    st.subheader("Graphique interactif Altair")
+    col1, col2 = st.columns([3, 1])
+    chart_type = col1.radio("Type de graphique interactif", ("Barres", "Lignes", "Scatter"), horizontal=True)
+    color = col2.color_picker("Choisissez la couleur", "#1f77b4")
+    metric = st.selectbox("Sélectionnez la métrique", ("SCR (€)", "MCR (€)", "Ratio de solvabilité (%)"))
+    display_altair_chart(df_solvency, metric, chart_type, color)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_excel_report(df, answers=None):
+    """
+    Construit le classeur Excel des données extraites (voir write_excel_report).
+    Le résultat est mis en cache selon le contenu de df et de answers.
     
     Args:
         df (DataFrame): Le DataFrame contenant les données à exporter
-        filename (str): Le nom du fichier Excel à générer
+        answers (DataFrame, optional): La grille des réponses aux questions posées à tous les PDFs
+    
+    Returns:
+        bytes: Le contenu du fichier Excel
     """
     output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    
-    df_societes = df[df['Société'] != 'Moyenne'].copy()
-    df_transposed = df_societes.set_index('Société').transpose()
-    df_transposed.index.name = 'Métrique'
-    df_transposed.to_excel(writer, sheet_name='Données')
-    
-    # Ajouter une feuille "Fonds propres"
-    fonds_propres_columns = [
-        'Société', 
-        'Éléments éligibles (€)', 
-        'Capital et primes (€)', 
-        'Réserve de réconciliation (€)', 
-        'Dettes subordonnées (€)', 
-        'Fonds excédentaires (€)'
-    ]
-    df_fonds_propres = df_societes[fonds_propres_columns].set_index('Société').transpose()
-    df_fonds_propres.index.name = 'Métrique'
-    df_fonds_propres.to_excel(writer, sheet_name='Fonds propres')
-    
-    # Ajouter une feuille "SCR"
-    scr_columns = [
-        'Société', 
-        'SCR (€)', 
-        'MCR (€)', 
-        'Ratio de solvabilité (%)',
-        'SCR Risque de Marché (€)',
-        'SCR Risque de Contrepartie (€)',
-        'SCR Risque de Souscription Vie (€)',
-        'SCR Risque de Souscription Santé (€)',
-        'SCR Risque de Souscription Non-Vie (€)',
-        'SCR Risque Opérationnel (€)',
-        'Effet de Diversification (€)'
-    ]
-    df_scr = df_societes[scr_columns].set_index('Société').transpose()
-    df_scr.index.name = 'Métrique'
-    df_scr.to_excel(writer, sheet_name='SCR')
-    
-    # Ajouter une feuille "Actifs"
-    actifs_columns = [
-        'Société', 
-        'Total des actifs (€)',
-        'Obligations (€)',
-        'Actions (€)', 
-        'Fonds d\'investissement (€)', 
-        'Produits dérivés (€)', 
-        'Immobilier (€)', 
-        'Trésorerie et dépôts (€)', 
-        'Participations (€)', 
-        'Autres actifs (€)'
-    ]
-    df_actifs = df_societes[actifs_columns].set_index('Société').transpose()
-    df_actifs.index.name = 'Métrique'
-    df_actifs.to_excel(writer, sheet_name='Actifs')
-    
-    for sheet_name in writer.sheets:
-        worksheet = writer.sheets[sheet_name]
-        for idx, col in enumerate(worksheet.columns, 1):
-            max_length = 0
-            column = col[0].column_letter  
-            
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = (max_length + 2) * 1.2
-            worksheet.column_dimensions[column].width = adjusted_width
+    write_excel_report(df, output, answers=answers)
+    return output.getvalue()
+
+def download_excel(df, filename="analyse_sfcr.xlsx", answers=None, key=None):
+    """
+    Crée un fichier Excel contenant les données extraites et le rend téléchargeable.
+    Organise les données en plusieurs onglets thématiques, avec formats monétaires et de
+    pourcentage et largeur des colonnes ajustée. Exclut la ligne "Moyenne" du fichier Excel.
+    Les réponses aux questions posées à tous les PDFs sont ajoutées dans l'onglet "Questions".
     
-    writer.close()
-    output.seek(0)
+    Args:
+        df (DataFrame): Le DataFrame contenant les données à exporter
+        filename (str): Le nom du fichier Excel à générer
+        answers (DataFrame, optional): La grille des réponses (voir build_answer_grid)
+        key (str, optional): La clé du bouton, s'il figure plusieurs fois dans la page
+    """
     st.download_button(
         label="📥 Télécharger les données (Excel)",
-        data=output.getvalue(),
+        data=build_excel_report(df, answers=answers),
         file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key=key
     )
 
 def create_matplotlib_figure(data, title, x_label, y_label, color='steelblue', moyenne=None):
@@ -843,99 +613,492 @@ def create_scr_waterfall_chart(df, societe):
     plt.tight_layout()
     return fig
 
-def get_predefined_prompts():
+# Nombre maximal d'images de graphiques (PNG) conservées en cache
+CHART_CACHE_MAX_ENTRIES = 64
+
+def figure_to_png(fig):
     """
-    Retourne un dictionnaire de prompts prédéfinis pour les questions courantes.
+    Convertit une figure matplotlib en image PNG et libère la figure.
+    
+    Args:
+        fig (Figure): La figure à convertir
     
     Returns:
-        dict: Un dictionnaire de prompts prédéfinis
+        bytes: L'image PNG, ou None si aucune figure n'est fournie
     """
-    return {
-        "Analyse du SCR": "Analyse en détail la composition du SCR. Donne la répartition des différents modules de risques (marché, souscription, etc.) et leurs montants, attention à bien convertir les montants qui peuvent être en millions d'euros. Explique quels sont les risques principaux.",
-        "Analyse des fonds propres": "Analyse la composition des fonds propres. Détaille les différents tiers (Tier 1, 2, 3) et leur montant (attention à bien convertir si en millions d'euros). Compare avec l'année précédente si disponible et explique l'évolution.",
-        "Analyse du ratio de solvabilité": "Explique le ratio de solvabilité actuel et son évolution. Compare avec l'année précédente et explique les facteurs qui ont influencé ce ratio. Précise si des mesures particulières ont été prises pour maintenir ou améliorer ce ratio.",
-        "Analyse du MCR": "Donne les détails sur le MCR (Minimum Capital Requirement). Précise son montant (attention à bien convertir si en millions d'euros), explique son calcul et son évolution par rapport à l'année précédente.",
-        "Analyse des actifs": "Analyse les actifs détenus par l'entreprise. Détaille les différents types d'actifs et leur montant (attention à bien convertir si en millions d'euros). Compare avec l'année précédente si disponible et explique l'évolution."
-    }
+    if fig is None:
+        return None
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
 
-def process_pdf_unified(source_id, pdf_name):
+@st.cache_data(max_entries=CHART_CACHE_MAX_ENTRIES, show_spinner=False)
+def render_metric_chart(data, title, x_label, y_label, color='steelblue', moyenne=None):
     """
-    Traite un PDF en extrayant toutes les informations nécessaires via l'API ChatPDF.
-    Combine les informations de base, les fonds propres, les détails du SCR et les actifs.
+    Retourne l'image PNG du graphique à barres d'une métrique.
+    L'image est mise en cache selon le contenu de data et les paramètres du graphique :
+    seules les colonnes utilisées doivent donc être transmises.
     
     Args:
-        source_id (str): L'identifiant source du PDF
-        pdf_name (str): Le nom du fichier PDF
+        data (DataFrame): Les colonnes "Société" et y_label
+        title (str): Le titre du graphique
+        x_label (str): Le libellé de l'axe X
+        y_label (str): La colonne à représenter
+        color (str): La couleur des barres
+        moyenne (float, optional): La valeur moyenne à afficher comme ligne horizontale
     
     Returns:
-        DataFrame: Un DataFrame pandas contenant toutes les informations extraites
+        bytes: L'image PNG
+    """
+    with timed("Graphique", title) as timer:
+        png = figure_to_png(create_matplotlib_figure(data, title, x_label, y_label, color, moyenne=moyenne))
+        timer.size = len(png) if png else None
+    return png
+
+@st.cache_data(max_entries=CHART_CACHE_MAX_ENTRIES, show_spinner=False)
+def render_scr_charts(data, societe):
     """
-    base_response = chat_with_pdf(source_id, QUESTION_TEMPLATE_BASE, prompt=PROMPT_TEMPLATE_BASE)
-    df_base = parse_base_text(base_response)
+    Retourne les images PNG du camembert et de la cascade du SCR d'une société.
     
-    if df_base.empty or 'Société' not in df_base.columns:
-        df_base = pd.DataFrame({
-            'Société': [f"Société inconnue ({pdf_name})"],
-            'SCR (€)': [np.nan],
-            'MCR (€)': [np.nan],
-            'Ratio de solvabilité (%)': [np.nan]
-        })
+    Args:
+        data (DataFrame): La ligne de la société (colonnes du SCR et de ses composantes)
+        societe (str): Le nom de la société
     
-    societe = df_base['Société'].iloc[0] if not df_base.empty else f"Société inconnue ({pdf_name})"
+    Returns:
+        tuple: (camembert, cascade), chaque image valant None si les données sont insuffisantes
+    """
+    with timed("Graphique", societe) as timer:
+        charts = (
+            figure_to_png(create_scr_pie_chart(data, societe)),
+            figure_to_png(create_scr_waterfall_chart(data, societe)),
+        )
+        timer.size = sum(len(png) for png in charts if png)
+    return charts
+
+# Intervalle de rafraîchissement du suivi des extractions en arrière-plan, en secondes
+JOB_POLL_SECONDS = 1.0
+
+def collect_extraction_results(owner):
+    """
+    Ajoute aux résultats de la session les documents extraits en arrière-plan depuis le
+    dernier passage.
     
-    # Extraction du détail des fonds propres
-    fonds_propres_response = chat_with_pdf(source_id, QUESTION_TEMPLATE_FONDS_PROPRES, prompt=PROMPT_TEMPLATE_FONDS_PROPRES)
-    df_fonds_propres = parse_fonds_propres_text(fonds_propres_response)
-    df_fonds_propres['Société'] = societe
+    Args:
+        owner (str): L'identifiant des extractions de la session
     
-    # Extraction du détail du SCR
-    scr_detail_response = chat_with_pdf(source_id, QUESTION_TEMPLATE_SCR_DETAIL, prompt=PROMPT_TEMPLATE_SCR_DETAIL)
-    df_scr_detail = parse_scr_detail_text(scr_detail_response)
-    df_scr_detail['Société'] = societe
+    Returns:
+        bool: True si de nouveaux résultats ont été ajoutés
+    """
+    page_selections = st.session_state.setdefault("page_selections", {})
+    added = False
+    for job in get_job_manager().collect(owner):
+        result = job.result
+        if result is None:
+            continue
+        if result.pages is not None:
+            page_selections[job.name] = (result.pages, result.page_count)
+        if result.doc_hash:
+            st.session_state.setdefault("doc_hashes", {})[job.name] = result.doc_hash
+        if not result.data.empty:
+            st.session_state.results.upsert(job.name, result.data, year=result.year)
+            added = True
+    return added
+
+def render_job_statuses(jobs):
+    """
+    Affiche l'étape et la progression de chaque extraction.
     
-    # Extraction des actifs
-    actifs_response = chat_with_pdf(source_id, QUESTION_TEMPLATE_ACTIFS, prompt=PROMPT_TEMPLATE_ACTIFS)
-    df_actifs = parse_actifs_text(actifs_response)
-    df_actifs['Société'] = societe
+    Args:
+        jobs (list): Les JobStatus des extractions de la session
+    """
+    nb_steps = len(EXTRACTION_SECTIONS) + 1
+    df_jobs = pd.DataFrame([
+        {"Fichier": job.name, "Étape": job.stage, "Progression": job.steps_done / nb_steps, "Analyses": job.analyses}
+        for job in jobs
+    ])
+    if df_jobs["Analyses"].isna().all():
+        df_jobs = df_jobs.drop(columns="Analyses")
+    st.dataframe(
+        df_jobs,
+        hide_index=True,
+        column_config={"Progression": st.column_config.ProgressColumn(min_value=0, max_value=1)}
+    )
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_extraction_jobs(owner):
+    """
+    Suit les extractions en cours sans bloquer le reste de la page : seul ce fragment est
+    réexécuté à intervalle régulier. L'application complète n'est réexécutée que lorsqu'un
+    document est terminé, pour afficher ses résultats.
     
-    # Fusionner les résultats
-    try:
-        df = pd.merge(df_base, df_fonds_propres, on='Société', how='outer')
-        df = pd.merge(df, df_scr_detail, on='Société', how='outer')
-        df = pd.merge(df, df_actifs, on='Société', how='outer')
-    except KeyError as e:
-        st.warning(f"Erreur lors de la fusion des données pour {pdf_name}: {e}")
+    Args:
+        owner (str): L'identifiant des extractions de la session
+    """
+    manager = get_job_manager()
+    if collect_extraction_results(owner) or not manager.is_busy(owner):
+        st.rerun()
+    
+    jobs = manager.jobs(owner)
+    st.info(
+        f"Extraction en cours : {sum(job.state in (JOB_DONE, JOB_FAILED) for job in jobs)} document(s) "
+        f"traité(s) sur {len(jobs)}. Les rapports déjà extraits restent consultables."
+    )
+    render_job_statuses(jobs)
+
+def display_extraction_jobs(owner):
+    """
+    Affiche le suivi des extractions en arrière-plan de la session et récupère leurs résultats.
+    
+    Args:
+        owner (str): L'identifiant des extractions de la session
+    """
+    manager = get_job_manager()
+    collect_extraction_results(owner)
+    if manager.is_busy(owner):
+        poll_extraction_jobs(owner)
+        return
+    
+    jobs = manager.jobs(owner)
+    if jobs:
+        with st.expander("Suivi des extractions", expanded=any(job.state == JOB_FAILED for job in jobs)):
+            render_job_statuses(jobs)
+
+def display_cross_checks(results, names, uploaded_files, owner, max_parallel, options):
+    """
+    Affiche les contrôles de cohérence des documents et leur note de confiance, et permet de
+    réinterroger les seules sections en écart, sans passer par le cache des réponses. Les autres
+    sections sont relues dans le cache des réponses, sans nouvel appel à ChatPDF.
+    
+    Args:
+        results (ResultsStore): La table des résultats de la session
+        names (list): Les documents à contrôler
+        uploaded_files (list): Les fichiers obtenus via st.file_uploader
+        owner (str): L'identifiant des extractions de la session
+        max_parallel (int): Le nombre maximal de documents traités simultanément
+        options (dict): Les options d'extraction choisies dans la barre latérale
+    """
+    df = results.frame(names, with_keys=True)
+    df_checks = cross_check(df)
+    flagged = df_checks["Contrôles en échec"] != ""
+    
+    with st.expander("Contrôles de cohérence", expanded=bool(flagged.any())):
+        st.dataframe(
+            pd.concat([df[["Fichier", "Société"]].astype(str), df_checks], axis=1),
+            hide_index=True,
+            column_config={
+                "Confiance": st.column_config.ProgressColumn(min_value=0, max_value=1, format="%.2f"),
+                **{check.label: st.column_config.NumberColumn(format="%.1f %%") for check in CROSS_CHECKS},
+            }
+        )
+        st.caption("Écart relatif entre la valeur publiée et celle recalculée à partir de ses composantes.")
+        if not flagged.any():
+            return
         
-        # Créer un DataFrame combiné avec toutes les colonnes
-        df = pd.DataFrame({
-            'Société': [societe],
-            'SCR (€)': [df_base['SCR (€)'].iloc[0] if not df_base.empty else np.nan],
-            'MCR (€)': [df_base['MCR (€)'].iloc[0] if not df_base.empty else np.nan],
-            'Ratio de solvabilité (%)': [df_base['Ratio de solvabilité (%)'].iloc[0] if not df_base.empty else np.nan],
-            'Éléments éligibles (€)': [df_fonds_propres['Éléments éligibles (€)'].iloc[0] if not df_fonds_propres.empty else np.nan],
-            'Capital et primes (€)': [df_fonds_propres['Capital et primes (€)'].iloc[0] if not df_fonds_propres.empty else np.nan],
-            'Réserve de réconciliation (€)': [df_fonds_propres['Réserve de réconciliation (€)'].iloc[0] if not df_fonds_propres.empty else np.nan],
-            'Dettes subordonnées (€)': [df_fonds_propres['Dettes subordonnées (€)'].iloc[0] if not df_fonds_propres.empty else np.nan],
-            'Fonds excédentaires (€)': [df_fonds_propres['Fonds excédentaires (€)'].iloc[0] if not df_fonds_propres.empty else np.nan],
-            'SCR Risque de Marché (€)': [df_scr_detail['SCR Risque de Marché (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'SCR Risque de Contrepartie (€)': [df_scr_detail['SCR Risque de Contrepartie (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'SCR Risque de Souscription Vie (€)': [df_scr_detail['SCR Risque de Souscription Vie (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'SCR Risque de Souscription Santé (€)': [df_scr_detail['SCR Risque de Souscription Santé (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'SCR Risque de Souscription Non-Vie (€)': [df_scr_detail['SCR Risque de Souscription Non-Vie (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'SCR Risque Opérationnel (€)': [df_scr_detail['SCR Risque Opérationnel (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'Effet de Diversification (€)': [df_scr_detail['Effet de Diversification (€)'].iloc[0] if not df_scr_detail.empty else np.nan],
-            'Obligations (€)': [df_actifs['Obligations (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Actions (€)': [df_actifs['Actions (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Fonds d\'investissement (€)': [df_actifs['Fonds d\'investissement (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Produits dérivés (€)': [df_actifs['Produits dérivés (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Immobilier (€)': [df_actifs['Immobilier (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Trésorerie et dépôts (€)': [df_actifs['Trésorerie et dépôts (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Participations (€)': [df_actifs['Participations (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Autres actifs (€)': [df_actifs['Autres actifs (€)'].iloc[0] if not df_actifs.empty else np.nan],
-            'Total des actifs (€)': [df_actifs['Total des actifs (€)'].iloc[0] if not df_actifs.empty else np.nan]
-        })
+        names_flagged = set(df.loc[flagged, "Fichier"].astype(str))
+        pdf_files = [f for f in uploaded_files or [] if f.name in names_flagged]
+        if st.button(
+            f"Réinterroger les sections en écart ({len(pdf_files)} document(s))",
+            disabled=not pdf_files,
+            help="Seuls les PDFs chargés dans la session peuvent être réinterrogés"
+        ):
+            manager = get_job_manager()
+            for pdf_file in pdf_files:
+                manager.submit(
+                    owner,
+                    pdf_file,
+                    max_parallel=max_parallel,
+                    **dict(options, use_cache=True, use_history=False, resume=False, recheck=True, recheck_from_cache=False)
+                )
+            st.rerun()
+
+def display_cache_statistics():
+    """
+    Affiche dans la barre latérale les compteurs du cache des réponses ChatPDF.
+    """
+    stats = get_response_cache_stats()
+    st.sidebar.subheader("Cache des réponses")
+    col1, col2 = st.sidebar.columns(2)
+    col1.metric("Succès", stats["hits"])
+    col2.metric("Échecs", stats["misses"])
+    st.sidebar.caption(f"{stats['entries']} réponses en cache ({stats['size'] / 1024:,.0f} Ko)")
+
+def display_api_latency():
+    """
+    Affiche dans la barre latérale la durée des derniers appels à l'API ChatPDF et l'état
+    de l'ordonnanceur des requêtes.
+    """
+    records = get_chatpdf_client().latency_records()
+    if not records:
+        return
+    
+    df_latency = pd.DataFrame(records)
+    scheduler = get_chatpdf_client().scheduler.stats()
+    with st.sidebar.expander("Latence des appels ChatPDF"):
+        col1, col2 = st.columns(2)
+        col1.metric("Durée médiane (s)", f"{df_latency['Durée (s)'].median():.2f}")
+        col2.metric("Durée p95 (s)", f"{df_latency['Durée (s)'].quantile(0.95):.2f}")
+        st.caption(
+            f"Requêtes simultanées : {scheduler['in_flight']} sur {scheduler['limit']} autorisées ; "
+            f"en attente : {scheduler['waiting']} (dont {scheduler['waiting_interactive']} interactives) ; "
+            f"réponses 429 : {scheduler['throttled']}"
+        )
+        st.dataframe(df_latency.tail(20).iloc[::-1], hide_index=True)
+
+def display_performance():
+    """
+    Affiche dans la barre latérale la durée médiane et le p95 de chaque étape du traitement
+    (téléversement, questions, analyse des réponses, export, graphiques) depuis le démarrage
+    de l'application, et permet d'exporter les mesures au format JSON lines.
+    """
+    if not perf_recorder.enabled:
+        return
+    
+    df_stages = perf_recorder.stage_statistics()
+    if df_stages.empty:
+        return
+    
+    with st.sidebar.expander("Performance"):
+        st.dataframe(
+            df_stages,
+            hide_index=True,
+            column_config={
+                "p50 (s)": st.column_config.NumberColumn(format="%.3f"),
+                "p95 (s)": st.column_config.NumberColumn(format="%.3f"),
+                "Total (s)": st.column_config.NumberColumn(format="%.2f"),
+            }
+        )
+        st.download_button(
+            label="Exporter les mesures (JSON lines)",
+            data=perf_recorder.to_json_lines(),
+            file_name="mesures_sfcr.jsonl",
+            mime="application/x-ndjson"
+        )
+
+def display_pending_jobs(owner):
+    """
+    Liste dans la barre latérale les extractions interrompues (arrêt du serveur) ou incomplètes
+    (sections en échec) et permet de les reprendre : seules les sections manquantes sont
+    interrogées à nouveau.
     
-    return df
+    Args:
+        owner (str): L'identifiant des extractions de la session
+    """
+    manager = get_job_manager()
+    pending = manager.pending()
+    if not pending:
+        return
+    
+    with st.sidebar.expander(f"Extractions à reprendre ({len(pending)})"):
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "Fichier": job["file_name"],
+                    "Sections extraites": f"{len(job['done'])} / {len(EXTRACTION_SECTIONS)}",
+                    "Sections en échec": ", ".join(SECTION_LABELS[key] for key in job["failed"]) or "-",
+                }
+                for job in pending
+            ]),
+            hide_index=True
+        )
+        if st.button("Reprendre les sections manquantes"):
+            manager.resume_pending(owner)
+            st.rerun()
+
+def display_history_loader(results):
+    """
+    Permet de charger dans la session, depuis la barre latérale, des résultats enregistrés
+    dans l'historique des extractions, sans appel à ChatPDF.
+    
+    Args:
+        results (ResultsStore): La table des résultats de la session
+    """
+    history = list_history()
+    if history.empty:
+        return
+    
+    with st.sidebar.expander("Historique des extractions"):
+        years = sorted(history["year"].dropna().astype(int).unique().tolist(), reverse=True)
+        year = st.selectbox("Exercice", ["Tous"] + years, key="history_year")
+        if year != "Tous":
+            history = history[history["year"] == year]
+        companies = st.multiselect("Sociétés", sorted(history["company"].dropna().unique()), key="history_companies")
+        if companies:
+            history = history[history["company"].isin(companies)]
+        st.caption(f"{len(history)} document(s)")
+        
+        if st.button("Charger dans la session", disabled=history.empty):
+            documents = load_from_history(history["doc_hash"].tolist())
+            names = [file_name for _, file_name, _, _ in documents]
+            for doc_hash, file_name, doc_year, df in documents:
+                # Deux exercices d'un même rapport peuvent porter le même nom de fichier
+                label = file_name if names.count(file_name) == 1 else f"{file_name} [{doc_hash[:8]}]"
+                results.upsert(label, df, year=doc_year)
+                st.session_state.setdefault("doc_hashes", {})[label] = doc_hash
+            st.rerun()
+
+def display_page_selections():
+    """
+    Affiche dans la barre latérale les pages de chaque PDF envoyées à ChatPDF.
+    """
+    selections = st.session_state.get("page_selections", {})
+    if not selections:
+        return
+    
+    with st.sidebar.expander("Pages envoyées à ChatPDF"):
+        st.dataframe(
+            pd.DataFrame([
+                {"Fichier": name, "Pages": format_page_ranges(pages), "Envoyées": f"{len(pages)} / {page_count}"}
+                for name, (pages, page_count) in selections.items()
+            ]),
+            hide_index=True
+        )
+
+# Graphiques à barres de la vue comparative : libellé -> (titre, colonne, couleur)
+COMPARISON_BAR_CHARTS = {
+    "SCR": ("SCR par PDF", "SCR (€)", 'skyblue'),
+    "MCR": ("MCR par PDF", "MCR (€)", 'lightgreen'),
+    "Éléments éligibles": ("Éléments éligibles par PDF", "Éléments éligibles (€)", 'orange'),
+    "Réserve de réconciliation": ("Réserve de réconciliation par PDF", "Réserve de réconciliation (€)", 'purple'),
+    "Dettes subordonnées": ("Dettes subordonnées par PDF", "Dettes subordonnées (€)", 'lightgreen'),
+    "Fonds excédentaires": ("Fonds excédentaires par PDF", "Fonds excédentaires (€)", 'lightcoral'),
+    "Capital et primes": ("Capital et primes par PDF", "Capital et primes (€)", 'lightblue'),
+    "Ratio de solvabilité": ("Ratio de solvabilité par PDF", "Ratio de solvabilité (%)", 'plum'),
+}
+
+# Colonnes des tableaux de la vue comparative
+SUMMARY_COLUMNS = [
+    'Société', 'SCR (€)', 'MCR (€)', 'Éléments éligibles (€)', 
+    'Capital et primes (€)', 'Réserve de réconciliation (€)', 
+    'Dettes subordonnées (€)', 'Fonds excédentaires (€)', 
+    'Ratio de solvabilité (%)'
+]
+SCR_COMPONENT_COLUMNS = [
+    'Société', 'SCR (€)', 'SCR Risque de Marché (€)', 
+    'SCR Risque de Contrepartie (€)', 'SCR Risque de Souscription Vie (€)',
+    'SCR Risque de Souscription Santé (€)', 'SCR Risque de Souscription Non-Vie (€)',
+    'SCR Risque Opérationnel (€)', 'Effet de Diversification (€)'
+]
+ACTIFS_COLUMNS = [
+    'Société', 'Total des actifs (€)', 'Obligations (€)', 'Actions (€)', 
+    'Fonds d\'investissement (€)', 'Produits dérivés (€)', 'Immobilier (€)', 
+    'Trésorerie et dépôts (€)', 'Participations (€)', 'Autres actifs (€)'
+]
+
+def transpose_by_company(df, index_name):
+    """
+    Transpose un tableau pour afficher une colonne par société.
+    
+    Args:
+        df (DataFrame): Le tableau, avec une colonne "Société"
+        index_name (str): Le nom de la colonne des métriques
+    
+    Returns:
+        DataFrame: Le tableau transposé
+    """
+    transposed = df.set_index('Société').transpose()
+    transposed.index.name = index_name
+    return transposed.reset_index()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_comparison_views(selection_key, _results):
+    """
+    Construit les tableaux de la vue comparative. Le résultat est mis en cache selon
+    selection_key : il n'est recalculé que si la sélection ou le contenu d'un PDF change.
+    
+    Args:
+        selection_key (tuple): Les couples (nom du PDF, empreinte du contenu) sélectionnés
+        _results (ResultsStore): La table des résultats (non hachée)
+    
+    Returns:
+        dict: Les tableaux "combined" (une ligne par PDF), "moyenne" (moyennes par colonne),
+              "display" (avec la ligne Moyenne), "summary", "scr_components" et "actifs"
+              (transposés pour l'affichage)
+    """
+    files = [name for name, _ in selection_key]
+    combined_df = _results.frame(files)
+    moyenne = _results.aggregates(files).loc["Moyenne"].round(2)
+    display_df = pd.concat([combined_df, moyenne.to_frame().T.assign(Société='Moyenne')], ignore_index=True)
+    
+    return {
+        "combined": combined_df,
+        "moyenne": moyenne,
+        "display": display_df,
+        "summary": transpose_by_company(display_df[SUMMARY_COLUMNS], 'Métrique'),
+        "scr_components": transpose_by_company(combined_df[SCR_COMPONENT_COLUMNS], 'Composante SCR'),
+        "actifs": transpose_by_company(combined_df[ACTIFS_COLUMNS], 'Composante Actifs'),
+    }
+
+@st.fragment
+def display_comparison_charts(views):
+    """
+    Affiche le graphique sélectionné de la vue comparative. Changer de graphique ou de société
+    ne réexécute que cette partie de la page.
+    
+    Args:
+        views (dict): Les tableaux construits par build_comparison_views
+    """
+    combined_df = views["combined"]
+    moyenne = views["moyenne"]
+    
+    # Seul le graphique sélectionné est construit, à partir de son cache s'il est inchangé
+    metric_view = st.radio(
+        "Graphique",
+        list(COMPARISON_BAR_CHARTS) + ["Détail du SCR", "Actifs"],
+        horizontal=True,
+        key="metric_view"
+    )
+
+    if metric_view in COMPARISON_BAR_CHARTS:
+        title, column, color = COMPARISON_BAR_CHARTS[metric_view]
+        st.image(render_metric_chart(
+            combined_df[['Société', column]],
+            title,
+            "Société",
+            column,
+            color,
+            moyenne=moyenne[column]
+        ))
+        
+    elif metric_view == "Détail du SCR":
+        st.subheader("Détail du SCR par société")
+        selected_company = st.selectbox(
+            "Sélectionnez une société pour voir la répartition de son SCR",
+            combined_df['Société'].tolist()
+        )
+        pie_chart, waterfall_chart = render_scr_charts(
+            combined_df.loc[combined_df['Société'] == selected_company, SCR_COMPONENT_COLUMNS],
+            selected_company
+        )
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if pie_chart:
+                st.image(pie_chart)
+            else:
+                st.info("Données insuffisantes pour créer le graphique en camembert.")
+        
+        with col2:
+            if waterfall_chart:
+                st.image(waterfall_chart)
+            else:
+                st.info("Données insuffisantes pour créer le graphique en cascade.")
+        
+        st.subheader("Composantes du SCR par société")
+        st.dataframe(views["scr_components"])
+
+    else:  # Actifs
+        st.subheader("Actifs par société")
+        st.dataframe(views["actifs"])
+        st.image(render_metric_chart(
+            combined_df[['Société', 'Total des actifs (€)']],
+            "Total des actifs par société",
+            "Société", 
+            "Total des actifs (€)",
+            'darkgreen',
+            moyenne=moyenne['Total des actifs (€)']
+        ))
 
 def main():
     """
@@ -952,70 +1115,136 @@ def main():
     - Possibilité de télécharger les données et graphiques au format XLSX
     """)
 
+    owner = st.session_state.setdefault("job_owner", uuid.uuid4().hex)
     if st.sidebar.button("Recharger les données PDFs"):
-        st.session_state.pdf_data = {}
+        st.session_state.results = ResultsStore()
+        st.session_state.answer_grid = {}
+        get_job_manager().forget(owner)
         st.success("Les données PDFs ont été réinitialisées.")
     
     st.sidebar.subheader("Chargement de PDFs")
     uploaded_files = st.sidebar.file_uploader("Télécharger vos fichiers .pdf", type="pdf", accept_multiple_files=True)
+    max_parallel = st.sidebar.number_input(
+        "Nombre de PDFs traités en parallèle",
+        min_value=1,
+        max_value=16,
+        value=MAX_PARALLEL_PDFS
+    )
+    extraction_mode = st.sidebar.radio(
+        "Mode d'extraction",
+        (EXTRACTION_MODE_SECTIONS, EXTRACTION_MODE_COMBINED),
+        format_func=lambda mode: {
+            EXTRACTION_MODE_SECTIONS: "Par section (4 requêtes)",
+            EXTRACTION_MODE_COMBINED: "Combiné (1 requête, complétée si besoin)",
+        }[mode]
+    )
+    use_local = st.sidebar.checkbox(
+        "Extraction locale des QRT",
+        value=PdfReader is not None,
+        disabled=PdfReader is None,
+        help="Lit hors ligne les tableaux S.02.01, S.23.01 et S.25.01 du PDF ; ChatPDF n'est interrogé "
+             "que pour les sections incomplètes (nécessite pypdf)"
+    )
+    select_pages = st.sidebar.checkbox(
+        "N'envoyer que les pages utiles",
+        value=PdfReader is not None,
+        disabled=PdfReader is None,
+        help=f"Pour les documents de plus de {PAGE_SELECTION_MIN_PAGES} pages, n'envoie à ChatPDF que la "
+             f"première page, la section Gestion du capital et les QRT (au plus {PAGE_SELECTION_MAX_PAGES} "
+             "pages, nécessite pypdf)"
+    )
+    fill_gaps = st.sidebar.checkbox(
+        "Compléter les champs manquants",
+        value=True,
+        help="Après l'extraction, redemande à ChatPDF uniquement les métriques restées vides, "
+             "avec leurs autres intitulés et leur ligne dans les QRT"
+    )
+    recheck = st.sidebar.checkbox(
+        "Vérifier la cohérence des montants",
+        value=True,
+        help="Contrôle que les modules du SCR, le ratio de solvabilité et les composantes des actifs "
+             "concordent, et réinterroge uniquement les sections en écart"
+    )
+    prepare_analyses = st.sidebar.checkbox(
+        "Préparer les analyses prédéfinies",
+        value=False,
+        help="Après l'extraction de chaque rapport, pose en arrière-plan les questions des boutons "
+             "d'analyse de l'onglet Question, dont les réponses s'affichent ensuite immédiatement"
+    )
+    use_cache = st.sidebar.checkbox(
+        "Utiliser le cache des réponses",
+        value=True,
+        help="Décocher pour interroger à nouveau ChatPDF au lieu de réutiliser les réponses déjà obtenues"
+    )
 
-    if "pdf_data" not in st.session_state:
-        st.session_state.pdf_data = {}
+    if "results" not in st.session_state:
+        st.session_state.results = ResultsStore()
+    results = st.session_state.results
+    display_history_loader(results)
     
     prompt = PROMPT_TEMPLATE_BASE
     question = QUESTION_TEMPLATE_BASE
 
+    extraction_options = {
+        "use_cache": use_cache,
+        "mode": extraction_mode,
+        "use_local": use_local,
+        "select_pages": select_pages,
+        "use_history": use_cache,
+        "resume": use_cache,
+        "fill_gaps": fill_gaps,
+        "recheck": recheck,
+    }
     if uploaded_files:
-        progress_placeholder = st.empty()
+        # Les extractions tournent en arrière-plan : l'interface reste utilisable pendant le traitement
+        manager = get_job_manager()
+        submitted = {job.name for job in manager.jobs(owner)}
         for pdf_file in uploaded_files:
-            if pdf_file.name not in st.session_state.pdf_data:
-                progress_placeholder.info(f"Traitement du fichier : {pdf_file.name}")
-                with st.spinner(f"Traitement en cours..."):
-                    source_id = add_pdf_from_file(pdf_file)
-                    if source_id:
-                        df_pdf = process_pdf_unified(source_id, pdf_file.name)
-                        
-                        if not df_pdf.empty:
-                            st.session_state.pdf_data[pdf_file.name] = df_pdf
-                            progress_placeholder.empty()
-                        else:
-                            progress_placeholder.error(f"Aucune donnée extraite pour {pdf_file.name}")
-                    else:
-                        progress_placeholder.error(f"Erreur lors de l'obtention du source_id pour {pdf_file.name}")
-        
-        if any(pdf_file.name not in st.session_state.pdf_data for pdf_file in uploaded_files):
-            st.success("Traitement des fichiers terminé !")
+            if pdf_file.name not in results and pdf_file.name not in submitted:
+                manager.submit(
+                    owner,
+                    pdf_file,
+                    max_parallel=int(max_parallel),
+                    prepare_analyses=prepare_analyses,
+                    **extraction_options
+                )
+    display_extraction_jobs(owner)
+    display_pending_jobs(owner)
 
-    if st.session_state.pdf_data:
-        nb_pdfs = len(st.session_state.pdf_data)
+    if len(results):
+        nb_pdfs = len(results)
         main_tabs = st.tabs(["Question", "Analyse"])
         
         with main_tabs[0]:
             st.subheader("Question sur le document")
             selected_pdf = st.selectbox(
                 "Sélectionner un PDF",
-                list(st.session_state.pdf_data.keys())
+                results.files()
             )
 
             if 'user_question' not in st.session_state:
                 st.session_state.user_question = ""
 
+            doc_hash = document_hash(selected_pdf, uploaded_files)
+            prepared = get_prepared_analyses(doc_hash) if doc_hash else {}
             col1, col2 = st.columns(2)
-            predefined_prompts = get_predefined_prompts()
             
             with col1:
                 if st.button("Analyse du SCR"):
-                    st.session_state.user_question = predefined_prompts["Analyse du SCR"]
+                    show_prepared_analysis("Analyse du SCR", prepared)
                 if st.button("Analyse des fonds propres"):
-                    st.session_state.user_question = predefined_prompts["Analyse des fonds propres"]
+                    show_prepared_analysis("Analyse des fonds propres", prepared)
                 if st.button("Analyse des actifs"):
-                    st.session_state.user_question = predefined_prompts["Analyse des actifs"]
+                    show_prepared_analysis("Analyse des actifs", prepared)
             
             with col2:
                 if st.button("Analyse du ratio de solvabilité"):
-                    st.session_state.user_question = predefined_prompts["Analyse du ratio de solvabilité"]
+                    show_prepared_analysis("Analyse du ratio de solvabilité", prepared)
                 if st.button("Analyse du MCR"):
-                    st.session_state.user_question = predefined_prompts["Analyse du MCR"]
+                    show_prepared_analysis("Analyse du MCR", prepared)
+            nb_prepared = sum(prompt in prepared for prompt in PREDEFINED_ANALYSES.values())
+            if nb_prepared:
+                st.caption(f"Analyses prédéfinies préparées pour ce document : {nb_prepared} / {len(PREDEFINED_ANALYSES)}")
 
             user_question = st.text_area(
                 "Poser votre question sur le PDF",
@@ -1024,238 +1253,70 @@ def main():
                 key="question_input"
             )
             
-            if st.button("Valider la question"):
-                if user_question:
-                    with st.spinner("Traitement de votre question..."):
-                        pdf_file = [f for f in uploaded_files if f.name == selected_pdf][0]
-                        source_id = add_pdf_from_file(pdf_file)
-                        
-                        if source_id:
-                            response = chat_with_pdf(source_id, user_question)
-                            if response:
-                                st.write("Réponse :")
-                                st.write(response)
-                            else:
-                                st.error("Désolé, je n'ai pas pu obtenir de réponse.")
-                        else:
-                            st.error("Erreur lors de l'accès au PDF.")
+            ask_all = st.checkbox(
+                "Poser la question à tous les PDFs",
+                disabled=nb_pdfs < 2,
+                help="Envoie la question à chaque PDF chargé en même temps et présente les réponses "
+                     "dans une grille, une ligne par document"
+            )
+            ask = st.button("Valider la question")
+            last_answer = st.session_state.get("last_answer")
+            # Une analyse préparée peut être reposée à ChatPDF, sans passer par le cache des réponses
+            refresh = bool(last_answer and "prepared_at" in last_answer) and st.button("Régénérer l'analyse")
+            if ask and ask_all:
+                pdf_files = [f for f in uploaded_files or [] if f.name in results]
+                if not user_question:
+                    st.warning("Veuillez entrer une question.")
+                elif not pdf_files:
+                    st.warning("Chargez à nouveau les PDFs pour leur poser une question.")
                 else:
+                    if len(pdf_files) < nb_pdfs:
+                        st.caption(f"{nb_pdfs - len(pdf_files)} document(s) chargé(s) depuis l'historique ne sont pas interrogés.")
+                    answer_all_documents(pdf_files, user_question, results, use_cache=use_cache)
+            elif ask or refresh:
+                question_asked = user_question if ask else last_answer["question"]
+                pdf_file = next((f for f in uploaded_files or [] if f.name == selected_pdf), None)
+                if not question_asked:
                     st.warning("Veuillez entrer une question.")
+                elif pdf_file is None:
+                    st.warning("Chargez à nouveau ce PDF pour lui poser une question.")
+                else:
+                    stream_answer(pdf_file, question_asked, use_cache=use_cache and not refresh, doc_hash=doc_hash)
+            elif not ask_all:
+                display_last_answer()
+            display_answer_grid(results)
 
         with main_tabs[1]:
             if nb_pdfs == 1:
-                pdf_name = list(st.session_state.pdf_data.keys())[0]
-                df_selected = st.session_state.pdf_data[pdf_name]
+                pdf_name = results.files()[0]
+                df_selected = results.frame([pdf_name])
                 st.subheader(f"Données extraites pour : {pdf_name}")
                 display_data(df_selected, show_full_analysis=False)
+                display_cross_checks(results, [pdf_name], uploaded_files, owner, int(max_parallel), extraction_options)
             else:
                 selected_pdfs = st.sidebar.multiselect(
                     "Sélectionnez les PDFs à comparer",
-                    list(st.session_state.pdf_data.keys()),
-                    default=list(st.session_state.pdf_data.keys())
+                    results.files(),
+                    default=results.files()
                 )
                 
                 if selected_pdfs:
-                    dfs_to_combine = []
-                    for name in selected_pdfs:
-                        df = st.session_state.pdf_data[name].copy()
-                        dfs_to_combine.append(df)
-                    
-                    combined_df = pd.concat(dfs_to_combine, ignore_index=True)
-                    
-                    moyenne = pd.DataFrame({
-                        'Société': ['Moyenne'],
-                        'SCR (€)': [round(combined_df['SCR (€)'].mean(), 2)],
-                        'MCR (€)': [round(combined_df['MCR (€)'].mean(), 2)],
-                        'Éléments éligibles (€)': [round(combined_df['Éléments éligibles (€)'].mean(), 2)],
-                        'Réserve de réconciliation (€)': [round(combined_df['Réserve de réconciliation (€)'].mean(), 2)],
-                        'Dettes subordonnées (€)': [round(combined_df['Dettes subordonnées (€)'].mean(), 2)],
-                        'Fonds excédentaires (€)': [round(combined_df['Fonds excédentaires (€)'].mean(), 2)],
-                        'Capital et primes (€)': [round(combined_df['Capital et primes (€)'].mean(), 2)],
-                        'Ratio de solvabilité (%)': [round(combined_df['Ratio de solvabilité (%)'].mean(), 2)],
-                        'SCR Risque de Marché (€)': [round(combined_df['SCR Risque de Marché (€)'].mean(), 2)],
-                        'SCR Risque de Contrepartie (€)': [round(combined_df['SCR Risque de Contrepartie (€)'].mean(), 2)],
-                        'SCR Risque de Souscription Vie (€)': [round(combined_df['SCR Risque de Souscription Vie (€)'].mean(), 2)],
-                        'SCR Risque de Souscription Santé (€)': [round(combined_df['SCR Risque de Souscription Santé (€)'].mean(), 2)],
-                        'SCR Risque de Souscription Non-Vie (€)': [round(combined_df['SCR Risque de Souscription Non-Vie (€)'].mean(), 2)],
-                        'SCR Risque Opérationnel (€)': [round(combined_df['SCR Risque Opérationnel (€)'].mean(), 2)],
-                        'Effet de Diversification (€)': [round(combined_df['Effet de Diversification (€)'].mean(), 2)],
-                        'Obligations (€)': [round(combined_df['Obligations (€)'].mean(), 2)],
-                        'Actions (€)': [round(combined_df['Actions (€)'].mean(), 2)],
-                        'Fonds d\'investissement (€)': [round(combined_df['Fonds d\'investissement (€)'].mean(), 2)],
-                        'Produits dérivés (€)': [round(combined_df['Produits dérivés (€)'].mean(), 2)],
-                        'Immobilier (€)': [round(combined_df['Immobilier (€)'].mean(), 2)],
-                        'Trésorerie et dépôts (€)': [round(combined_df['Trésorerie et dépôts (€)'].mean(), 2)],
-                        'Participations (€)': [round(combined_df['Participations (€)'].mean(), 2)],
-                        'Autres actifs (€)': [round(combined_df['Autres actifs (€)'].mean(), 2)],
-                        'Total des actifs (€)': [round(combined_df['Total des actifs (€)'].mean(), 2)]
-                    })
-
-                    display_df = pd.concat([combined_df, moyenne], ignore_index=True)
+                    selection_key = tuple((name, results.row_hash(name)) for name in selected_pdfs)
+                    views = build_comparison_views(selection_key, results)
                     
-                    download_excel(display_df, filename="analyse_sfcr.xlsx")
+                    answers = build_answer_grid(st.session_state.get("answer_grid", {}), results)
+                    download_excel(views["display"], filename="analyse_sfcr.xlsx", answers=answers)
                     st.subheader("Comparaison entre PDFs")
-                    
-                    columns_to_display = [
-                        'Société', 'SCR (€)', 'MCR (€)', 'Éléments éligibles (€)', 
-                        'Capital et primes (€)', 'Réserve de réconciliation (€)', 
-                        'Dettes subordonnées (€)', 'Fonds excédentaires (€)', 
-                        'Ratio de solvabilité (%)'
-                    ]
-                    
-                    display_df_transposed = display_df[columns_to_display].set_index('Société').transpose()
-                    display_df_transposed.index.name = 'Métrique'
-                    display_df_transposed = display_df_transposed.reset_index()
-                    st.dataframe(display_df_transposed)
-
-                    metric_tabs = st.tabs([
-                        "SCR", "MCR", "Éléments éligibles", "Réserve de réconciliation", 
-                        "Dettes subordonnées", "Fonds excédentaires", "Capital et primes", 
-                        "Ratio de solvabilité", "Détail du SCR", "Actifs"
-                    ])
-
-                    with metric_tabs[0]:  # SCR
-                        fig_scr = create_matplotlib_figure(
-                            combined_df,
-                            "SCR par PDF", 
-                            "Société", 
-                            "SCR (€)", 
-                            'skyblue',
-                            moyenne=moyenne['SCR (€)'].values[0]
-                        )
-                        st.pyplot(fig_scr)
-
-                    with metric_tabs[1]:  # MCR
-                        fig_mcr = create_matplotlib_figure(
-                            combined_df,
-                            "MCR par PDF", 
-                            "Société", 
-                            "MCR (€)", 
-                            'lightgreen',
-                            moyenne=moyenne['MCR (€)'].values[0]
-                        )
-                        st.pyplot(fig_mcr)
-
-                    with metric_tabs[2]:  # Éléments éligibles
-                        fig_eof = create_matplotlib_figure(
-                            combined_df,
-                            "Éléments éligibles par PDF",
-                            "Société", 
-                            "Éléments éligibles (€)",
-                            'orange',
-                            moyenne=moyenne['Éléments éligibles (€)'].values[0]
-                        )
-                        st.pyplot(fig_eof)
-
-                    with metric_tabs[3]:  # Réserve de réconciliation
-                        fig_reserve = create_matplotlib_figure(
-                            combined_df,
-                            "Réserve de réconciliation par PDF",
-                            "Société", 
-                            "Réserve de réconciliation (€)",
-                            'purple',
-                            moyenne=moyenne['Réserve de réconciliation (€)'].values[0]
-                        )
-                        st.pyplot(fig_reserve)
-
-                    with metric_tabs[4]:  # Dettes subordonnées
-                        fig_dettes = create_matplotlib_figure(
-                            combined_df,
-                            "Dettes subordonnées par PDF",
-                            "Société", 
-                            "Dettes subordonnées (€)",
-                            'lightgreen',
-                            moyenne=moyenne['Dettes subordonnées (€)'].values[0]
-                        )
-                        st.pyplot(fig_dettes)
-
-                    with metric_tabs[5]:  # Fonds excédentaires
-                        fig_fonds = create_matplotlib_figure(
-                            combined_df,
-                            "Fonds excédentaires par PDF",
-                            "Société", 
-                            "Fonds excédentaires (€)",
-                            'lightcoral',
-                            moyenne=moyenne['Fonds excédentaires (€)'].values[0]
-                        )
-                        st.pyplot(fig_fonds)
-
-                    with metric_tabs[6]:  # Capital et primes
-                        fig_capital = create_matplotlib_figure(
-                            combined_df,
-                            "Capital et primes par PDF",
-                            "Société", 
-                            "Capital et primes (€)",
-                            'lightblue',
-                            moyenne=moyenne['Capital et primes (€)'].values[0]
-                        )
-                        st.pyplot(fig_capital)
-
-                    with metric_tabs[7]:  # Ratio de solvabilité
-                        fig_ratio = create_matplotlib_figure(
-                            combined_df,
-                            "Ratio de solvabilité par PDF", 
-                            "Société", 
-                            "Ratio de solvabilité (%)", 
-                            'plum',
-                            moyenne=moyenne['Ratio de solvabilité (%)'].values[0]
-                        )
-                        st.pyplot(fig_ratio)
-                        
-                    with metric_tabs[8]:  # Détail du SCR
-                        st.subheader("Détail du SCR par société")
-                        selected_company = st.selectbox(
-                            "Sélectionnez une société pour voir la répartition de son SCR",
-                            combined_df['Société'].tolist()
-                        )
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            pie_chart = create_scr_pie_chart(combined_df, selected_company)
-                            if pie_chart:
-                                st.pyplot(pie_chart)
-                            else:
-                                st.info("Données insuffisantes pour créer le graphique en camembert.")
-                        
-                        with col2:
-                            waterfall_chart = create_scr_waterfall_chart(combined_df, selected_company)
-                            if waterfall_chart:
-                                st.pyplot(waterfall_chart)
-                            else:
-                                st.info("Données insuffisantes pour créer le graphique en cascade.")
-                        
-                        st.subheader("Composantes du SCR par société")
-                        scr_components_df = combined_df[['Société', 'SCR (€)', 'SCR Risque de Marché (€)', 
-                                                        'SCR Risque de Contrepartie (€)', 'SCR Risque de Souscription Vie (€)',
-                                                        'SCR Risque de Souscription Santé (€)', 'SCR Risque de Souscription Non-Vie (€)',
-                                                        'SCR Risque Opérationnel (€)', 'Effet de Diversification (€)']]
-                        scr_components_transposed = scr_components_df.set_index('Société').transpose()
-                        scr_components_transposed.index.name = 'Composante SCR'
-                        scr_components_transposed = scr_components_transposed.reset_index()
-                        st.dataframe(scr_components_transposed)
-
-                    with metric_tabs[9]:  # Actifs
-                        st.subheader("Actifs par société")
-                        actifs_df = combined_df[['Société', 'Total des actifs (€)', 'Obligations (€)', 'Actions (€)', 
-                                                 'Fonds d\'investissement (€)', 'Produits dérivés (€)', 'Immobilier (€)', 
-                                                 'Trésorerie et dépôts (€)', 'Participations (€)', 'Autres actifs (€)']]
-                        actifs_df_transposed = actifs_df.set_index('Société').transpose()
-                        actifs_df_transposed.index.name = 'Composante Actifs'
-                        actifs_df_transposed = actifs_df_transposed.reset_index()
-                        st.dataframe(actifs_df_transposed)
-
-                        fig_total_actifs = create_matplotlib_figure(
-                            combined_df,
-                            "Total des actifs par société",
-                            "Société", 
-                            "Total des actifs (€)",
-                            'darkgreen',
-                            moyenne=moyenne['Total des actifs (€)'].values[0]
-                        )
-                        st.pyplot(fig_total_actifs)
+                    st.dataframe(views["summary"])
+                    display_comparison_charts(views)
+                    display_cross_checks(results, selected_pdfs, uploaded_files, owner, int(max_parallel), extraction_options)
                 else:
                     st.info("Veuillez sélectionner au moins un PDF pour la comparaison.")
 
+    display_cache_statistics()
+    display_api_latency()
+    display_performance()
+    display_page_selections()
+
 if __name__ == "__main__":
     main()
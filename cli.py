@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Extraction des rapports SFCR en ligne de commande, sans Streamlit.
+
+Exemples :
+    python cli.py rapports/ -o analyse_sfcr.xlsx
+    python cli.py "rapports/2023/*.pdf" -o analyse_sfcr.csv --workers 8
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from sfcr_core import (
+    EXTRACTION_MODE_COMBINED,
+    EXTRACTION_MODE_SECTIONS,
+    MAX_PARALLEL_PDFS,
+    MAX_SECTION_WORKERS,
+    SECTION_LABELS,
+    ResultsStore,
+    cross_check,
+    get_chatpdf_client,
+    get_response_cache_stats,
+    perf_recorder,
+    prepare_predefined_analyses,
+    process_document,
+    write_excel_report,
+)
+
+logger = logging.getLogger("sfcr_cli")
+
+# Formats de sortie pris en charge, par extension de fichier
+OUTPUT_FORMATS = (".xlsx", ".csv", ".parquet")
+
+def collect_pdf_paths(inputs):
+    """
+    Liste les fichiers PDF désignés par des dossiers, des fichiers ou des motifs glob.
+    
+    Args:
+        inputs (list): Les chemins ou motifs fournis en ligne de commande
+    
+    Returns:
+        list: Les chemins des fichiers PDF, triés et sans doublon
+    """
+    paths = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            candidates = glob.glob(os.path.join(entry, "*.pdf")) + glob.glob(os.path.join(entry, "*.PDF"))
+        else:
+            candidates = glob.glob(entry, recursive=True) or [entry]
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                paths.add(os.path.abspath(path))
+            else:
+                logger.warning("Ignoré (fichier PDF introuvable) : %s", path)
+    return sorted(paths)
+
+def process_path(path, args):
+    """
+    Ouvre un fichier PDF et lance son extraction complète, puis prépare au besoin ses
+    analyses prédéfinies.
+    
+    Args:
+        path (str): Le chemin du fichier PDF
+        args (argparse.Namespace): Les options de la ligne de commande
+    
+    Returns:
+        DocumentResult: Le résultat du traitement
+    """
+    with open(path, "rb") as pdf_file:
+        result = process_document(
+            pdf_file,
+            max_workers=args.section_workers,
+            use_cache=not args.no_cache,
+            mode=args.mode,
+            use_local=not args.no_local,
+            select_pages=not args.all_pages,
+            use_history=not args.no_cache,
+            resume=not args.no_cache,
+            fill_gaps=not args.no_gap_fill,
+            recheck=not args.no_recheck
+        )
+        if args.prepare_analyses and not result.data.empty:
+            prepare_predefined_analyses(pdf_file, use_cache=not args.no_cache)
+    return result
+
+def write_results(df, output):
+    """
+    Enregistre le tableau des résultats au format déduit de l'extension du fichier.
+    Le classeur Excel est le même que celui exporté depuis l'interface (voir write_excel_report).
+    
+    Args:
+        df (DataFrame): Le tableau des résultats, une ligne par document
+        output (str): Le chemin du fichier de sortie (.xlsx, .csv ou .parquet)
+    """
+    extension = os.path.splitext(output)[1].lower()
+    if extension == ".xlsx":
+        write_excel_report(df, output)
+    elif extension == ".csv":
+        # utf-8-sig : les accents s'affichent correctement à l'ouverture dans Excel
+        df.to_csv(output, index=False, encoding="utf-8-sig")
+    else:
+        df.to_parquet(output, index=False)
+
+def print_timing_summary(timings, wall_time):
+    """
+    Affiche la durée de chaque étape par document, puis un récapitulatif global.
+    
+    Args:
+        timings (list): Une liste de dictionnaires (fichier, statut, durée de chaque étape)
+        wall_time (float): La durée totale du traitement, en secondes
+    """
+    df_timings = pd.DataFrame(timings)
+    print()
+    print(df_timings.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    
+    stats = get_response_cache_stats()
+    nb_calls = len(get_chatpdf_client().latency_records())
+    print()
+    print(f"{len(timings)} document(s) en {wall_time:.1f} s "
+          f"({len(timings) / wall_time * 60 if wall_time else 0:.1f} documents/min)")
+    print(f"Appels ChatPDF : {nb_calls} ; cache des réponses : {stats['hits']} succès, {stats['misses']} échecs")
+    
+    df_stages = perf_recorder.stage_statistics()
+    if not df_stages.empty:
+        print()
+        print(df_stages.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+def print_cross_checks(df):
+    """
+    Affiche les documents dont les montants ne respectent pas les contrôles de cohérence,
+    avec leur note de confiance.
+    
+    Args:
+        df (DataFrame): Le tableau des résultats, avec la colonne "Fichier"
+    """
+    df_checks = cross_check(df)
+    flagged = df_checks["Contrôles en échec"] != ""
+    if not flagged.any():
+        return
+    print()
+    print(f"Contrôles de cohérence en écart pour {int(flagged.sum())} document(s) :")
+    print(
+        pd.concat([df[["Fichier"]].astype(str), df_checks[["Confiance", "Contrôles en échec"]]], axis=1)[flagged]
+        .to_string(index=False, float_format=lambda value: f"{value:.2f}")
+    )
+
+def build_parser():
+    """
+    Construit l'analyseur des arguments de la ligne de commande.
+    
+    Returns:
+        argparse.ArgumentParser: L'analyseur
+    """
+    parser = argparse.ArgumentParser(
+        description="Extrait les métriques de solvabilité de rapports SFCR au format PDF via ChatPDF."
+    )
+    parser.add_argument("inputs", nargs="+", help="Dossiers, fichiers PDF ou motifs glob (par exemple \"rapports/*.pdf\")")
+    parser.add_argument("-o", "--output", default="analyse_sfcr.xlsx",
+                        help="Fichier de sortie : .xlsx, .csv ou .parquet (défaut : analyse_sfcr.xlsx)")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_PARALLEL_PDFS,
+                        help=f"Nombre de PDFs traités en parallèle (défaut : {MAX_PARALLEL_PDFS})")
+    parser.add_argument("--section-workers", type=int, default=MAX_SECTION_WORKERS,
+                        help=f"Nombre de requêtes simultanées par PDF (défaut : {MAX_SECTION_WORKERS})")
+    parser.add_argument("--mode", choices=(EXTRACTION_MODE_SECTIONS, EXTRACTION_MODE_COMBINED),
+                        default=EXTRACTION_MODE_SECTIONS, help="Mode d'extraction (défaut : sections)")
+    parser.add_argument("--no-local", action="store_true", help="Désactive la lecture locale des QRT")
+    parser.add_argument("--all-pages", action="store_true", help="Envoie le document complet à ChatPDF")
+    parser.add_argument("--no-gap-fill", action="store_true",
+                        help="Ne redemande pas à ChatPDF les métriques restées vides après l'extraction")
+    parser.add_argument("--no-recheck", action="store_true",
+                        help="Ne réinterroge pas les sections dont les montants ne respectent pas les contrôles de cohérence")
+    parser.add_argument("--prepare-analyses", action="store_true",
+                        help="Pose aussi les questions d'analyse prédéfinies, dont les réponses s'affichent "
+                             "ensuite immédiatement dans l'application")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore le cache des réponses, l'historique des extractions et les points de reprise")
+    parser.add_argument("--metrics-file", help="Fichier JSON lines où ajouter la mesure de chaque étape")
+    parser.add_argument("--prometheus-file",
+                        help="Fichier texte Prometheus (collecteur textfile) écrit avec les durées des étapes")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Affiche le détail du traitement")
+    return parser
+
+def main(argv=None):
+    """
+    Point d'entrée de la ligne de commande.
+    
+    Args:
+        argv (list, optional): Les arguments (sys.argv par défaut)
+    
+    Returns:
+        int: Le code de sortie (0 si tous les documents ont été extraits, 1 sinon, 2 si aucun PDF)
+    """
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s : %(message)s"
+    )
+    
+    if os.path.splitext(args.output)[1].lower() not in OUTPUT_FORMATS:
+        logger.error("Format de sortie non pris en charge : %s (attendu : %s)", args.output, ", ".join(OUTPUT_FORMATS))
+        return 2
+    
+    if args.metrics_file:
+        perf_recorder.set_metrics_file(args.metrics_file)
+    if args.prometheus_file:
+        perf_recorder.prometheus_file = args.prometheus_file
+    
+    paths = collect_pdf_paths(args.inputs)
+    if not paths:
+        logger.error("Aucun fichier PDF trouvé")
+        return 2
+    
+    # Nom affiché de chaque fichier : son nom seul, ou son chemin relatif si ce nom est ambigu
+    basenames = [os.path.basename(path) for path in paths]
+    labels = {
+        path: name if basenames.count(name) == 1 else os.path.relpath(path)
+        for path, name in zip(paths, basenames)
+    }
+    
+    results, timings, nb_failed = ResultsStore(capacity=len(paths)), [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(process_path, path, args): path for path in paths}
+        for future in as_completed(futures):
+            name = labels[futures[future]]
+            try:
+                result = future.result()
+            except Exception as e:
+                nb_failed += 1
+                logger.error("Échec pour %s : %s", name, e)
+                timings.append({"Fichier": name, "Statut": "Échec"})
+                continue
+            
+            for key, error in result.errors.items():
+                logger.warning("Section « %s » non extraite pour %s : %s", SECTION_LABELS.get(key, key), name, error)
+            results.upsert(name, result.data, year=result.year)
+            timings.append({
+                "Fichier": name,
+                "Statut": "Historique" if result.from_history else ("Partiel" if result.errors else "Terminé"),
+                "Pages envoyées": (
+                    f"{len(result.pages) if result.pages is not None else result.page_count} / {result.page_count}"
+                    if result.page_count else "-"
+                ),
+                **{f"{stage} (s)": duration for stage, duration in result.timings.items()},
+                "Total (s)": sum(result.timings.values()),
+            })
+            print(f"[{len(timings)}/{len(paths)}] {name}", file=sys.stderr)
+    wall_time = time.perf_counter() - start
+    
+    if len(results):
+        df = results.frame(sorted(results.files()), with_keys=True)
+        try:
+            write_results(df, args.output)
+        except ImportError as e:
+            # .parquet nécessite pyarrow ou fastparquet
+            logger.error("Impossible d'écrire %s : %s", args.output, e)
+            return 1
+        print(f"Résultats enregistrés dans {args.output}", file=sys.stderr)
+        print_cross_checks(df)
+    
+    print_timing_summary(sorted(timings, key=lambda row: row["Fichier"]), wall_time)
+    perf_recorder.export_prometheus()
+    return 1 if nb_failed or not len(results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4021 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cœur de l'extraction des rapports SFCR, indépendant de l'interface : lecture locale des PDFs,
+client ChatPDF, caches et analyse des réponses. Utilisé par l'application Streamlit (app.py)
+et par le mode en ligne de commande (cli.py).
+"""
+
+import pandas as pd
+import re
+import numpy as np
+import requests
+import os
+import time
+import sqlite3
+import hashlib
+import json
+import random
+import heapq
+import logging
+import queue
+from collections import deque, namedtuple
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+import shutil
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pypdf est optionnel : sans lui, tout est extrait via ChatPDF
+    PdfReader = PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+API_KEY = os.environ.get("CHATPDF_API_KEY", "")
+
+# Paramètres du client HTTP partagé vers ChatPDF (l'URL peut pointer vers un serveur de test local)
+CHATPDF_BASE_URL = os.environ.get("CHATPDF_BASE_URL", "https://api.chatpdf.com/v1")
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 180
+HTTP_POOL_SIZE = 32
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 1.0
+HTTP_BACKOFF_MAX = 60.0
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Limites du forfait ChatPDF appliquées par l'ordonnanceur des requêtes : débit moyen (requêtes
+# par minute, 0 pour ne pas le limiter), rafale autorisée et nombre maximal de requêtes simultanées
+CHATPDF_RATE_LIMIT_PER_MINUTE = float(os.environ.get("SFCR_RATE_LIMIT_PER_MIN", "60"))
+CHATPDF_RATE_BURST = int(os.environ.get("SFCR_RATE_BURST", "10"))
+CHATPDF_MAX_CONCURRENCY = int(os.environ.get("SFCR_MAX_CONCURRENCY", "8"))
+
+# Priorités des requêtes : les questions posées depuis l'interface passent avant l'extraction
+# en arrière-plan, qui laisse toujours une place libre pour elles
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+INTERACTIVE_RESERVED_SLOTS = 1
+
+# Les analyses prédéfinies préparées après une extraction passent après toutes les extractions
+PRIORITY_PREPARATION = 20
+
+# Un appel est jugé lent au-delà de ce multiple de la durée moyenne des appels au même point d'accès
+SCHEDULER_SLOW_FACTOR = 3.0
+SCHEDULER_MIN_SAMPLES = 5
+
+# Taille des blocs lus dans le fichier pendant un téléversement en flux
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Nombre maximal de requêtes simultanées envoyées à ChatPDF pour un même document
+MAX_SECTION_WORKERS = 4
+
+# Nombre de PDFs téléversés et analysés simultanément par défaut
+MAX_PARALLEL_PDFS = 4
+
+# Nombre maximal de PDFs traités simultanément par le gestionnaire des extractions en arrière-plan
+MAX_BACKGROUND_PDFS = 16
+
+# Cache local (SQLite) des identifiants ChatPDF, indexé par l'empreinte SHA-256 des fichiers
+CACHE_DIR = os.environ.get("SFCR_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sfcr_cache"))
+CACHE_DB_PATH = os.path.join(CACHE_DIR, "cache.sqlite3")
+
+# Historique persistant des extractions (métriques et réponses brutes), jamais purgé automatiquement
+HISTORY_DB_PATH = os.environ.get("SFCR_HISTORY_DB", os.path.join(CACHE_DIR, "history.sqlite3"))
+
+# Copie des PDFs dont l'extraction en arrière-plan n'est pas terminée, pour la reprendre après un redémarrage
+PENDING_JOBS_DIR = os.path.join(CACHE_DIR, "pending")
+
+# Durée de validité d'un sourceId, à aligner sur la durée de conservation des documents chez ChatPDF
+SOURCE_ID_TTL_SECONDS = float(os.environ.get("SFCR_SOURCE_TTL_DAYS", "7")) * 24 * 3600
+SOURCE_CACHE_MAX_ENTRIES = 1000
+
+# Codes HTTP renvoyés par ChatPDF lorsqu'un sourceId n'existe plus
+SOURCE_NOT_FOUND_STATUS = (400, 404)
+
+# Cache disque des réponses de ChatPDF, borné en taille (éviction LRU)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("SFCR_RESPONSE_CACHE_MB", "50")) * 1024 * 1024
+
+# Identifiant du service interrogé, inclus dans la clé du cache des réponses
+CHAT_BACKEND = "chatpdf/v1"
+
+# Présélection des pages envoyées à ChatPDF pour l'extraction des métriques
+PAGE_SELECTION_MIN_PAGES = 20
+PAGE_SELECTION_MAX_PAGES = 60
+PAGE_SELECTION_MIN_SCORE = 3
+
+# Mesure de la durée de chaque étape du traitement (SFCR_PERF=0 pour la désactiver),
+# avec export facultatif au format JSON lines et au format texte de Prometheus
+PERF_ENABLED = os.environ.get("SFCR_PERF", "1") != "0"
+PERF_MAX_RECORDS = 5000
+PERF_METRICS_FILE = os.environ.get("SFCR_METRICS_FILE", "")
+PERF_PROMETHEUS_FILE = os.environ.get("SFCR_PROMETHEUS_FILE", "")
+
+PROMPT_TEMPLATE_BASE = """
+Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
+1) SCR : X€
+2) MCR : X€
+3) Ratio de solvabilité : X%
+
+IMPORTANT : 
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
+- Donne uniquement les chiffres, sans aucune explication
+- Respecte EXACTEMENT le format demandé
+"""
+
+PROMPT_TEMPLATE_FONDS_PROPRES = """
+Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
+1) Éléments éligibles (total des fonds propres) : X€
+2) Capital et primes : X€
+3) Réserve de réconciliation : X€
+4) Dettes subordonnées : X€
+5) Fonds excédentaires : X€
+
+IMPORTANT : 
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
+- Pour le capital et primes, si tu trouves ces éléments séparément (capital social + primes d'émission), additionne-les et donne uniquement le total
+- Donne uniquement les chiffres, sans aucune explication ni détail
+- Respecte EXACTEMENT le format demandé
+- N'ajoute pas de tirets, de puces ou d'autres caractères
+- N'ajoute pas de texte explicatif
+"""
+
+PROMPT_TEMPLATE_SCR_DETAIL = """
+Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
+1) SCR Risque de Marché : X€
+2) SCR Risque de Contrepartie : X€
+3) SCR Risque de Souscription Vie : X€
+4) SCR Risque de Souscription Santé : X€
+5) SCR Risque de Souscription Non-Vie : X€
+6) SCR Risque Opérationnel : X€
+7) Effet de Diversification : X€
+
+IMPORTANT : 
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
+- Donne uniquement les chiffres, sans aucune explication
+- Respecte EXACTEMENT le format demandé
+- Si une valeur n'est pas disponible, indique "Non disponible"
+- Pour l'Effet de Diversification, indique la valeur avec un signe négatif si c'est une réduction du SCR
+"""
+
+PROMPT_TEMPLATE_ACTIFS = """
+Analyse le document et donne les réponses sous cette forme EXACTE, sans aucun texte supplémentaire :
+1) Total des actifs : X€
+2) Obligations : X€
+3) Actions : X€
+4) Fonds d'investissement : X€
+5) Produits dérivés : X€
+6) Immobilier : X€
+7) Trésorerie et dépôts : X€
+8) Participations : X€
+9) Autres actifs : X€
+
+IMPORTANT : 
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
+- Donne uniquement les chiffres, sans aucune explication
+- Respecte EXACTEMENT le format demandé
+- Si une valeur n'est pas disponible, indique "Non disponible"
+- Les informations peuvent etre présentées sous différentes normes ou catégories (comme Solvabilité 1, Solvabilité 2, IFRS, etc.), choisit toujours la colonne "Solvabilité 2 ou Solvabilité II"
+- Pour le total des actifs, cherche le "Total de l'actif" ou "Total actif"
+- Les obligations peuvent aussi être appelées "Titres obligataires" ou "Titres à revenu fixe"
+- Les actions peuvent aussi être appelées "Titres de participation" ou "Titres à revenu variable"
+- Les fonds d'investissement peuvent aussi être appelés "OPCVM" ou "Fonds communs de placement"
+- IMPORTANT : Les informations peuvent se trouver à plusieurs endroits différents dans le document, comme "Actifs",  "Investissements", "Placements" ou "Portefeuille d'investissement".
+"""
+
+QUESTION_TEMPLATE_BASE = """
+Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
+0) Nom de la société : 
+1) SCR : 
+2) MCR : 
+3) Ratio de solvabilité : 
+"""
+
+QUESTION_TEMPLATE_FONDS_PROPRES = """
+Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
+1) Éléments éligibles (total des fonds propres) : 
+2) Capital et primes : 
+3) Réserve de réconciliation : 
+4) Dettes subordonnées : 
+5) Fonds excédentaires : 
+
+Pour le capital et primes, si tu trouves ces éléments séparément (capital social + primes d'émission), additionne-les et donne uniquement le total.
+"""
+
+QUESTION_TEMPLATE_SCR_DETAIL = """
+Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
+1) SCR Risque de Marché : 
+2) SCR Risque de Contrepartie : 
+3) SCR Risque de Souscription Vie : 
+4) SCR Risque de Souscription Santé : 
+5) SCR Risque de Souscription Non-Vie : 
+6) SCR Risque Opérationnel : 
+7) Effet de Diversification : 
+"""
+
+QUESTION_TEMPLATE_ACTIFS = """
+Réponds UNIQUEMENT avec les informations demandées, sans aucun texte supplémentaire :
+1) Total des actifs : 
+2) Obligations : 
+3) Actions : 
+4) Fonds d'investissement : 
+5) Produits dérivés : 
+6) Immobilier : 
+7) Trésorerie et dépôts : 
+8) Participations : 
+9) Autres actifs : 
+"""
+
+PROMPT_TEMPLATE_COMBINED = """
+Analyse le document et réponds UNIQUEMENT avec un objet JSON valide, sans aucun texte avant ou après, en remplissant toutes les clés demandées.
+
+IMPORTANT : 
+- Les montants doivent être des nombres exprimés en euros, sans symbole ni séparateur de milliers
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliards d'euros (Md€), convertis-la en euros (multiplie par 1 000 000 000)
+- Le ratio de solvabilité est un pourcentage (par exemple 215.5 pour 215,5 %)
+- Si une valeur n'est pas disponible, indique null
+- Pour le capital et primes, si tu trouves ces éléments séparément (capital social + primes d'émission), additionne-les et donne uniquement le total
+- Pour l'Effet de Diversification, indique la valeur avec un signe négatif si c'est une réduction du SCR
+- Pour les actifs, choisis toujours la colonne "Solvabilité 2 ou Solvabilité II" ; le total des actifs correspond au "Total de l'actif" ou "Total actif"
+- Les obligations peuvent aussi être appelées "Titres obligataires" ou "Titres à revenu fixe", les actions "Titres à revenu variable" et les fonds d'investissement "OPCVM" ou "Fonds communs de placement"
+"""
+
+QUESTION_TEMPLATE_COMBINED = """
+Réponds UNIQUEMENT avec cet objet JSON complété :
+{
+  "Société": "",
+  "SCR (€)": null,
+  "MCR (€)": null,
+  "Ratio de solvabilité (%)": null,
+  "Éléments éligibles (€)": null,
+  "Capital et primes (€)": null,
+  "Réserve de réconciliation (€)": null,
+  "Dettes subordonnées (€)": null,
+  "Fonds excédentaires (€)": null,
+  "SCR Risque de Marché (€)": null,
+  "SCR Risque de Contrepartie (€)": null,
+  "SCR Risque de Souscription Vie (€)": null,
+  "SCR Risque de Souscription Santé (€)": null,
+  "SCR Risque de Souscription Non-Vie (€)": null,
+  "SCR Risque Opérationnel (€)": null,
+  "Effet de Diversification (€)": null,
+  "Total des actifs (€)": null,
+  "Obligations (€)": null,
+  "Actions (€)": null,
+  "Fonds d'investissement (€)": null,
+  "Produits dérivés (€)": null,
+  "Immobilier (€)": null,
+  "Trésorerie et dépôts (€)": null,
+  "Participations (€)": null,
+  "Autres actifs (€)": null
+}
+"""
+
+# Schéma déclaratif des métriques extraites : clé, section, colonne du DataFrame,
+# libellé (expression régulière), type de valeur ("texte", "euros" ou "pourcentage")
+# et, le cas échéant, emplacement dans les QRT publics (modèle, codes de ligne additionnés)
+MetricField = namedtuple("MetricField", ["key", "section", "column", "label", "kind", "qrt"], defaults=(None,))
+
+METRIC_FIELDS = [
+    MetricField("societe", "base", "Société", r"Nom de la soci[ée]t[ée]", "texte"),
+    MetricField("scr", "base", "SCR (€)", r"SCR", "euros", ("S.23.01", ("R0580",))),
+    MetricField("mcr", "base", "MCR (€)", r"MCR", "euros", ("S.23.01", ("R0600",))),
+    MetricField("ratio", "base", "Ratio de solvabilité (%)", r"Ratio de solvabilit[ée]", "pourcentage", ("S.23.01", ("R0620",))),
+    MetricField("elements_eligibles", "fonds_propres", "Éléments éligibles (€)", r"[ÉE]l[ée]ments [ée]ligibles", "euros", ("S.23.01", ("R0540",))),
+    MetricField("capital_primes", "fonds_propres", "Capital et primes (€)", r"Capital et primes", "euros", ("S.23.01", ("R0010", "R0030", "R0040"))),
+    MetricField("reserve_reconciliation", "fonds_propres", "Réserve de réconciliation (€)", r"R[ée]serve de r[ée]conciliation", "euros", ("S.23.01", ("R0130",))),
+    MetricField("dettes_subordonnees", "fonds_propres", "Dettes subordonnées (€)", r"Dettes subordonn[ée]es", "euros", ("S.23.01", ("R0140",))),
+    MetricField("fonds_excedentaires", "fonds_propres", "Fonds excédentaires (€)", r"Fonds exc[ée]dentaires", "euros", ("S.23.01", ("R0070",))),
+    MetricField("scr_marche", "scr_detail", "SCR Risque de Marché (€)", r"SCR Risque de March[ée]", "euros", ("S.25.01", ("R0010",))),
+    MetricField("scr_contrepartie", "scr_detail", "SCR Risque de Contrepartie (€)", r"SCR Risque de Contrepartie", "euros", ("S.25.01", ("R0020",))),
+    MetricField("scr_vie", "scr_detail", "SCR Risque de Souscription Vie (€)", r"SCR Risque de Souscription Vie", "euros", ("S.25.01", ("R0030",))),
+    MetricField("scr_sante", "scr_detail", "SCR Risque de Souscription Santé (€)", r"SCR Risque de Souscription Sant[ée]", "euros", ("S.25.01", ("R0040",))),
+    MetricField("scr_non_vie", "scr_detail", "SCR Risque de Souscription Non-Vie (€)", r"SCR Risque de Souscription Non[- ]Vie", "euros", ("S.25.01", ("R0050",))),
+    MetricField("scr_operationnel", "scr_detail", "SCR Risque Opérationnel (€)", r"SCR Risque Op[ée]rationnel", "euros", ("S.25.01", ("R0130",))),
+    MetricField("effet_diversification", "scr_detail", "Effet de Diversification (€)", r"Effet de Diversification", "euros", ("S.25.01", ("R0060",))),
+    MetricField("total_actifs", "actifs", "Total des actifs (€)", r"Total des actifs", "euros", ("S.02.01", ("R0500",))),
+    MetricField("obligations", "actifs", "Obligations (€)", r"Obligations", "euros", ("S.02.01", ("R0130",))),
+    MetricField("actions", "actifs", "Actions (€)", r"Actions", "euros", ("S.02.01", ("R0100",))),
+    MetricField("fonds", "actifs", "Fonds d'investissement (€)", r"Fonds d['’]investissement", "euros", ("S.02.01", ("R0180",))),
+    MetricField("derives", "actifs", "Produits dérivés (€)", r"Produits d[ée]riv[ée]s", "euros", ("S.02.01", ("R0190",))),
+    MetricField("immobilier", "actifs", "Immobilier (€)", r"Immobilier", "euros", ("S.02.01", ("R0080",))),
+    MetricField("tresorerie", "actifs", "Trésorerie et dépôts (€)", r"Tr[ée]sorerie et d[ée]p[ôo]ts", "euros", ("S.02.01", ("R0200", "R0410"))),
+    MetricField("participations", "actifs", "Participations (€)", r"Participations", "euros", ("S.02.01", ("R0090",))),
+    MetricField("autres", "actifs", "Autres actifs (€)", r"Autres actifs", "euros"),
+]
+
+FIELDS_BY_KEY = {field.key: field for field in METRIC_FIELDS}
+
+# Colonnes du DataFrame final renseignées par chaque section
+SECTION_COLUMNS = {
+    section: [field.column for field in METRIC_FIELDS if field.section == section]
+    for section in dict.fromkeys(field.section for field in METRIC_FIELDS)
+}
+
+METRIC_COLUMNS = [field.column for field in METRIC_FIELDS if field.kind != "texte"]
+
+# Autres intitulés sous lesquels une métrique peut figurer dans un rapport, utilisés pour
+# les requêtes de complément des champs manquants
+FIELD_SYNONYMS = {
+    "scr": ("Capital de solvabilité requis", "Solvency Capital Requirement"),
+    "mcr": ("Minimum de capital requis", "Minimum Capital Requirement"),
+    "ratio": ("Taux de couverture du SCR", "Ratio de couverture du SCR"),
+    "elements_eligibles": ("Fonds propres éligibles pour couvrir le SCR", "Total eligible own funds to meet the SCR"),
+    "capital_primes": ("Capital social ordinaire", "Primes d'émission", "Fonds initial"),
+    "reserve_reconciliation": ("Reconciliation reserve",),
+    "dettes_subordonnees": ("Passifs subordonnés", "Subordinated liabilities"),
+    "fonds_excedentaires": ("Surplus funds",),
+    "scr_marche": ("Risque de marché", "Market risk"),
+    "scr_contrepartie": ("Risque de défaut de la contrepartie", "Counterparty default risk"),
+    "scr_vie": ("Risque de souscription en vie", "Life underwriting risk"),
+    "scr_sante": ("Risque de souscription en santé", "Health underwriting risk"),
+    "scr_non_vie": ("Risque de souscription en non-vie", "Non-life underwriting risk"),
+    "scr_operationnel": ("Risque opérationnel", "Operational risk"),
+    "effet_diversification": ("Bénéfice de diversification", "Diversification"),
+    "total_actifs": ("Total de l'actif", "Total actif", "Total assets"),
+    "obligations": ("Titres obligataires", "Titres à revenu fixe", "Bonds"),
+    "actions": ("Titres à revenu variable", "Equities"),
+    "fonds": ("Organismes de placement collectif", "OPCVM", "Collective investments undertakings"),
+    "derives": ("Instruments dérivés", "Derivatives"),
+    "immobilier": ("Biens immobiliers autres que pour usage propre", "Property"),
+    "tresorerie": ("Trésorerie et équivalents de trésorerie", "Dépôts autres que les équivalents de trésorerie"),
+    "participations": ("Détentions dans des entreprises liées", "Holdings in related undertakings"),
+    "autres": ("Autres investissements", "Any other assets"),
+}
+
+# Nombre maximal de champs manquants demandés dans une même requête de complément
+GAP_FILLING_MAX_FIELDS = 8
+
+# Contrôles de cohérence des métriques extraites : identifiant, libellé, sections réinterrogées
+# en cas d'écart, écart relatif toléré et rappel de l'identité ajouté à la question de vérification.
+# L'écart toléré sur le SCR absorbe l'ajustement pour impôts différés, qui n'est pas extrait.
+CrossCheck = namedtuple("CrossCheck", ["key", "label", "sections", "tolerance", "hint"])
+CROSS_CHECKS = [
+    CrossCheck(
+        "scr", "SCR = modules + diversification", ("scr_detail", "base"), 0.15,
+        "la somme des modules de risque du SCR (marché, contrepartie, vie, santé, non-vie, opérationnel) "
+        "et de l'effet de diversification doit être proche du SCR (QRT S.25.01)"
+    ),
+    CrossCheck(
+        "ratio", "Ratio = éléments éligibles / SCR", ("fonds_propres", "base"), 0.02,
+        "le ratio de solvabilité doit être égal aux éléments éligibles pour couvrir le SCR divisés par "
+        "le SCR (QRT S.23.01, lignes R0540, R0580 et R0620)"
+    ),
+    CrossCheck(
+        "actifs", "Total des actifs = composantes", ("actifs",), 0.05,
+        "la somme des composantes des actifs doit être égale au total des actifs, dans la colonne "
+        "Solvabilité II (QRT S.02.01)"
+    ),
+]
+
+# Note attribuée à un contrôle qui ne peut pas être évalué faute de valeurs, entre l'échec (0) et le succès (1)
+CROSS_CHECK_UNKNOWN_SCORE = 0.5
+
+PROMPT_TEMPLATE_RECHECK = """
+ATTENTION : une première lecture de ce document a donné des montants incohérents :
+{checks}
+Relis chaque montant dans le document, en particulier dans les tableaux QRT en annexe, avant de répondre.
+"""
+
+PROMPT_TEMPLATE_GAP_FILLING = """
+Cherche dans tout le document, y compris les tableaux QRT en annexe, les valeurs demandées.
+Les autres intitulés et la ligne du QRT indiqués entre parenthèses t'aident à les retrouver.
+
+IMPORTANT : 
+- Si tu trouves une valeur en millions d'euros (M€), convertis-la en euros (multiplie par 1 000 000)
+- Si tu trouves une valeur en milliers d'euros (k€), convertis-la en euros (multiplie par 1 000)
+- Pour les actifs, choisis toujours la colonne "Solvabilité 2 ou Solvabilité II"
+- Pour l'Effet de Diversification, indique la valeur avec un signe négatif si c'est une réduction du SCR
+- Si une valeur ne figure vraiment pas dans le document, réponds "Non disponible"
+- Respecte EXACTEMENT le format demandé, une ligne par valeur, sans aucune explication
+"""
+
+# Expression unique, compilée une fois, reconnaissant le libellé de n'importe quelle métrique
+# en début de ligne (puces et numérotation "1)" tolérées) suivi de ":". Le nom du groupe
+# qui a correspondu (m.lastgroup) donne la clé de la métrique.
+FIELD_LINE_RE = re.compile(
+    r"^[ \t*•>-]*(?:\d{1,2}\s*[.)]\s*)?\**[ \t]*(?:"
+    + "|".join(f"(?P<{field.key}>{field.label})" for field in sorted(METRIC_FIELDS, key=lambda f: -len(f.label)))
+    + r")[ \t*]*(?:\([^)\n]*\))?[ \t*]*:[ \t*]*",
+    re.IGNORECASE | re.MULTILINE
+)
+
+FIELD_VALUE_RE = re.compile(
+    r"(?P<value>Non disponible|-?[ \t]*\d[\d \t\u00a0\u202f.,]*)[ \t]*"
+    r"(?P<unit>Mds?[ \t]*€|M[ \t]*€|k[ \t]*€|€|%|milliards?|millions?|milliers?)?",
+    re.IGNORECASE
+)
+
+def parse_number(value_str):
+    """
+    Convertit un nombre écrit en texte (espaces, points ou virgules comme séparateurs) en float.
+    
+    Args:
+        value_str (str): La chaîne de caractères contenant le nombre
+    
+    Returns:
+        float: La valeur numérique
+    
+    Raises:
+        ValueError: Si la chaîne ne représente pas un nombre
+    """
+    value_str = re.sub(r"\s", "", value_str).rstrip(".,")
+    if value_str.count(".") > 1:
+        value_str = value_str.replace(".", "")
+    if value_str.count(",") > 1:
+        value_str = value_str.replace(",", "")
+    if "." in value_str and "," in value_str:
+        # Le dernier séparateur est le séparateur décimal
+        if value_str.rfind(",") > value_str.rfind("."):
+            value_str = value_str.replace(".", "")
+        else:
+            value_str = value_str.replace(",", "")
+    return float(value_str.replace(",", "."))
+
+def convert_value(value_str, unit_pattern):
+    """
+    Convertit une valeur textuelle en valeur numérique en tenant compte de l'unité.
+    
+    Args:
+        value_str (str): La chaîne de caractères contenant la valeur numérique
+        unit_pattern (str): La chaîne complète contenant l'unité (€, k€, M€, Md€)
+    
+    Returns:
+        float: La valeur convertie en euros, ou np.nan si la conversion échoue
+    """
+    if "Non disponible" in value_str:
+        return np.nan
+    
+    try:
+        value = parse_number(value_str)
+    except ValueError:
+        return np.nan
+    
+    unit = unit_pattern.lower()
+    if re.search(r"mds?\s*€|milliard", unit):
+        return value * 1_000_000_000
+    elif re.search(r"m\s*€|million", unit):
+        return value * 1_000_000
+    elif re.search(r"k\s*€|millier", unit):
+        return value * 1_000
+    return value
+
+def parse_response_text(text, sections=None):
+    """
+    Extrait en une seule passe toutes les métriques présentes dans une réponse de ChatPDF,
+    à l'aide du schéma METRIC_FIELDS. Pour chaque métrique, la première valeur trouvée est conservée.
+    Calcule le total des actifs s'il n'est pas disponible mais que les composantes le sont.
+    
+    Args:
+        text (str): Le texte brut renvoyé par l'API ChatPDF
+        sections (list, optional): Les sections dont les métriques sont recherchées (toutes par défaut)
+    
+    Returns:
+        dict: Les valeurs par nom de colonne, vides (None ou np.nan) pour les métriques non trouvées
+    """
+    fields = [field for field in METRIC_FIELDS if sections is None or field.section in sections]
+    entry = {field.column: (None if field.kind == "texte" else np.nan) for field in fields}
+    found = set()
+    
+    for match in FIELD_LINE_RE.finditer(text or ""):
+        field = FIELDS_BY_KEY[match.lastgroup]
+        if field.key in found or field.column not in entry:
+            continue
+        
+        if field.kind == "texte":
+            line_end = text.find("\n", match.end())
+            value = text[match.end():line_end if line_end != -1 else len(text)].strip(" \t*")
+            if value:
+                entry[field.column] = value
+                found.add(field.key)
+            continue
+        
+        value_match = FIELD_VALUE_RE.match(text, match.end())
+        if value_match is None:
+            continue
+        unit = value_match.group("unit") or ""
+        if (unit == "%") != (field.kind == "pourcentage") and unit:
+            continue
+        entry[field.column] = convert_value(value_match.group("value"), unit)
+        found.add(field.key)
+    
+    if 'Total des actifs (€)' in entry and pd.isna(entry['Total des actifs (€)']):
+        valid_components = [
+            entry[column] for column in SECTION_COLUMNS["actifs"][1:] if not pd.isna(entry[column])
+        ]
+        if valid_components:
+            entry['Total des actifs (€)'] = sum(valid_components)
+    
+    return entry
+
+def parse_response_texts(texts, sections=None):
+    """
+    Extrait les métriques d'une série de réponses (traitement par lot).
+    
+    Args:
+        texts (iterable): Les textes bruts renvoyés par l'API ChatPDF
+        sections (list, optional): Les sections dont les métriques sont recherchées (toutes par défaut)
+    
+    Returns:
+        DataFrame: Un DataFrame avec une ligne par réponse
+    """
+    return pd.DataFrame([parse_response_text(text, sections) for text in texts])
+
+def parse_combined_text(text):
+    """
+    Extrait toutes les informations (base, fonds propres, détail du SCR et actifs) à partir
+    de la réponse JSON obtenue en mode d'extraction combiné.
+    Les valeurs absentes restent vides afin d'être complétées par l'extraction par section.
+    
+    Args:
+        text (str): Le texte brut renvoyé par l'API ChatPDF, contenant un objet JSON
+    
+    Returns:
+        DataFrame: Un DataFrame d'une ligne avec les mêmes colonnes que l'extraction par section
+    
+    Raises:
+        ValueError: Si la réponse ne contient pas d'objet JSON valide
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("La réponse ne contient pas d'objet JSON")
+    answer = json.loads(text[start:end + 1])
+    if not isinstance(answer, dict):
+        raise ValueError("La réponse JSON n'est pas un objet")
+    
+    current_entry = {}
+    for field in METRIC_FIELDS:
+        value = answer.get(field.column)
+        if field.kind == "texte":
+            current_entry[field.column] = str(value).strip() if value else None
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            current_entry[field.column] = float(value)
+        elif isinstance(value, str):
+            value_match = FIELD_VALUE_RE.search(value)
+            current_entry[field.column] = (
+                convert_value(value_match.group("value"), value) if value_match else np.nan
+            )
+        else:
+            current_entry[field.column] = np.nan
+    
+    return pd.DataFrame([current_entry])
+
+# Repérage des QRT publics annexés au SFCR (S.02.01 bilan, S.23.01 fonds propres, S.25.01 SCR)
+QRT_TEMPLATE_RE = re.compile(r"\bS\.?\s?(02|23|25)\.01\b")
+QRT_ROW_RE = re.compile(r"\bR\d{4}\b")
+QRT_NUMBER_RE = re.compile(r"\(?-?\d{1,3}(?:[ \u00a0\u202f.,']\d{3})+(?:[.,]\d+)?\)?|\(?-?\d+(?:[.,]\d+)?\)?")
+QRT_THOUSANDS_RE = re.compile(r"milliers|\bk\s?€|\bkeur\b|thousand", re.IGNORECASE)
+QRT_MILLIONS_RE = re.compile(r"millions d.euros|\bM\s?€|\bMEUR\b")
+
+def extract_page_texts(uploaded_file):
+    """
+    Lit localement la couche texte d'un PDF, page par page, sans appel réseau.
+    
+    Args:
+        uploaded_file: Un objet fichier PDF binaire
+    
+    Returns:
+        list: Le texte de chaque page, ou une liste vide si pypdf n'est pas installé
+              ou si le fichier ne peut pas être lu
+    """
+    if PdfReader is None:
+        return []
+    
+    try:
+        uploaded_file.seek(0)
+        reader = PdfReader(uploaded_file)
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        # PDF illisible ou sans couche texte : l'extraction se fera entièrement via ChatPDF
+        logger.warning("Lecture locale impossible pour %s : %s", document_name(uploaded_file), e)
+        return []
+    finally:
+        uploaded_file.seek(0)
+
+def parse_qrt_amount(value_str):
+    """
+    Convertit un montant lu dans un QRT en nombre. Les parenthèses indiquent un montant négatif
+    et un séparateur unique suivi de trois chiffres est un séparateur de milliers.
+    
+    Lorsque deux colonnes voisines ont la même valeur (total égal au niveau 1), la couche texte
+    les restitue comme un seul nombre ("400 400") : la valeur répétée n'est alors comptée qu'une fois.
+    
+    Args:
+        value_str (str): Le montant tel qu'il apparaît dans le texte de la page
+    
+    Returns:
+        float: La valeur numérique
+    """
+    negative = value_str.startswith("(") and value_str.endswith(")")
+    value_str = value_str.strip("()").replace("'", "")
+    groups = re.split(r"[ \u00a0\u202f]", value_str)
+    for size in range(1, len(groups) // 2 + 1):
+        if groups[:size] == groups[size:2 * size]:
+            value_str = " ".join(groups[:size])
+            break
+    if re.fullmatch(r"-?\d{1,3}[.,]\d{3}", value_str):
+        value_str = re.sub(r"[.,]", "", value_str)
+    value = parse_number(value_str)
+    return -value if negative else value
+
+def extract_qrt_metrics(page_texts):
+    """
+    Extrait les métriques du schéma METRIC_FIELDS à partir des QRT S.02.01, S.23.01 et S.25.01
+    présents dans le texte des pages, en repérant les codes de ligne (R0010, R0540...).
+    Pour chaque ligne, la première valeur suivant le code est retenue (colonne C0010 ou C0110).
+    L'unité (euros, milliers ou millions d'euros) est déduite des mentions de la page.
+    
+    Args:
+        page_texts (list): Le texte de chaque page du PDF
+    
+    Returns:
+        dict: Les valeurs trouvées, par nom de colonne
+    """
+    rows = {}
+    template = None
+    unit = 1
+    
+    for text in page_texts:
+        if not QRT_ROW_RE.search(text):
+            template = None
+            continue
+        if QRT_THOUSANDS_RE.search(text):
+            unit = 1_000
+        elif QRT_MILLIONS_RE.search(text):
+            unit = 1_000_000
+        
+        for line in text.splitlines():
+            template_match = QRT_TEMPLATE_RE.search(line)
+            if template_match:
+                template = f"S.{template_match.group(1)}.01"
+            row_match = QRT_ROW_RE.search(line)
+            if template is None or row_match is None or (template, row_match.group(0)) in rows:
+                continue
+            number_match = QRT_NUMBER_RE.search(line, row_match.end())
+            if number_match:
+                rows[(template, row_match.group(0))] = (number_match.group(0), unit)
+    
+    values = {}
+    for field in METRIC_FIELDS:
+        if field.qrt is None:
+            continue
+        template, codes = field.qrt
+        amounts = []
+        for code in codes:
+            if (template, code) in rows:
+                value_str, page_unit = rows[(template, code)]
+                try:
+                    amounts.append((parse_qrt_amount(value_str), page_unit))
+                except ValueError:
+                    continue
+        if not amounts:
+            continue
+        
+        if field.kind == "pourcentage":
+            ratio = amounts[0][0]
+            # Le ratio est souvent publié sous forme décimale (2,15 pour 215 %)
+            values[field.column] = ratio * 100 if abs(ratio) < 20 else ratio
+        else:
+            values[field.column] = sum(amount * page_unit for amount, page_unit in amounts)
+    
+    # Les autres actifs sont le complément des composantes détaillées jusqu'au total du bilan
+    components = SECTION_COLUMNS["actifs"][1:-1]
+    if 'Total des actifs (€)' in values and all(column in values for column in components):
+        remainder = values['Total des actifs (€)'] - sum(values[column] for column in components)
+        if remainder >= 0:
+            values['Autres actifs (€)'] = remainder
+    
+    return values
+
+# Mots-clés signalant les pages utiles à l'extraction (section E "Gestion du capital" et QRT), avec leur poids
+PAGE_KEYWORDS = [
+    (re.compile(r"gestion du capital", re.IGNORECASE), 3),
+    (re.compile(r"fonds propres", re.IGNORECASE), 2),
+    (re.compile(r"capital de solvabilit[ée] requis|\bSCR\b", re.IGNORECASE), 2),
+    (re.compile(r"minimum de capital requis|\bMCR\b", re.IGNORECASE), 2),
+    (re.compile(r"ratio de (?:solvabilit[ée]|couverture)", re.IGNORECASE), 2),
+    (re.compile(r"r[ée]serve de r[ée]conciliation|dettes subordonn[ée]es|fonds exc[ée]dentaires", re.IGNORECASE), 2),
+    (re.compile(r"bilan prudentiel|total de l.actif|placements", re.IGNORECASE), 1),
+    (QRT_TEMPLATE_RE, 5),
+]
+
+def score_page(text):
+    """
+    Calcule le score de pertinence d'une page pour l'extraction des métriques.
+    
+    Args:
+        text (str): Le texte de la page
+    
+    Returns:
+        int: Le score (mots-clés pondérés et codes de ligne de QRT)
+    """
+    score = sum(weight for pattern, weight in PAGE_KEYWORDS if pattern.search(text))
+    return score + min(len(QRT_ROW_RE.findall(text)), 10)
+
+def select_relevant_pages(page_texts):
+    """
+    Sélectionne les pages utiles à l'extraction : la première page (nom de la société)
+    et les pages les mieux notées, dans la limite de PAGE_SELECTION_MAX_PAGES.
+    
+    Args:
+        page_texts (list): Le texte de chaque page du PDF
+    
+    Returns:
+        list: Les numéros (à partir de 0) des pages retenues, dans l'ordre du document,
+              ou None si le document doit être envoyé en entier (document court ou sans texte)
+    """
+    if len(page_texts) < PAGE_SELECTION_MIN_PAGES or not any(text.strip() for text in page_texts):
+        return None
+    
+    scores = [score_page(text) for text in page_texts]
+    candidates = sorted(
+        (index for index, score in enumerate(scores) if score >= PAGE_SELECTION_MIN_SCORE),
+        key=lambda index: -scores[index]
+    )
+    pages = sorted(set([0] + candidates[:PAGE_SELECTION_MAX_PAGES - 1]))
+    return pages if len(pages) > 1 else None
+
+def format_page_ranges(pages):
+    """
+    Formate une liste de numéros de pages (à partir de 0) en plages lisibles, numérotées à partir de 1.
+    
+    Args:
+        pages (list): Les numéros de pages triés
+    
+    Returns:
+        str: Les plages de pages, par exemple "1, 95-110, 150"
+    """
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(start + 1) if start == end else f"{start + 1}-{end + 1}" for start, end in ranges)
+
+def build_pdf_subset(uploaded_file, pages):
+    """
+    Construit un PDF allégé ne contenant que les pages retenues.
+    
+    Args:
+        uploaded_file: L'objet fichier PDF d'origine
+        pages (list): Les numéros (à partir de 0) des pages à conserver
+    
+    Returns:
+        SpooledTemporaryFile: Le PDF allégé, positionné au début, à fermer par l'appelant
+    """
+    uploaded_file.seek(0)
+    reader = PdfReader(uploaded_file)
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page])
+    
+    subset = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    writer.write(subset)
+    subset.seek(0)
+    uploaded_file.seek(0)
+    return subset
+
+class StageTimer:
+    """
+    Mesure la durée d'une étape du traitement, dans un bloc with. La taille des données
+    traitées, si elle n'est connue qu'à la fin de l'étape, peut être renseignée dans le bloc
+    (attribut size). Une étape interrompue par une exception est enregistrée en échec.
+    
+    Args:
+        recorder (PerfRecorder): Le registre des mesures
+        stage (str): Le nom de l'étape
+        document (str, optional): Le nom du document traité
+        size (int, optional): La taille des données traitées, en octets
+    """
+    
+    __slots__ = ("recorder", "stage", "document", "size", "start")
+    
+    def __init__(self, recorder, stage, document=None, size=None):
+        self.recorder = recorder
+        self.stage = stage
+        self.document = document
+        self.size = size
+        self.start = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.record(self.stage, time.perf_counter() - self.start, self.document, self.size, exc_type is None)
+        return False
+
+class NullTimer:
+    """
+    Remplace StageTimer lorsque la mesure est désactivée : une instance unique, sans effet.
+    """
+    
+    __slots__ = ("size",)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = NullTimer()
+
+class PerfRecorder:
+    """
+    Registre des durées et des tailles de données de chaque étape du traitement, partagé par
+    tous les threads du processus.
+    
+    Les dernières mesures sont conservées en mémoire (percentiles par étape) et, si un fichier
+    est indiqué, ajoutées au fil de l'eau au format JSON lines. Des totaux cumulés par étape
+    alimentent l'export au format texte de Prometheus. Désactivé, le registre ne mesure rien :
+    timer() retourne un objet sans effet.
+    
+    Args:
+        enabled (bool): Active la mesure
+        max_records (int): Le nombre maximal de mesures conservées en mémoire
+        metrics_file (str, optional): Le fichier JSON lines où ajouter chaque mesure
+        prometheus_file (str, optional): Le fichier texte Prometheus écrit par export_prometheus()
+    """
+    
+    def __init__(self, enabled=PERF_ENABLED, max_records=PERF_MAX_RECORDS, metrics_file=PERF_METRICS_FILE,
+                 prometheus_file=PERF_PROMETHEUS_FILE):
+        self.enabled = enabled
+        self.records = deque(maxlen=max_records)
+        self.metrics_file = metrics_file or None
+        self.prometheus_file = prometheus_file or None
+        self.totals = {}
+        self._sink = None
+        self._lock = threading.Lock()
+    
+    def timer(self, stage, document=None, size=None):
+        """
+        Retourne le gestionnaire de contexte mesurant une étape.
+        
+        Args:
+            stage (str): Le nom de l'étape
+            document (str, optional): Le nom du document traité
+            size (int, optional): La taille des données traitées, en octets
+        
+        Returns:
+            StageTimer: Le chronomètre de l'étape (sans effet si la mesure est désactivée)
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return StageTimer(self, stage, document, size)
+    
+    def record(self, stage, seconds, document=None, size=None, success=True):
+        """
+        Enregistre la mesure d'une étape.
+        
+        Args:
+            stage (str): Le nom de l'étape
+            seconds (float): La durée de l'étape
+            document (str, optional): Le nom du document traité
+            size (int, optional): La taille des données traitées, en octets
+            success (bool): False si l'étape s'est terminée par une erreur
+        """
+        entry = {
+            "ts": round(time.time(), 3),
+            "stage": stage,
+            "document": document,
+            "seconds": round(seconds, 6),
+            "bytes": size,
+            "ok": success,
+        }
+        with self._lock:
+            self.records.append(entry)
+            totals = self.totals.setdefault(stage, [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size or 0
+            totals[3] += 0 if success else 1
+            if self.metrics_file:
+                self._write_line(json.dumps(entry, ensure_ascii=False))
+    
+    def _write_line(self, line):
+        # Appelée sous self._lock ; le fichier reste ouvert, écrit ligne par ligne
+        try:
+            if self._sink is None:
+                directory = os.path.dirname(os.path.abspath(self.metrics_file))
+                os.makedirs(directory, exist_ok=True)
+                self._sink = open(self.metrics_file, "a", encoding="utf-8", buffering=1)
+            self._sink.write(line + "\n")
+        except OSError as e:
+            logger.warning("Export des mesures désactivé (%s) : %s", self.metrics_file, e)
+            self.metrics_file = None
+    
+    def set_metrics_file(self, path):
+        """
+        Change le fichier JSON lines où sont ajoutées les mesures.
+        
+        Args:
+            path (str, optional): Le chemin du fichier (None pour arrêter l'export)
+        """
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+            self.metrics_file = path or None
+    
+    def snapshot(self):
+        """
+        Retourne une copie des mesures conservées en mémoire.
+        
+        Returns:
+            list: Les mesures, de la plus ancienne à la plus récente
+        """
+        with self._lock:
+            return list(self.records)
+    
+    def stage_statistics(self):
+        """
+        Calcule les statistiques de chaque étape sur les mesures conservées en mémoire.
+        
+        Returns:
+            DataFrame: Une ligne par étape (nombre de mesures, médiane, p95, total, octets, échecs),
+                       triée par durée totale décroissante
+        """
+        records = self.snapshot()
+        if not records:
+            return pd.DataFrame(columns=["Étape", "Mesures", "p50 (s)", "p95 (s)", "Total (s)", "Octets", "Échecs"])
+        
+        df = pd.DataFrame.from_records(records, columns=["stage", "seconds", "bytes", "ok"])
+        df["failed"] = ~df["ok"].astype(bool)
+        grouped = df.groupby("stage", sort=False)
+        stats = pd.DataFrame({
+            "Mesures": grouped.size(),
+            "p50 (s)": grouped["seconds"].median(),
+            "p95 (s)": grouped["seconds"].quantile(0.95),
+            "Total (s)": grouped["seconds"].sum(),
+            "Octets": grouped["bytes"].sum(min_count=1).astype("Int64"),
+            "Échecs": grouped["failed"].sum(),
+        })
+        stats = stats.rename_axis("Étape").reset_index()
+        return stats.sort_values("Total (s)", ascending=False, ignore_index=True)
+    
+    def to_json_lines(self):
+        """
+        Sérialise les mesures conservées en mémoire au format JSON lines.
+        
+        Returns:
+            str: Une mesure JSON par ligne
+        """
+        return "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.snapshot())
+    
+    def to_prometheus(self):
+        """
+        Formate les mesures au format texte d'exposition de Prometheus : un résumé des durées
+        par étape (p50 et p95 sur les mesures en mémoire, somme et nombre cumulés), les octets
+        traités et le nombre d'échecs.
+        
+        Returns:
+            str: Le texte à exposer
+        """
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        
+        stats = self.stage_statistics().set_index("Étape")
+        with self._lock:
+            totals = {stage: list(values) for stage, values in self.totals.items()}
+        
+        lines = [
+            "# HELP sfcr_stage_duration_seconds Durée des étapes du traitement des rapports SFCR",
+            "# TYPE sfcr_stage_duration_seconds summary",
+        ]
+        for stage, (count, seconds, _, _) in totals.items():
+            name = label(stage)
+            if stage in stats.index:
+                lines.append(f'sfcr_stage_duration_seconds{{stage="{name}",quantile="0.5"}} {stats.at[stage, "p50 (s)"]:.6f}')
+                lines.append(f'sfcr_stage_duration_seconds{{stage="{name}",quantile="0.95"}} {stats.at[stage, "p95 (s)"]:.6f}')
+            lines.append(f'sfcr_stage_duration_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+            lines.append(f'sfcr_stage_duration_seconds_count{{stage="{name}"}} {count}')
+        lines += [
+            "# HELP sfcr_stage_bytes_total Octets traités par étape",
+            "# TYPE sfcr_stage_bytes_total counter",
+        ]
+        lines += [f'sfcr_stage_bytes_total{{stage="{label(stage)}"}} {values[2]}' for stage, values in totals.items()]
+        lines += [
+            "# HELP sfcr_stage_failures_total Étapes terminées par une erreur",
+            "# TYPE sfcr_stage_failures_total counter",
+        ]
+        lines += [f'sfcr_stage_failures_total{{stage="{label(stage)}"}} {values[3]}' for stage, values in totals.items()]
+        return "\n".join(lines) + "\n"
+    
+    def export_prometheus(self, path=None):
+        """
+        Écrit le fichier texte Prometheus (collecteur textfile de node_exporter), de façon
+        atomique. Sans effet si aucun fichier n'est configuré ou si la mesure est désactivée.
+        
+        Args:
+            path (str, optional): Le chemin du fichier (celui du registre par défaut)
+        """
+        path = path or self.prometheus_file
+        if not path or not self.enabled:
+            return
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("Impossible d'écrire les mesures Prometheus dans %s : %s", path, e)
+
+perf_recorder = PerfRecorder()
+
+def timed(stage, document=None, size=None):
+    """
+    Mesure une étape du traitement avec le registre partagé, dans un bloc with.
+    
+    Args:
+        stage (str): Le nom de l'étape
+        document (str, optional): Le nom du document traité
+        size (int, optional): La taille des données traitées, en octets
+    
+    Returns:
+        StageTimer: Le chronomètre de l'étape (sans effet si la mesure est désactivée)
+    """
+    return perf_recorder.timer(stage, document, size)
+
+_cache_db_lock = threading.Lock()
+_cache_db_ready = False
+
+def open_cache_db():
+    """
+    Ouvre une connexion vers la base SQLite du cache local et crée les tables si besoin.
+    
+    Returns:
+        sqlite3.Connection: Une nouvelle connexion, à fermer par l'appelant
+    """
+    global _cache_db_ready
+    conn = None
+    with _cache_db_lock:
+        if not _cache_db_ready:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            conn = sqlite3.connect(CACHE_DB_PATH, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS source_ids (
+                    doc_hash TEXT PRIMARY KEY,
+                    source_id TEXT NOT NULL,
+                    file_name TEXT,
+                    uploaded_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache_key TEXT PRIMARY KEY,
+                    doc_hash TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at);
+                CREATE TABLE IF NOT EXISTS page_selections (
+                    source_key TEXT PRIMARY KEY,
+                    doc_hash TEXT NOT NULL,
+                    file_name TEXT,
+                    pages TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            conn.commit()
+            _cache_db_ready = True
+    return conn or sqlite3.connect(CACHE_DB_PATH, timeout=30)
+
+def document_name(uploaded_file):
+    """
+    Retourne le nom d'un fichier PDF, sans son chemin.
+    
+    Args:
+        uploaded_file: Un objet fichier binaire (fichier Streamlit ou fichier ouvert avec open)
+    
+    Returns:
+        str: Le nom du fichier
+    """
+    return os.path.basename(getattr(uploaded_file, "name", "") or "document.pdf")
+
+def format_size(size):
+    """
+    Formate une taille en octets de façon lisible.
+    
+    Args:
+        size (int): La taille en octets
+    
+    Returns:
+        str: La taille en Ko ou en Mo, par exemple "12,4 Mo"
+    """
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} Ko"
+    return f"{size / (1024 * 1024):.1f} Mo".replace(".", ",")
+
+def compute_file_hash(uploaded_file, chunk_size=1024 * 1024):
+    """
+    Calcule l'empreinte SHA-256 du contenu d'un fichier, lu par blocs.
+    
+    Args:
+        uploaded_file: Un objet fichier binaire (par exemple obtenu via st.file_uploader)
+        chunk_size (int): La taille des blocs lus
+    
+    Returns:
+        str: L'empreinte SHA-256 en hexadécimal
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for chunk in iter(lambda: uploaded_file.read(chunk_size), b""):
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+def get_cached_source_id(doc_hash):
+    """
+    Retourne le sourceId ChatPDF déjà associé à un document, s'il n'a pas expiré.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+    
+    Returns:
+        str: Le sourceId en cache, ou None s'il est absent ou expiré
+    """
+    now = time.time()
+    conn = open_cache_db()
+    try:
+        row = conn.execute(
+            "SELECT source_id, uploaded_at FROM source_ids WHERE doc_hash = ?", (doc_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > SOURCE_ID_TTL_SECONDS:
+            conn.execute("DELETE FROM source_ids WHERE doc_hash = ?", (doc_hash,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE source_ids SET last_used_at = ? WHERE doc_hash = ?", (now, doc_hash))
+        conn.commit()
+        return row[0]
+    finally:
+        conn.close()
+
+def store_source_id(doc_hash, source_id, file_name=None):
+    """
+    Enregistre le sourceId d'un document et applique la politique d'éviction du cache :
+    suppression des entrées expirées puis des moins récemment utilisées au-delà de
+    SOURCE_CACHE_MAX_ENTRIES.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        source_id (str): L'identifiant source renvoyé par ChatPDF
+        file_name (str, optional): Le nom du fichier, à titre informatif
+    """
+    now = time.time()
+    conn = open_cache_db()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO source_ids (doc_hash, source_id, file_name, uploaded_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (doc_hash, source_id, file_name, now, now)
+        )
+        conn.execute("DELETE FROM source_ids WHERE uploaded_at < ?", (now - SOURCE_ID_TTL_SECONDS,))
+        conn.execute(
+            "DELETE FROM source_ids WHERE doc_hash NOT IN "
+            "(SELECT doc_hash FROM source_ids ORDER BY last_used_at DESC LIMIT ?)",
+            (SOURCE_CACHE_MAX_ENTRIES,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def invalidate_source_id(doc_hash):
+    """
+    Supprime du cache le sourceId d'un document, par exemple lorsque ChatPDF ne le reconnaît plus.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+    """
+    conn = open_cache_db()
+    try:
+        conn.execute("DELETE FROM source_ids WHERE doc_hash = ?", (doc_hash,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def page_selection_key(doc_hash, pages):
+    """
+    Construit la clé de cache d'une source ChatPDF limitée à une sélection de pages.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document d'origine
+        pages (list): Les numéros (à partir de 0) des pages retenues
+    
+    Returns:
+        str: La clé de la source
+    """
+    return f"{doc_hash}/pages:{format_page_ranges(pages)}"
+
+def record_page_selection(doc_hash, pages, page_count, file_name=None):
+    """
+    Conserve la liste des pages d'origine envoyées à ChatPDF, pour audit.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document d'origine
+        pages (list): Les numéros (à partir de 0) des pages retenues
+        page_count (int): Le nombre total de pages du document
+        file_name (str, optional): Le nom du fichier
+    """
+    conn = open_cache_db()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO page_selections (source_key, doc_hash, file_name, pages, page_count, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (page_selection_key(doc_hash, pages), doc_hash, file_name, json.dumps([page + 1 for page in pages]),
+             page_count, time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+_response_cache_stats = {"hits": 0, "misses": 0}
+_response_cache_stats_lock = threading.Lock()
+
+def response_cache_key(doc_hash, question, prompt=None):
+    """
+    Construit la clé du cache des réponses pour un document, un prompt et une question.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        question (str): La question posée
+        prompt (str, optional): Le prompt utilisé
+    
+    Returns:
+        str: La clé de cache (empreinte SHA-256)
+    """
+    payload = json.dumps([CHAT_BACKEND, doc_hash, prompt or "", question], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_response(doc_hash, question, prompt=None):
+    """
+    Retourne la réponse en cache pour un document, un prompt et une question.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        question (str): La question posée
+        prompt (str, optional): Le prompt utilisé
+    
+    Returns:
+        str: La réponse en cache, ou None si elle est absente
+    """
+    cache_key = response_cache_key(doc_hash, question, prompt)
+    conn = open_cache_db()
+    try:
+        row = conn.execute("SELECT content FROM responses WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE responses SET last_used_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+            conn.commit()
+    finally:
+        conn.close()
+    
+    with _response_cache_stats_lock:
+        _response_cache_stats["hits" if row is not None else "misses"] += 1
+    return row[0] if row is not None else None
+
+def store_response(doc_hash, question, content, prompt=None):
+    """
+    Enregistre une réponse dans le cache puis supprime les réponses les moins récemment
+    utilisées tant que la taille totale dépasse RESPONSE_CACHE_MAX_BYTES.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        question (str): La question posée
+        content (str): La réponse de ChatPDF
+        prompt (str, optional): Le prompt utilisé
+    """
+    now = time.time()
+    conn = open_cache_db()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (cache_key, doc_hash, content, size, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (response_cache_key(doc_hash, question, prompt), doc_hash, content,
+             len(content.encode("utf-8")), now, now)
+        )
+        conn.execute(
+            "DELETE FROM responses WHERE cache_key IN ("
+            "SELECT cache_key FROM (SELECT cache_key, SUM(size) OVER (ORDER BY last_used_at DESC) AS cumulated "
+            "FROM responses) WHERE cumulated > ?)",
+            (RESPONSE_CACHE_MAX_BYTES,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_response_cache_stats():
+    """
+    Retourne les compteurs du cache des réponses depuis le démarrage de l'application.
+    
+    Returns:
+        dict: Le nombre de succès ("hits"), d'échecs ("misses"), d'entrées ("entries")
+              et la taille occupée en octets ("size")
+    """
+    conn = open_cache_db()
+    try:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    finally:
+        conn.close()
+    with _response_cache_stats_lock:
+        stats = dict(_response_cache_stats)
+    stats.update({"entries": entries, "size": size})
+    return stats
+
+def get_or_upload_source(uploaded_file, force_upload=False, pages=None, on_progress=None,
+                         priority=PRIORITY_BACKGROUND, doc_hash=None):
+    """
+    Retourne le sourceId ChatPDF d'un fichier en réutilisant le cache local si possible.
+    Le fichier n'est téléversé que s'il est inconnu, si son sourceId a expiré ou si
+    force_upload est vrai. Si pages est fourni, seul un PDF allégé contenant ces pages
+    est téléversé, sous une clé de cache distincte du document complet.
+    
+    Args:
+        uploaded_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        force_upload (bool): Si True, ignore le cache et téléverse à nouveau le fichier
+        pages (list, optional): Les numéros (à partir de 0) des pages à envoyer
+        on_progress (callable, optional): Fonction appelée avec (octets envoyés, octets au total)
+            pendant le téléversement
+        priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND
+        doc_hash (str, optional): L'empreinte SHA-256 du document, si elle est déjà calculée
+    
+    Returns:
+        tuple: (clé de la source, sourceId, True si le sourceId provient du cache). La clé
+               est l'empreinte du document, complétée par les pages retenues le cas échéant.
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'erreur lors du téléversement
+    """
+    if doc_hash is None:
+        doc_hash = compute_file_hash(uploaded_file)
+    source_key = doc_hash if pages is None else page_selection_key(doc_hash, pages)
+    if not force_upload:
+        source_id = get_cached_source_id(source_key)
+        if source_id:
+            return source_key, source_id, True
+    
+    if pages is None:
+        source_id = upload_pdf(uploaded_file, on_progress=on_progress, priority=priority)
+    else:
+        with timed("Découpage du PDF", document_name(uploaded_file)) as timer:
+            subset = build_pdf_subset(uploaded_file, pages)
+            timer.size = subset.seek(0, os.SEEK_END)
+            subset.seek(0)
+        try:
+            source_id = get_chatpdf_client().add_file(
+                document_name(uploaded_file), subset, on_progress=on_progress, priority=priority
+            )
+        finally:
+            subset.close()
+    store_source_id(source_key, source_id, document_name(uploaded_file))
+    return source_key, source_id, False
+
+def is_unknown_source_error(error):
+    """
+    Indique si une erreur de requête signifie que ChatPDF ne connaît plus le sourceId.
+    
+    Args:
+        error (Exception): L'exception levée par la requête
+    
+    Returns:
+        bool: True si le document doit être téléversé à nouveau
+    """
+    return (
+        isinstance(error, requests.exceptions.HTTPError)
+        and error.response is not None
+        and error.response.status_code in SOURCE_NOT_FOUND_STATUS
+    )
+
+class MultipartFileStream:
+    """
+    Corps multipart/form-data d'un téléversement, produit à la demande par blocs.
+    
+    Contrairement à requests.post(files=...), qui construit tout le corps en mémoire,
+    seul un bloc du fichier est lu à la fois : la mémoire utilisée pendant le téléversement
+    ne dépend pas de la taille du PDF. La longueur totale est connue à l'avance (en-tête
+    Content-Length) et le flux peut être rembobiné pour une nouvelle tentative.
+    
+    Args:
+        field_name (str): Le nom du champ du formulaire
+        file_name (str): Le nom du fichier transmis
+        fileobj: Le fichier à envoyer (objet fichier binaire avec seek et tell)
+        content_type (str): Le type MIME du fichier
+        on_progress (callable, optional): Fonction appelée avec (octets envoyés, octets au total)
+        chunk_size (int): La taille maximale d'un bloc lu dans le fichier
+    """
+    
+    def __init__(self, field_name, file_name, fileobj, content_type="application/pdf", on_progress=None,
+                 chunk_size=UPLOAD_CHUNK_SIZE):
+        self.boundary = os.urandom(16).hex()
+        safe_name = file_name.replace("\\", "_").replace('"', "_").replace("\r", "_").replace("\n", "_")
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{safe_name}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self.fileobj = fileobj
+        self.on_progress = on_progress
+        self.chunk_size = chunk_size
+        fileobj.seek(0, os.SEEK_END)
+        self.file_size = fileobj.tell()
+        self.length = len(self.head) + self.file_size + len(self.tail)
+        self.seek(0)
+    
+    @property
+    def content_type(self):
+        """
+        Returns:
+            str: La valeur de l'en-tête Content-Type, avec la délimitation des parties
+        """
+        return f"multipart/form-data; boundary={self.boundary}"
+    
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Replace le flux au début ; seul le retour au début est pris en charge.
+        """
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("MultipartFileStream ne peut être replacé qu'au début")
+        self.position = 0
+        self.fileobj.seek(0)
+        return 0
+    
+    def tell(self):
+        return self.position
+    
+    def read(self, size=-1):
+        """
+        Lit la suite du corps multipart.
+        
+        Args:
+            size (int): Le nombre maximal d'octets à lire (-1 : un bloc de chunk_size octets)
+        
+        Returns:
+            bytes: Les octets lus, vides à la fin du corps
+        """
+        if size is None or size < 0:
+            size = self.chunk_size
+        data = b""
+        file_end = len(self.head) + self.file_size
+        if self.position < len(self.head):
+            data = self.head[self.position:self.position + size]
+        elif self.position < file_end:
+            data = self.fileobj.read(min(size, file_end - self.position, self.chunk_size))
+            if not data:
+                raise OSError("Fin de fichier inattendue pendant le téléversement")
+        elif self.position < self.length:
+            offset = self.position - file_end
+            data = self.tail[offset:offset + size]
+        
+        self.position += len(data)
+        if data and self.on_progress is not None:
+            self.on_progress(self.position, self.length)
+        return data
+
+class RequestScheduler:
+    """
+    Ordonnanceur des requêtes envoyées à ChatPDF, partagé par tous les threads du processus.
+    
+    Chaque tentative d'appel obtient d'abord une autorisation : un jeton du seau à jetons
+    (débit moyen et rafale du forfait) et une place parmi les requêtes simultanées. Les
+    demandes en attente sont servies par priorité, puis dans l'ordre d'arrivée : une question
+    posée depuis l'interface passe devant l'extraction en arrière-plan, à laquelle une place
+    reste interdite pour la lui garder.
+    
+    Le nombre de requêtes simultanées s'adapte (augmentation additive, diminution
+    multiplicative) : il est divisé par deux à chaque réponse 429, réduit lorsque le serveur
+    ralentit ou échoue, et remonte progressivement tant que les réponses sont rapides.
+    
+    Args:
+        rate_per_minute (float): Le débit moyen autorisé, en requêtes par minute (0 : illimité)
+        burst (int): Le nombre de requêtes pouvant partir d'un coup, seau plein
+        max_concurrency (int): Le nombre maximal de requêtes simultanées
+        min_concurrency (int): Le nombre minimal de requêtes simultanées
+        reserved_slots (int): Le nombre de places gardées pour les questions interactives
+    """
+    
+    def __init__(self, rate_per_minute=CHATPDF_RATE_LIMIT_PER_MINUTE, burst=CHATPDF_RATE_BURST,
+                 max_concurrency=CHATPDF_MAX_CONCURRENCY, min_concurrency=1,
+                 reserved_slots=INTERACTIVE_RESERVED_SLOTS):
+        self.rate = max(0.0, rate_per_minute) / 60.0
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.reserved_slots = reserved_slots
+        self.in_flight = 0
+        self.waiting = []
+        self.sequence = 0
+        self.latencies = {}
+        self.throttled = 0
+        self._condition = threading.Condition()
+    
+    def _refill(self, now):
+        # Appelée sous self._condition
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def _slots(self, priority):
+        # Appelée sous self._condition
+        slots = int(self.limit)
+        if priority > PRIORITY_INTERACTIVE:
+            slots = max(1, slots - self.reserved_slots)
+        return slots
+    
+    def acquire(self, priority=PRIORITY_BACKGROUND):
+        """
+        Attend l'autorisation d'envoyer une requête ; release() doit être appelée ensuite.
+        
+        Args:
+            priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND (la plus petite passe en premier)
+        """
+        with self._condition:
+            ticket = (priority, self.sequence)
+            self.sequence += 1
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    timeout = None
+                    if self.waiting[0] == ticket and self.in_flight < self._slots(priority):
+                        if not self.rate or self.tokens >= 1:
+                            heapq.heappop(self.waiting)
+                            if self.rate:
+                                self.tokens -= 1
+                            self.in_flight += 1
+                            self._condition.notify_all()
+                            return
+                        timeout = (1 - self.tokens) / self.rate
+                    self._condition.wait(timeout)
+            except BaseException:
+                if ticket in self.waiting:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self._condition.notify_all()
+                raise
+    
+    def release(self, endpoint, status_code, elapsed):
+        """
+        Libère la place d'une requête terminée et ajuste le nombre de requêtes simultanées.
+        
+        Args:
+            endpoint (str): Le chemin de l'appel
+            status_code (int): Le code HTTP reçu, ou None en cas d'erreur réseau
+            elapsed (float): La durée de la tentative, en secondes
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status_code == 429:
+                # Quota dépassé : moitié moins de requêtes simultanées et seau vidé
+                self.throttled += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self.tokens = min(self.tokens, 0.0)
+            elif status_code is None or status_code >= 500:
+                self.limit = max(self.min_concurrency, self.limit * 0.75)
+            else:
+                average, count = self.latencies.get(endpoint, (elapsed, 0))
+                if count >= SCHEDULER_MIN_SAMPLES and elapsed > SCHEDULER_SLOW_FACTOR * average:
+                    self.limit = max(self.min_concurrency, self.limit * 0.75)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.latencies[endpoint] = (0.8 * average + 0.2 * elapsed, count + 1)
+            self._condition.notify_all()
+    
+    def stats(self):
+        """
+        Retourne l'état courant de l'ordonnanceur.
+        
+        Returns:
+            dict: Places autorisées ("limit"), requêtes en cours ("in_flight"), demandes en attente
+                  ("waiting", dont "waiting_interactive") et réponses 429 reçues ("throttled")
+        """
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self.waiting),
+                "waiting_interactive": sum(1 for priority, _ in self.waiting if priority <= PRIORITY_INTERACTIVE),
+                "throttled": self.throttled,
+            }
+
+class ChatPDFClient:
+    """
+    Client HTTP partagé vers l'API ChatPDF.
+    
+    Réutilise les connexions (keep-alive) via une session et un pool de connexions,
+    applique des délais maximaux de connexion et de lecture, et relance les requêtes
+    en échec (429, erreurs 5xx, erreurs réseau) avec un délai exponentiel aléatoire qui
+    respecte l'en-tête Retry-After. La durée de chaque appel est conservée. Chaque tentative
+    passe par l'ordonnanceur des requêtes (débit, priorité et nombre de requêtes simultanées).
+    
+    Args:
+        base_url (str): L'URL de base de l'API
+        api_key (str): La clé d'API ChatPDF
+        connect_timeout (float): Le délai maximal d'établissement de la connexion, en secondes
+        read_timeout (float): Le délai maximal d'attente de la réponse, en secondes
+        max_retries (int): Le nombre maximal de nouvelles tentatives par appel
+        pool_size (int): Le nombre maximal de connexions conservées ouvertes
+        backoff_base (float): Le délai de base entre deux tentatives, en secondes
+        backoff_max (float): Le délai maximal entre deux tentatives, en secondes
+        scheduler (RequestScheduler, optional): L'ordonnanceur des requêtes (un nouveau par défaut)
+    """
+    
+    def __init__(self, base_url=CHATPDF_BASE_URL, api_key=API_KEY, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, pool_size=HTTP_POOL_SIZE,
+                 backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX, scheduler=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latencies = deque(maxlen=1000)
+        self.scheduler = scheduler or RequestScheduler()
+        self._lock = threading.Lock()
+    
+    def retry_delay(self, attempt, response=None):
+        """
+        Calcule le délai avant la tentative suivante.
+        
+        Args:
+            attempt (int): Le numéro de la tentative qui vient d'échouer (à partir de 0)
+            response (Response, optional): La réponse en échec, pour lire l'en-tête Retry-After
+        
+        Returns:
+            float: Le délai d'attente en secondes
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                wait_seconds = float(retry_after)
+            except ValueError:
+                try:
+                    wait_seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    wait_seconds = 0
+            delay = max(delay, min(wait_seconds, self.backoff_max))
+        return delay
+    
+    def post(self, endpoint, rewind=None, priority=PRIORITY_BACKGROUND, **kwargs):
+        """
+        Envoie une requête POST à l'API en relançant les échecs temporaires.
+        
+        Args:
+            endpoint (str): Le chemin de l'appel, par exemple "/chats/message"
+            rewind: Un fichier à replacer au début avant chaque tentative, si le corps en contient un
+            priority (int): La priorité de la requête auprès de l'ordonnanceur
+            **kwargs: Les arguments transmis à requests.Session.post
+        
+        Returns:
+            Response: La réponse HTTP en succès
+        
+        Raises:
+            requests.exceptions.RequestException: Si la requête échoue après toutes les tentatives
+        """
+        headers = {"x-api-key": self.api_key}
+        headers.update(kwargs.pop("headers", {}))
+        start = time.perf_counter()
+        attempt = 0
+        
+        while True:
+            if rewind is not None:
+                rewind.seek(0)
+            response = None
+            try:
+                self.scheduler.acquire(priority)
+                sent = time.perf_counter()
+                held = False
+                try:
+                    response = self.session.post(
+                        self.base_url + endpoint, headers=headers, timeout=self.timeout, **kwargs
+                    )
+                    if kwargs.get("stream") and response.ok:
+                        self.hold_slot(response, endpoint, sent)
+                        held = True
+                finally:
+                    if not held:
+                        self.scheduler.release(
+                            endpoint, response.status_code if response is not None else None,
+                            time.perf_counter() - sent
+                        )
+                if response.status_code not in HTTP_RETRY_STATUS or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    self.record_latency(endpoint, response.status_code, attempt + 1, start)
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    self.record_latency(endpoint, None, attempt + 1, start)
+                    raise
+            except requests.exceptions.HTTPError:
+                self.record_latency(endpoint, response.status_code, attempt + 1, start)
+                # Corps d'erreur lu avant la fermeture (réponse en flux) : il reste consultable
+                # par l'appelant et la connexion retourne au pool
+                response.content
+                response.close()
+                raise
+            
+            if response is not None:
+                response.close()
+            time.sleep(self.retry_delay(attempt, response))
+            attempt += 1
+    
+    def hold_slot(self, response, endpoint, sent):
+        """
+        Garde la place d'une réponse reçue en flux auprès de l'ordonnanceur jusqu'à la fermeture
+        de la réponse : la génération se poursuit côté serveur après les en-têtes. La durée
+        transmise à l'ordonnanceur est alors celle de la réponse entière.
+        
+        Args:
+            response (Response): La réponse ouverte en flux
+            endpoint (str): Le chemin de l'appel
+            sent (float): L'instant d'envoi de la requête (time.perf_counter)
+        """
+        close = response.close
+        lock = threading.Lock()
+        released = [False]
+        
+        def close_and_release():
+            with lock:
+                first_close = not released[0]
+                released[0] = True
+            if first_close:
+                self.scheduler.release(endpoint, response.status_code, time.perf_counter() - sent)
+            close()
+        
+        response.close = close_and_release
+    
+    def record_latency(self, endpoint, status_code, attempts, start):
+        """
+        Enregistre la durée d'un appel, tentatives et attentes comprises.
+        
+        Args:
+            endpoint (str): Le chemin de l'appel
+            status_code (int): Le code HTTP final, ou None en cas d'erreur réseau
+            attempts (int): Le nombre de tentatives effectuées
+            start (float): L'instant de début de l'appel (time.perf_counter)
+        """
+        with self._lock:
+            self.latencies.append({
+                "Appel": endpoint,
+                "Statut": status_code,
+                "Tentatives": attempts,
+                "Durée (s)": round(time.perf_counter() - start, 3),
+            })
+    
+    def latency_records(self):
+        """
+        Retourne la liste des durées des derniers appels.
+        
+        Returns:
+            list: Une liste de dictionnaires (appel, statut, tentatives, durée)
+        """
+        with self._lock:
+            return list(self.latencies)
+    
+    def add_file(self, file_name, fileobj, on_progress=None, priority=PRIORITY_BACKGROUND):
+        """
+        Téléverse un fichier PDF en flux et retourne son identifiant source.
+        
+        Args:
+            file_name (str): Le nom du fichier
+            fileobj: Le contenu du fichier (objet fichier binaire)
+            on_progress (callable, optional): Fonction appelée avec (octets envoyés, octets au total)
+            priority (int): La priorité de la requête auprès de l'ordonnanceur
+        
+        Returns:
+            str: L'identifiant source (sourceId)
+        """
+        body = MultipartFileStream("file", file_name, fileobj, on_progress=on_progress)
+        with timed("Téléversement", file_name, len(body)):
+            response = self.post(
+                "/sources/add-file", rewind=body, priority=priority, data=body,
+                headers={"Content-Type": body.content_type}
+            )
+            return response.json()["sourceId"]
+    
+    def send_message(self, source_id, messages, priority=PRIORITY_BACKGROUND):
+        """
+        Envoie des messages à propos d'un document et retourne la réponse.
+        
+        Args:
+            source_id (str): L'identifiant source du PDF
+            messages (list): Les messages (rôle et contenu) à envoyer
+            priority (int): La priorité de la requête auprès de l'ordonnanceur
+        
+        Returns:
+            str: Le contenu de la réponse
+        """
+        data = {"sourceId": source_id, "messages": messages}
+        response = self.post("/chats/message", priority=priority, json=data)
+        return response.json()["content"]
+    
+    def stream_message(self, source_id, messages, priority=PRIORITY_INTERACTIVE):
+        """
+        Envoie des messages à propos d'un document en demandant une réponse en flux.
+        Les nouvelles tentatives ne portent que sur l'ouverture du flux. La place occupée
+        auprès de l'ordonnanceur n'est libérée qu'à la fermeture de la réponse.
+        
+        Args:
+            source_id (str): L'identifiant source du PDF
+            messages (list): Les messages (rôle et contenu) à envoyer
+            priority (int): La priorité de la requête auprès de l'ordonnanceur
+        
+        Returns:
+            Response: La réponse HTTP ouverte, dont le texte est lu par fragments
+                      (iter_content) ; à fermer par l'appelant, même lue en entier
+        """
+        data = {"sourceId": source_id, "messages": messages, "stream": True}
+        response = self.post("/chats/message", priority=priority, json=data, stream=True)
+        if "charset" not in response.headers.get("Content-Type", ""):
+            response.encoding = "utf-8"
+        return response
+
+_chatpdf_client = None
+_chatpdf_client_lock = threading.Lock()
+
+def get_chatpdf_client():
+    """
+    Retourne le client ChatPDF partagé par toutes les sessions et tous les threads du processus,
+    afin de conserver les connexions ouvertes d'une exécution à l'autre.
+    
+    Returns:
+        ChatPDFClient: Le client partagé
+    """
+    global _chatpdf_client
+    with _chatpdf_client_lock:
+        if _chatpdf_client is None:
+            _chatpdf_client = ChatPDFClient()
+        return _chatpdf_client
+
+def upload_pdf(uploaded_file, on_progress=None, priority=PRIORITY_BACKGROUND):
+    """
+    Télécharge un fichier PDF vers l'API ChatPDF, sans gestion d'erreur.
+    Le fichier est envoyé en flux, par blocs, sans être copié en mémoire.
+    
+    Cette fonction peut être exécutée depuis un thread de travail.
+    
+    Args:
+        uploaded_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        on_progress (callable, optional): Fonction appelée avec (octets envoyés, octets au total)
+        priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND
+    
+    Returns:
+        str: L'identifiant source (source_id) du PDF dans l'API ChatPDF
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'erreur de la requête
+    """
+    return get_chatpdf_client().add_file(
+        document_name(uploaded_file), uploaded_file, on_progress=on_progress, priority=priority
+    )
+
+def request_chat_response(source_id, question, prompt=None, priority=PRIORITY_BACKGROUND):
+    """
+    Envoie une question à l'API ChatPDF et retourne la réponse, sans gestion d'erreur.
+    
+    Cette fonction peut être exécutée depuis un thread de travail.
+    
+    Args:
+        source_id (str): L'identifiant source du PDF
+        question (str): La question à poser
+        prompt (str, optional): Un prompt spécifique à utiliser
+        priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND
+    
+    Returns:
+        str: La réponse de l'API ChatPDF
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'erreur de la requête
+    """
+    return get_chatpdf_client().send_message(source_id, build_chat_messages(question, prompt), priority=priority)
+
+def build_chat_messages(question, prompt=None):
+    """
+    Construit les messages envoyés à ChatPDF : le prompt éventuel, puis la question.
+    
+    Args:
+        question (str): La question à poser
+        prompt (str, optional): Un prompt spécifique à utiliser
+    
+    Returns:
+        list: Les messages (rôle et contenu)
+    """
+    messages = []
+    if prompt:
+        messages.append({"role": "assistant", "content": prompt})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+def get_chat_response(source_id, question, prompt=None, doc_hash=None, use_cache=True, priority=PRIORITY_BACKGROUND):
+    """
+    Retourne la réponse de ChatPDF à une question en passant par le cache disque des réponses.
+    Le cache n'est utilisé que si l'empreinte du document est connue.
+    
+    Args:
+        source_id (str or callable): L'identifiant source du PDF, ou une fonction sans argument
+            qui le retourne, appelée seulement si la réponse n'est pas en cache (téléversement différé)
+        question (str): La question à poser
+        prompt (str, optional): Un prompt spécifique à utiliser
+        doc_hash (str, optional): L'empreinte SHA-256 du document
+        use_cache (bool): Si False, interroge toujours ChatPDF (la réponse est tout de même mise en cache)
+        priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND
+    
+    Returns:
+        str: La réponse de l'API ChatPDF
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'erreur de la requête
+    """
+    if doc_hash and use_cache:
+        content = get_cached_response(doc_hash, question, prompt)
+        if content is not None:
+            return content
+    
+    if callable(source_id):
+        source_id = source_id()
+    content = request_chat_response(source_id, question, prompt=prompt, priority=priority)
+    if doc_hash and content:
+        store_response(doc_hash, question, content, prompt)
+    return content
+
+def chat_with_uploaded_pdf(uploaded_file, question, prompt=None, use_cache=True, priority=PRIORITY_INTERACTIVE):
+    """
+    Pose une question sur un fichier PDF en réutilisant son sourceId en cache.
+    Une réponse déjà en cache est rendue sans téléverser le fichier. Si ChatPDF ne reconnaît plus le sourceId en cache, le fichier est téléversé à nouveau
+    et la question est reposée une fois.
+    
+    Args:
+        uploaded_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        question (str): La question à poser
+        prompt (str, optional): Un prompt spécifique à utiliser
+        use_cache (bool): Si False, ignore le cache des réponses
+        priority (int): PRIORITY_INTERACTIVE (par défaut, question posée depuis l'interface)
+            ou PRIORITY_BACKGROUND
+    
+    Returns:
+        str: La réponse de l'API ChatPDF
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'erreur de la requête
+    """
+    doc_hash = compute_file_hash(uploaded_file)
+    if use_cache:
+        cached = get_cached_response(doc_hash, question, prompt)
+        if cached is not None:
+            return cached
+    
+    _, source_id, from_cache = get_or_upload_source(uploaded_file, priority=priority, doc_hash=doc_hash)
+    try:
+        return get_chat_response(
+            source_id, question, prompt=prompt, doc_hash=doc_hash, use_cache=use_cache, priority=priority
+        )
+    except requests.exceptions.RequestException as e:
+        if not (from_cache and is_unknown_source_error(e)):
+            raise
+    
+    invalidate_source_id(doc_hash)
+    _, source_id, _ = get_or_upload_source(uploaded_file, force_upload=True, priority=priority, doc_hash=doc_hash)
+    return get_chat_response(
+        source_id, question, prompt=prompt, doc_hash=doc_hash, use_cache=use_cache, priority=priority
+    )
+
+class ChatStream:
+    """
+    Réponse de ChatPDF à une question sur un fichier PDF, reçue en flux : l'itération produit
+    les fragments de texte au fur et à mesure de leur arrivée (utilisable avec st.write_stream).
+    
+    Le sourceId en cache est réutilisé (nouveau téléversement si ChatPDF ne le reconnaît plus)
+    et une réponse déjà en cache est rendue d'un seul fragment. Une réponse reçue en entier
+    est mise en cache ; une itération interrompue (close(), cancel() depuis un autre thread, ou
+    abandon du générateur) ferme la connexion. Le délai avant le premier fragment (téléversement
+    compris) et la durée totale sont enregistrés dans les mesures de performance.
+    
+    Attributs renseignés pendant l'itération : text (texte reçu), ttft (secondes avant le
+    premier fragment), elapsed (durée totale), complete (réponse reçue en entier),
+    from_cache (réponse lue dans le cache) et cancelled (annulation demandée).
+    
+    Args:
+        uploaded_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        question (str): La question à poser
+        prompt (str, optional): Un prompt spécifique à utiliser
+        use_cache (bool): Si False, ignore le cache des réponses
+        priority (int): PRIORITY_INTERACTIVE (par défaut) ou PRIORITY_BACKGROUND
+    """
+    
+    def __init__(self, uploaded_file, question, prompt=None, use_cache=True, priority=PRIORITY_INTERACTIVE):
+        self.uploaded_file = uploaded_file
+        self.question = question
+        self.prompt = prompt
+        self.use_cache = use_cache
+        self.priority = priority
+        self.chunks = []
+        self.ttft = None
+        self.elapsed = None
+        self.complete = False
+        self.from_cache = False
+        self.cancelled = threading.Event()
+        self._iterator = None
+        self._response = None
+    
+    @property
+    def text(self):
+        """
+        Le texte reçu jusqu'ici.
+        """
+        return "".join(self.chunks)
+    
+    def __iter__(self):
+        if self._iterator is None:
+            self._iterator = self._stream()
+        return self._iterator
+    
+    def close(self):
+        """
+        Interrompt la réception de la réponse et ferme la connexion.
+        À appeler depuis le thread qui itère ; depuis un autre thread, utiliser cancel().
+        """
+        if self._iterator is not None:
+            self._iterator.close()
+    
+    def cancel(self):
+        """
+        Annule la réponse depuis n'importe quel thread, y compris avant le premier fragment, sans
+        attendre : la connexion ouverte est fermée par un thread séparé (la fermeture attend la
+        fin d'une lecture en cours), ce qui libère aussitôt sa place auprès de l'ordonnanceur,
+        et l'itération s'arrête sans erreur, sans mettre la réponse en cache.
+        """
+        self.cancelled.set()
+        response = self._response
+        if response is not None:
+            threading.Thread(target=response.close, daemon=True).start()
+    
+    def poll(self, timeout):
+        """
+        Itère sur la réponse depuis un thread séparé et produit None chaque fois qu'aucun
+        fragment n'est arrivé pendant timeout secondes : l'appelant reste réactif (affichage
+        de l'attente, annulation) même avant le premier fragment. L'abandon de l'itération
+        annule la réponse.
+        
+        Args:
+            timeout (float): Le délai d'attente d'un fragment, en secondes
+        
+        Yields:
+            str: Les fragments de texte, ou None après chaque délai sans fragment
+        
+        Raises:
+            requests.exceptions.RequestException: En cas d'erreur de la requête
+        """
+        fragments = queue.Queue()
+        
+        def read():
+            try:
+                for chunk in self:
+                    fragments.put((chunk, None))
+            except Exception as e:
+                # Transmise telle quelle au thread appelant
+                fragments.put((None, e))
+                return
+            fragments.put((None, None))
+        
+        threading.Thread(target=read, daemon=True).start()
+        try:
+            while True:
+                try:
+                    chunk, error = fragments.get(timeout=timeout)
+                except queue.Empty:
+                    yield None
+                    continue
+                if error is not None:
+                    raise error
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.cancel()
+    
+    def _open(self, source_id):
+        return get_chatpdf_client().stream_message(
+            source_id, build_chat_messages(self.question, self.prompt), priority=self.priority
+        )
+    
+    def _stream(self):
+        name = document_name(self.uploaded_file)
+        start = time.perf_counter()
+        doc_hash = compute_file_hash(self.uploaded_file)
+        if self.use_cache:
+            cached = get_cached_response(doc_hash, self.question, self.prompt)
+            if cached is not None:
+                self.chunks.append(cached)
+                self.ttft = self.elapsed = time.perf_counter() - start
+                self.complete = self.from_cache = True
+                yield cached
+                return
+        
+        _, source_id, from_cache = get_or_upload_source(self.uploaded_file, priority=self.priority, doc_hash=doc_hash)
+        if self.cancelled.is_set():
+            return
+        try:
+            response = self._open(source_id)
+        except requests.exceptions.RequestException as e:
+            if not (from_cache and is_unknown_source_error(e)):
+                raise
+            invalidate_source_id(doc_hash)
+            _, source_id, _ = get_or_upload_source(
+                self.uploaded_file, force_upload=True, priority=self.priority, doc_hash=doc_hash
+            )
+            response = self._open(source_id)
+        self._response = response
+        if self.cancelled.is_set():
+            response.close()
+            return
+        
+        try:
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                if self.cancelled.is_set():
+                    break
+                if not chunk:
+                    continue
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - start
+                    if perf_recorder.enabled:
+                        perf_recorder.record("Question interactive : premier fragment", self.ttft, name)
+                self.chunks.append(chunk)
+                yield chunk
+            else:
+                self.complete = True
+        except (requests.exceptions.RequestException, AttributeError, OSError, ValueError):
+            # Lecture interrompue par cancel() depuis un autre thread : connexion déjà fermée
+            if not self.cancelled.is_set():
+                raise
+        finally:
+            response.close()
+            self.elapsed = time.perf_counter() - start
+            if perf_recorder.enabled:
+                perf_recorder.record(
+                    "Question interactive : réponse complète", self.elapsed, name,
+                    sum(len(chunk.encode("utf-8")) for chunk in self.chunks), self.complete
+                )
+        
+        if doc_hash and self.complete and self.chunks:
+            store_response(doc_hash, self.question, self.text, self.prompt)
+
+# Réponse d'un document à une question posée à tous les documents : nom du fichier, question,
+# réponse (None en cas d'échec), durée en secondes et erreur
+DocumentAnswer = namedtuple("DocumentAnswer", ["name", "question", "answer", "elapsed", "error"])
+
+def ask_all_documents(pdf_files, question, use_cache=True, max_workers=CHATPDF_MAX_CONCURRENCY,
+                      priority=PRIORITY_INTERACTIVE, cancel=None, poll_interval=None):
+    """
+    Pose la même question à plusieurs fichiers PDF simultanément et produit chaque réponse dès
+    son arrivée. Le débit reste borné par l'ordonnanceur des requêtes ; les questions non encore
+    envoyées sont abandonnées si l'itération est interrompue ou annulée.
+    
+    Args:
+        pdf_files (list): Les objets fichiers PDF binaires (fichiers Streamlit ou fichiers ouverts avec open)
+        question (str): La question à poser
+        use_cache (bool): Si False, ignore le cache des réponses
+        max_workers (int): Le nombre maximal de questions posées simultanément
+        priority (int): PRIORITY_INTERACTIVE (par défaut) ou PRIORITY_BACKGROUND
+        cancel (threading.Event, optional): Déclenché depuis n'importe quel thread, arrête
+            l'itération et abandonne les questions pas encore envoyées
+        poll_interval (float, optional): Si fourni, None est produit chaque fois qu'aucune
+            réponse n'arrive pendant ce délai, pour que l'appelant reste réactif
+    
+    Yields:
+        DocumentAnswer: La réponse de chaque document, dans l'ordre d'arrivée
+            (None après chaque délai poll_interval sans réponse)
+    """
+    stopped = threading.Event()
+    
+    def ask(pdf_file):
+        if stopped.is_set() or (cancel is not None and cancel.is_set()):
+            return None
+        name = document_name(pdf_file)
+        start = time.perf_counter()
+        try:
+            with timed("Question à tous les documents", document=name):
+                answer = chat_with_uploaded_pdf(pdf_file, question, use_cache=use_cache, priority=priority)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            return DocumentAnswer(name, question, None, time.perf_counter() - start, e)
+        return DocumentAnswer(name, question, answer, time.perf_counter() - start, None)
+    
+    if not pdf_files:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pdf_files))))
+    try:
+        pending = {executor.submit(ask, pdf_file) for pdf_file in pdf_files}
+        while pending and not (cancel is not None and cancel.is_set()):
+            finished, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if not finished:
+                yield None
+                continue
+            for future in finished:
+                answer = future.result()
+                if answer is not None:
+                    yield answer
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Sections interrogées pour chaque PDF : (clé, libellé, question, prompt)
+EXTRACTION_SECTIONS = [
+    ("base", "Informations de base", QUESTION_TEMPLATE_BASE, PROMPT_TEMPLATE_BASE),
+    ("fonds_propres", "Fonds propres", QUESTION_TEMPLATE_FONDS_PROPRES, PROMPT_TEMPLATE_FONDS_PROPRES),
+    ("scr_detail", "Détail du SCR", QUESTION_TEMPLATE_SCR_DETAIL, PROMPT_TEMPLATE_SCR_DETAIL),
+    ("actifs", "Actifs", QUESTION_TEMPLATE_ACTIFS, PROMPT_TEMPLATE_ACTIFS),
+]
+
+SECTION_LABELS = {key: label for key, label, _, _ in EXTRACTION_SECTIONS}
+
+# Modes d'extraction : une requête par section, ou une requête unique complétée au besoin par section
+EXTRACTION_MODE_SECTIONS = "sections"
+EXTRACTION_MODE_COMBINED = "combined"
+
+def extract_sections(source_id, max_workers=MAX_SECTION_WORKERS, on_section_done=None, doc_hash=None, use_cache=True,
+                     sections=None, pdf_name=None, checkpoint_hash=None):
+    """
+    Interroge l'API ChatPDF pour toutes les sections d'extraction d'un même PDF.
+    Les requêtes sont envoyées en parallèle, avec au plus max_workers requêtes simultanées.
+    
+    Args:
+        source_id (str or callable): L'identifiant source du PDF, ou sa fonction de téléversement différé (voir get_chat_response)
+        max_workers (int): Le nombre maximal de requêtes simultanées pour ce document
+        on_section_done (callable, optional): Fonction appelée avec (clé de section, succès)
+            à la fin de chaque requête, depuis le thread appelant
+        doc_hash (str, optional): L'empreinte SHA-256 du document, pour le cache des réponses
+        use_cache (bool): Si False, ignore le cache des réponses
+        sections (list, optional): Les clés des sections à interroger (toutes par défaut)
+        pdf_name (str, optional): Le nom du fichier PDF, pour la mesure des durées
+        checkpoint_hash (str, optional): L'empreinte du document sous laquelle enregistrer le
+            résultat de chaque section (points de reprise)
+    
+    Returns:
+        tuple: Un dictionnaire {clé de section: réponse} pour les sections réussies
+               et un dictionnaire {clé de section: exception} pour les échecs
+    """
+    responses = {}
+    errors = {}
+    selected = [section for section in EXTRACTION_SECTIONS if sections is None or section[0] in sections]
+    if not selected:
+        return responses, errors
+    
+    def ask(label, question, prompt):
+        with timed(f"Question : {label}", pdf_name) as timer:
+            response = get_chat_response(source_id, question, prompt, doc_hash, use_cache)
+            timer.size = len(response.encode("utf-8"))
+        return response
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(selected)))) as executor:
+        futures = {
+            executor.submit(ask, label, question, prompt): key
+            for key, label, question, prompt in selected
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                responses[key] = future.result()
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                logger.warning("Section %s en échec pour %s : %s", key, pdf_name or doc_hash, e)
+                errors[key] = e
+            if checkpoint_hash:
+                save_section_checkpoint(checkpoint_hash, key, response=responses.get(key), error=errors.get(key))
+            if on_section_done is not None:
+                on_section_done(key, key not in errors)
+    
+    return responses, errors
+
+def is_missing_value(value):
+    """
+    Indique si une valeur extraite est absente (None, chaîne vide ou NaN).
+    
+    Args:
+        value: La valeur à tester
+    
+    Returns:
+        bool: True si la valeur est absente
+    """
+    return value is None or value == '' or (isinstance(value, float) and np.isnan(value))
+
+def incomplete_sections(entry):
+    """
+    Retourne les sections dont au moins une colonne est absente ou vide.
+    
+    Args:
+        entry (dict): Les valeurs déjà connues, par nom de colonne
+    
+    Returns:
+        list: Les clés des sections incomplètes
+    """
+    return [
+        key for key, columns in SECTION_COLUMNS.items()
+        if any(is_missing_value(entry.get(column)) for column in columns)
+    ]
+
+def extract_pdf_data(source_id, pdf_name, max_workers=MAX_SECTION_WORKERS, on_section_done=None,
+                     doc_hash=None, use_cache=True, mode=EXTRACTION_MODE_SECTIONS, prefilled=None, raw_responses=None,
+                     checkpoint_hash=None, resume=True):
+    """
+    Extrait toutes les informations d'un PDF via l'API ChatPDF.
+    Combine les informations de base, les fonds propres, les détails du SCR et les actifs.
+    Les quatre sections sont interrogées en parallèle ; une section en échec laisse
+    ses colonnes vides.
+    
+    En mode combiné, toutes les informations sont demandées en une seule requête JSON ;
+    seules les sections dont des valeurs manquent dans cette réponse sont ensuite
+    interrogées séparément. Les sections entièrement couvertes par les valeurs
+    pré-remplies (extraction locale des QRT) ne sont pas interrogées.
+    
+    Avec checkpoint_hash, le résultat de chaque section est enregistré sur disque ; si resume
+    est vrai, les sections déjà réussies lors d'une extraction précédente ne sont pas interrogées
+    à nouveau et leur réponse enregistrée est réutilisée.
+    
+    Args:
+        source_id (str or callable): L'identifiant source du PDF, ou sa fonction de téléversement différé (voir get_chat_response)
+        pdf_name (str): Le nom du fichier PDF
+        max_workers (int): Le nombre maximal de requêtes simultanées pour ce document
+        on_section_done (callable, optional): Fonction appelée avec (clé de section, succès)
+            à la fin de chaque requête
+        doc_hash (str, optional): L'empreinte SHA-256 du document, pour le cache des réponses
+        use_cache (bool): Si False, ignore le cache des réponses
+        mode (str): EXTRACTION_MODE_SECTIONS ou EXTRACTION_MODE_COMBINED
+        prefilled (dict, optional): Des valeurs déjà connues par nom de colonne, prioritaires
+            sur les réponses de ChatPDF
+        raw_responses (dict, optional): Complété avec le texte brut des réponses de ChatPDF,
+            par clé de section ("combined" pour la requête combinée)
+        checkpoint_hash (str, optional): L'empreinte du document pour les points de reprise
+        resume (bool): Si True, réutilise les sections réussies enregistrées dans les points de reprise
+    
+    Returns:
+        tuple: Le DataFrame contenant toutes les informations extraites et un dictionnaire
+               {clé de section: erreur} pour les étapes en échec
+    """
+    known = {column: value for column, value in (prefilled or {}).items() if not is_missing_value(value)}
+    done = {}
+    if checkpoint_hash and resume:
+        done = {
+            section: checkpoint["response"]
+            for section, checkpoint in get_section_checkpoints(checkpoint_hash).items()
+            if checkpoint["status"] == CHECKPOINT_OK
+        }
+    sections = [key for key in incomplete_sections(known) if key not in done]
+    
+    if mode == EXTRACTION_MODE_COMBINED and len(sections) > 1:
+        try:
+            combined_response = done.get("combined")
+            if combined_response is None:
+                with timed("Question : requête combinée", pdf_name) as timer:
+                    combined_response = get_chat_response(
+                        source_id, QUESTION_TEMPLATE_COMBINED, PROMPT_TEMPLATE_COMBINED, doc_hash, use_cache
+                    )
+                    timer.size = len(combined_response.encode("utf-8"))
+            if raw_responses is not None:
+                raw_responses["combined"] = combined_response
+            with timed("Analyse des réponses", pdf_name, len(combined_response.encode("utf-8"))):
+                df_combined = parse_combined_text(combined_response)
+            if checkpoint_hash:
+                save_section_checkpoint(checkpoint_hash, "combined", response=combined_response)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            # Réponse combinée inutilisable : les sections sont interrogées séparément
+            logger.info("Réponse combinée inutilisable pour %s, interrogation par section : %s", pdf_name, e)
+            df_combined = None
+        
+        if df_combined is not None:
+            for column, value in df_combined.iloc[0].items():
+                if column not in known and not is_missing_value(value):
+                    known[column] = value
+            sections = [key for key in incomplete_sections(known) if key not in done]
+    
+    if on_section_done is not None:
+        for key in SECTION_COLUMNS:
+            if key not in sections:
+                on_section_done(key, True)
+    
+    responses, errors = extract_sections(
+        source_id,
+        max_workers=max_workers,
+        on_section_done=on_section_done,
+        doc_hash=doc_hash,
+        use_cache=use_cache,
+        sections=sections,
+        pdf_name=pdf_name,
+        checkpoint_hash=checkpoint_hash
+    )
+    responses.update({key: response for key, response in done.items() if key in SECTION_COLUMNS})
+    if raw_responses is not None:
+        raw_responses.update(responses)
+    
+    with timed("Analyse des réponses", pdf_name, sum(len(text.encode("utf-8")) for text in responses.values())):
+        df = merge_section_responses(responses, pdf_name)
+        for column, value in known.items():
+            if column in df.columns:
+                df[column] = value
+    
+    return df, errors
+
+def merge_section_responses(responses, pdf_name):
+    """
+    Analyse les réponses de chaque section et les fusionne en un DataFrame d'une ligne.
+    Une section absente des réponses laisse ses colonnes vides.
+    
+    Args:
+        responses (dict): Les réponses de ChatPDF par clé de section
+        pdf_name (str): Le nom du fichier PDF
+    
+    Returns:
+        DataFrame: Un DataFrame d'une ligne contenant toutes les colonnes de METRIC_FIELDS
+    """
+    entry = {}
+    for key in SECTION_COLUMNS:
+        entry.update(parse_response_text(responses.get(key) or "", sections=[key]))
+    
+    if not entry['Société']:
+        entry['Société'] = f"Société inconnue ({pdf_name})"
+    
+    return pd.DataFrame([entry])
+
+def missing_metric_fields(df, skip_sections=()):
+    """
+    Retourne les métriques numériques restées vides dans une ligne de résultats.
+    
+    Args:
+        df (DataFrame): Le DataFrame d'une ligne produit par l'extraction
+        skip_sections (iterable): Les sections à ignorer (par exemple celles dont la requête a échoué)
+    
+    Returns:
+        list: Les MetricField manquants, dans l'ordre de METRIC_FIELDS
+    """
+    entry = df.iloc[0]
+    return [
+        field for field in METRIC_FIELDS
+        if field.kind != "texte" and field.section not in skip_sections and is_missing_value(entry.get(field.column))
+    ]
+
+def build_gap_filling_question(fields):
+    """
+    Construit la question de complément pour une liste de métriques manquantes : une ligne par
+    métrique, avec ses autres intitulés et sa ligne dans les QRT. Le libellé de chaque ligne
+    est celui reconnu par parse_response_text.
+    
+    Args:
+        fields (list): Les MetricField à demander
+    
+    Returns:
+        str: La question
+    """
+    lines = []
+    for index, field in enumerate(fields, 1):
+        label = re.sub(r"\s*\((?:€|%)\)$", "", field.column)
+        hints = list(FIELD_SYNONYMS.get(field.key, ()))
+        if field.qrt:
+            template, rows = field.qrt
+            hints.append(f"QRT {template}, ligne{'s' if len(rows) > 1 else ''} {' + '.join(rows)}")
+        unit = "%" if field.kind == "pourcentage" else "€"
+        lines.append(f"{index}) {label} ({' ; '.join(hints)}) : X{unit}" if hints else f"{index}) {label} : X{unit}")
+    return (
+        "\nRéponds UNIQUEMENT avec les informations demandées, sous cette forme EXACTE, "
+        "sans aucun texte supplémentaire :\n" + "\n".join(lines) + "\n"
+    )
+
+def fill_missing_fields(source_id, df, pdf_name, doc_hash=None, use_cache=True, skip_sections=(),
+                        raw_responses=None):
+    """
+    Complète les métriques restées vides après l'extraction (réponse "Non disponible" ou
+    valeur non reconnue) par des requêtes ciblées, qui ne demandent que ces métriques. Le
+    nombre de requêtes dépend du nombre de champs manquants (GAP_FILLING_MAX_FIELDS par
+    requête), et non du nombre de sections. Une requête en échec laisse ses champs vides.
+    
+    Args:
+        source_id (str or callable): L'identifiant source du PDF, ou sa fonction de téléversement différé (voir get_chat_response)
+        df (DataFrame): Le DataFrame d'une ligne produit par l'extraction, complété en place
+        pdf_name (str): Le nom du fichier PDF
+        doc_hash (str, optional): L'empreinte SHA-256 du document, pour le cache des réponses
+        use_cache (bool): Si False, ignore le cache des réponses
+        skip_sections (iterable): Les sections à ne pas compléter (requête de section en échec)
+        raw_responses (dict, optional): Complété avec le texte brut des réponses
+            ("complements_1", "complements_2"...)
+    
+    Returns:
+        list: Les colonnes complétées
+    """
+    fields = missing_metric_fields(df, skip_sections)
+    filled = []
+    for start in range(0, len(fields), GAP_FILLING_MAX_FIELDS):
+        batch = fields[start:start + GAP_FILLING_MAX_FIELDS]
+        try:
+            with timed("Question : champs manquants", pdf_name) as timer:
+                response = get_chat_response(
+                    source_id, build_gap_filling_question(batch), PROMPT_TEMPLATE_GAP_FILLING, doc_hash, use_cache
+                )
+                timer.size = len(response.encode("utf-8"))
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.warning("Complément des champs manquants en échec pour %s : %s", pdf_name, e)
+            continue
+        
+        if raw_responses is not None:
+            raw_responses[f"complements_{start // GAP_FILLING_MAX_FIELDS + 1}"] = response
+        values = parse_response_text(response)
+        for field in batch:
+            value = values.get(field.column)
+            if not is_missing_value(value):
+                df.at[df.index[0], field.column] = value
+                filled.append(field.column)
+    
+    if fields:
+        logger.info("%s : %d champ(s) manquant(s), %d complété(s)", pdf_name, len(fields), len(filled))
+    return filled
+
+def cross_check_gaps(df):
+    """
+    Évalue les contrôles de cohérence sur toutes les lignes d'un tableau de résultats à la fois
+    (calcul vectorisé, sans boucle sur les lignes). Les composantes absentes comptent pour zéro ;
+    un contrôle n'est évalué que si le total et au moins deux composantes sont connus.
+    
+    Args:
+        df (DataFrame): Une ligne par document, avec les colonnes des métriques
+    
+    Returns:
+        DataFrame: L'écart relatif de chaque contrôle (colonnes : clés de CROSS_CHECKS), rapporté
+                   à la valeur publiée ; NaN si le contrôle ne peut pas être évalué
+    """
+    def column(name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+    
+    def component_sum(columns):
+        values = np.column_stack([column(name) for name in columns])
+        known = (~np.isnan(values)).sum(axis=1)
+        return np.where(known >= 2, np.nansum(values, axis=1), np.nan)
+    
+    def relative_gap(published, expected):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(published != 0, np.abs(published - expected) / np.abs(published), np.nan)
+    
+    scr = column('SCR (€)')
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected_ratio = np.where(scr != 0, column('Éléments éligibles (€)') / scr * 100, np.nan)
+    return pd.DataFrame({
+        "scr": relative_gap(scr, component_sum(SECTION_COLUMNS["scr_detail"])),
+        "ratio": relative_gap(column('Ratio de solvabilité (%)'), expected_ratio),
+        "actifs": relative_gap(column('Total des actifs (€)'), component_sum(SECTION_COLUMNS["actifs"][1:])),
+    }, index=df.index)
+
+def cross_check(df):
+    """
+    Contrôle la cohérence des métriques de chaque document et lui attribue une note de confiance :
+    la moyenne des contrôles, chacun valant 1 s'il est respecté, 0 s'il ne l'est pas et
+    CROSS_CHECK_UNKNOWN_SCORE s'il ne peut pas être évalué.
+    
+    Args:
+        df (DataFrame): Une ligne par document, avec les colonnes des métriques
+    
+    Returns:
+        DataFrame: Pour chaque document, l'écart de chaque contrôle en % (colonnes : libellés de
+                   CROSS_CHECKS), la note "Confiance" (entre 0 et 1) et les "Contrôles en échec"
+    """
+    gaps = cross_check_gaps(df)
+    tolerances = np.array([check.tolerance for check in CROSS_CHECKS])
+    values = gaps[[check.key for check in CROSS_CHECKS]].to_numpy(dtype=float)
+    failed = values > tolerances
+    scores = np.where(np.isnan(values), CROSS_CHECK_UNKNOWN_SCORE, (~failed).astype(float))
+    
+    labels = np.array([check.label for check in CROSS_CHECKS], dtype=object)
+    checks = pd.DataFrame(np.round(values * 100, 1), columns=labels.tolist(), index=df.index)
+    checks["Confiance"] = scores.mean(axis=1)
+    checks["Contrôles en échec"] = [", ".join(labels[row]) for row in failed]
+    return checks
+
+def failed_cross_checks(df):
+    """
+    Retourne les contrôles de cohérence non respectés par la première ligne d'un tableau de résultats.
+    
+    Args:
+        df (DataFrame): Le DataFrame d'une ligne produit par l'extraction
+    
+    Returns:
+        list: Les couples (CrossCheck, écart relatif), dans l'ordre de CROSS_CHECKS
+    """
+    gaps = cross_check_gaps(df.iloc[:1]).iloc[0]
+    return [(check, gaps[check.key]) for check in CROSS_CHECKS if gaps[check.key] > check.tolerance]
+
+def recheck_inconsistent_sections(source_id, df, pdf_name, doc_hash=None, use_cache=True, skip_sections=(),
+                                  locked_columns=(), raw_responses=None):
+    """
+    Réinterroge uniquement les sections à l'origine des contrôles de cohérence non respectés,
+    en rappelant à ChatPDF l'identité attendue et l'écart constaté. Les nouvelles valeurs ne
+    sont retenues que si elles améliorent la note de confiance du document.
+    
+    Args:
+        source_id (str or callable): L'identifiant source du PDF, ou sa fonction de téléversement différé (voir get_chat_response)
+        df (DataFrame): Le DataFrame d'une ligne produit par l'extraction, corrigé en place
+        pdf_name (str): Le nom du fichier PDF
+        doc_hash (str, optional): L'empreinte SHA-256 du document, pour le cache des réponses
+        use_cache (bool): Si False, ignore le cache des réponses
+        skip_sections (iterable): Les sections à ne pas réinterroger (requête de section en échec)
+        locked_columns (iterable): Les colonnes à conserver (valeurs lues localement dans les QRT)
+        raw_responses (dict, optional): Complété avec le texte brut des réponses ("verification_base"...)
+    
+    Returns:
+        list: Les colonnes corrigées (vide si les nouvelles valeurs n'ont pas été retenues)
+    """
+    failed = failed_cross_checks(df)
+    sections = [
+        key for key, _, _, _ in EXTRACTION_SECTIONS
+        if key not in skip_sections and any(key in check.sections for check, _ in failed)
+    ]
+    if not sections:
+        return []
+    
+    note = PROMPT_TEMPLATE_RECHECK.format(
+        checks="\n".join(f"- {check.hint} (écart constaté : {gap:.0%})" for check, gap in failed)
+    )
+    candidate = df.copy()
+    for key, _, question, prompt in EXTRACTION_SECTIONS:
+        if key not in sections:
+            continue
+        try:
+            with timed("Question : vérification", pdf_name) as timer:
+                response = get_chat_response(source_id, note + question, prompt, doc_hash, use_cache)
+                timer.size = len(response.encode("utf-8"))
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.warning("Vérification de la section « %s » en échec pour %s : %s", SECTION_LABELS[key], pdf_name, e)
+            continue
+        
+        if raw_responses is not None:
+            raw_responses[f"verification_{key}"] = response
+        for column, value in parse_response_text(response, sections=[key]).items():
+            if column in METRIC_COLUMNS and column not in locked_columns and not is_missing_value(value):
+                candidate.at[candidate.index[0], column] = value
+    
+    confidence_before = cross_check(df.iloc[:1])["Confiance"].iloc[0]
+    confidence_after = cross_check(candidate.iloc[:1])["Confiance"].iloc[0]
+    logger.info("%s : confiance %.2f avant vérification, %.2f après", pdf_name, confidence_before, confidence_after)
+    if confidence_after <= confidence_before:
+        return []
+    
+    changed = []
+    for column in METRIC_COLUMNS:
+        if column not in df.columns:
+            continue
+        before, after = df[column].iloc[0], candidate[column].iloc[0]
+        if not (before == after or (is_missing_value(before) and is_missing_value(after))):
+            df.at[df.index[0], column] = after
+            changed.append(column)
+    return changed
+
+_history_db_lock = threading.Lock()
+_history_db_ready = False
+
+def open_history_db():
+    """
+    Ouvre une connexion vers la base SQLite de l'historique des extractions et crée les tables si besoin.
+    
+    Returns:
+        sqlite3.Connection: Une nouvelle connexion, à fermer par l'appelant
+    """
+    global _history_db_ready
+    conn = None
+    with _history_db_lock:
+        if not _history_db_ready:
+            os.makedirs(os.path.dirname(HISTORY_DB_PATH) or ".", exist_ok=True)
+            conn = sqlite3.connect(HISTORY_DB_PATH, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_hash TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    company TEXT,
+                    year INTEGER,
+                    mode TEXT,
+                    complete INTEGER NOT NULL,
+                    extracted_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_documents_company_year ON documents (company, year);
+                CREATE INDEX IF NOT EXISTS idx_documents_year ON documents (year);
+                CREATE TABLE IF NOT EXISTS metrics (
+                    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+                    metric TEXT NOT NULL,
+                    value REAL,
+                    source TEXT NOT NULL,
+                    PRIMARY KEY (doc_hash, metric)
+                );
+                CREATE TABLE IF NOT EXISTS raw_responses (
+                    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+                    section TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, section)
+                );
+                CREATE TABLE IF NOT EXISTS section_checkpoints (
+                    doc_hash TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    response TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, section)
+                );
+                CREATE TABLE IF NOT EXISTS pending_jobs (
+                    doc_hash TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    submitted_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS prepared_analyses (
+                    doc_hash TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, prompt)
+                );
+            """)
+            conn.commit()
+            _history_db_ready = True
+    return conn or sqlite3.connect(HISTORY_DB_PATH, timeout=30)
+
+def save_to_history(doc_hash, file_name, df, year=None, mode=None, complete=True, local_columns=(),
+                    raw_responses=None):
+    """
+    Enregistre dans l'historique les métriques extraites d'un document et les réponses brutes
+    de ChatPDF dont elles proviennent. Un document déjà présent est remplacé.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        file_name (str): Le nom du fichier
+        df (DataFrame): Le DataFrame d'une ligne produit par l'extraction
+        year (int, optional): L'exercice du rapport
+        mode (str, optional): Le mode d'extraction utilisé
+        complete (bool): False si des sections n'ont pas pu être extraites
+        local_columns (iterable): Les colonnes lues localement dans les QRT
+        raw_responses (dict, optional): Le texte brut des réponses par clé de section
+    """
+    entry = df.iloc[0]
+    now = time.time()
+    conn = open_history_db()
+    try:
+        with conn:
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("DELETE FROM documents WHERE doc_hash = ?", (doc_hash,))
+            conn.execute(
+                "INSERT INTO documents (doc_hash, file_name, company, year, mode, complete, extracted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_hash, file_name, entry.get('Société'), year, mode, int(complete), now)
+            )
+            conn.executemany(
+                "INSERT INTO metrics (doc_hash, metric, value, source) VALUES (?, ?, ?, ?)",
+                [
+                    (doc_hash, column, None if is_missing_value(entry.get(column)) else float(entry.get(column)),
+                     "qrt" if column in local_columns else "chatpdf")
+                    for column in METRIC_COLUMNS
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO raw_responses (doc_hash, section, content, created_at) VALUES (?, ?, ?, ?)",
+                [(doc_hash, section, content, now) for section, content in (raw_responses or {}).items() if content]
+            )
+    finally:
+        conn.close()
+
+def list_history(company=None, year=None):
+    """
+    Liste les documents de l'historique, éventuellement filtrés par société et par exercice.
+    
+    Args:
+        company (str, optional): Le nom de la société
+        year (int, optional): L'exercice
+    
+    Returns:
+        DataFrame: Une ligne par document (doc_hash, file_name, company, year, complete, extracted_at),
+                   du plus récent au plus ancien
+    """
+    query = "SELECT doc_hash, file_name, company, year, complete, extracted_at FROM documents WHERE 1 = 1"
+    params = []
+    if company is not None:
+        query += " AND company = ?"
+        params.append(company)
+    if year is not None:
+        query += " AND year = ?"
+        params.append(year)
+    conn = open_history_db()
+    try:
+        return pd.read_sql_query(query + " ORDER BY extracted_at DESC", conn, params=params)
+    finally:
+        conn.close()
+
+def load_from_history(doc_hashes, complete_only=False):
+    """
+    Charge depuis l'historique les métriques de plusieurs documents.
+    
+    Args:
+        doc_hashes (list): Les empreintes des documents
+        complete_only (bool): Si True, ignore les documents dont des sections n'avaient pas pu être extraites
+    
+    Returns:
+        list: Un tuple (empreinte, nom du fichier, exercice, DataFrame d'une ligne) par document trouvé,
+              dans l'ordre des empreintes demandées
+    """
+    if not doc_hashes:
+        return []
+    placeholders = ", ".join("?" * len(doc_hashes))
+    conn = open_history_db()
+    try:
+        documents = conn.execute(
+            f"SELECT doc_hash, file_name, company, year FROM documents WHERE doc_hash IN ({placeholders})"
+            + (" AND complete = 1" if complete_only else ""),
+            list(doc_hashes)
+        ).fetchall()
+        values = {}
+        for doc_hash, metric, value in conn.execute(
+            f"SELECT doc_hash, metric, value FROM metrics WHERE doc_hash IN ({placeholders})", list(doc_hashes)
+        ):
+            values.setdefault(doc_hash, {})[metric] = np.nan if value is None else value
+    finally:
+        conn.close()
+    
+    found = {}
+    for doc_hash, file_name, company, year in documents:
+        entry = {'Société': company}
+        entry.update({column: values.get(doc_hash, {}).get(column, np.nan) for column in METRIC_COLUMNS})
+        found[doc_hash] = (doc_hash, file_name, year, pd.DataFrame([entry]))
+    return [found[doc_hash] for doc_hash in doc_hashes if doc_hash in found]
+
+def get_history_responses(doc_hash):
+    """
+    Retourne les réponses brutes de ChatPDF conservées pour un document.
+    
+    Args:
+        doc_hash (str): L'empreinte du document
+    
+    Returns:
+        dict: Le texte de chaque réponse, par clé de section
+    """
+    conn = open_history_db()
+    try:
+        return dict(conn.execute(
+            "SELECT section, content FROM raw_responses WHERE doc_hash = ? ORDER BY section", (doc_hash,)
+        ).fetchall())
+    finally:
+        conn.close()
+
+# États d'une section dans les points de reprise
+CHECKPOINT_OK = "ok"
+CHECKPOINT_FAILED = "failed"
+
+def save_section_checkpoint(doc_hash, section, response=None, error=None):
+    """
+    Enregistre sur disque le résultat d'une section pour un document : sa réponse en cas de
+    succès, son erreur sinon. Une extraction reprise n'interroge plus les sections réussies.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        section (str): La clé de section ("combined" pour la requête combinée)
+        response (str, optional): Le texte de la réponse, si la section a réussi
+        error (Exception, optional): L'erreur, si la section a échoué
+    """
+    status = CHECKPOINT_FAILED if error is not None else CHECKPOINT_OK
+    conn = open_history_db()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO section_checkpoints (doc_hash, section, status, response, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, section, status, response, None if error is None else str(error), time.time())
+            )
+    finally:
+        conn.close()
+
+def get_section_checkpoints(doc_hash):
+    """
+    Retourne les points de reprise d'un document.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+    
+    Returns:
+        dict: Par clé de section, un dictionnaire (status, response, error)
+    """
+    conn = open_history_db()
+    try:
+        rows = conn.execute(
+            "SELECT section, status, response, error FROM section_checkpoints WHERE doc_hash = ?", (doc_hash,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {section: {"status": status, "response": response, "error": error} for section, status, response, error in rows}
+
+def clear_section_checkpoints(doc_hash):
+    """
+    Supprime les points de reprise d'un document, une fois toutes ses sections extraites.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+    """
+    conn = open_history_db()
+    try:
+        with conn:
+            conn.execute("DELETE FROM section_checkpoints WHERE doc_hash = ?", (doc_hash,))
+    finally:
+        conn.close()
+
+def record_pending_job(doc_hash, file_name, pdf_file, options):
+    """
+    Conserve sur disque un document soumis à l'extraction en arrière-plan et ses options,
+    jusqu'à ce que toutes ses sections soient extraites. Le fichier est copié par blocs,
+    sans être chargé en mémoire, sous son nom d'origine.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        file_name (str): Le nom du fichier
+        pdf_file: L'objet fichier PDF binaire à copier
+        options (dict): Les options de l'extraction (sérialisables en JSON)
+    
+    Returns:
+        str: Le chemin de la copie
+    """
+    directory = os.path.join(PENDING_JOBS_DIR, doc_hash)
+    path = os.path.join(directory, os.path.basename(file_name) or "document.pdf")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            pdf_file.seek(0)
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(pdf_file, f, UPLOAD_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            pdf_file.seek(0)
+    conn = open_history_db()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_jobs (doc_hash, file_name, path, options, submitted_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (doc_hash, file_name, path, json.dumps(options), time.time())
+            )
+    finally:
+        conn.close()
+    return path
+
+def remove_pending_job(doc_hash, keep_copy=False):
+    """
+    Retire un document des extractions à reprendre et supprime sa copie sur disque.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        keep_copy (bool): Si True, conserve la copie, encore utilisée (voir discard_pending_copy)
+    """
+    conn = open_history_db()
+    try:
+        with conn:
+            row = conn.execute("SELECT path FROM pending_jobs WHERE doc_hash = ?", (doc_hash,)).fetchone()
+            conn.execute("DELETE FROM pending_jobs WHERE doc_hash = ?", (doc_hash,))
+    finally:
+        conn.close()
+    if row and not keep_copy:
+        delete_pending_copy(row[0])
+
+def delete_pending_copy(path):
+    """
+    Supprime la copie sur disque d'un document et son dossier s'il est vide.
+    
+    Args:
+        path (str): Le chemin de la copie
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    if os.path.abspath(directory) != os.path.abspath(PENDING_JOBS_DIR):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+def discard_pending_copy(doc_hash, path):
+    """
+    Supprime la copie conservée par remove_pending_job(keep_copy=True), sauf si le document
+    a été soumis à nouveau entre-temps.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        path (str): Le chemin de la copie
+    """
+    conn = open_history_db()
+    try:
+        row = conn.execute("SELECT path FROM pending_jobs WHERE doc_hash = ?", (doc_hash,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or row[0] != path:
+        delete_pending_copy(path)
+
+def list_pending_jobs():
+    """
+    Liste les documents dont l'extraction a été interrompue ou est restée incomplète,
+    avec l'état de chacune de leurs sections.
+    
+    Returns:
+        list: Une liste de dictionnaires (doc_hash, file_name, path, options, submitted_at, done, failed),
+              done et failed listant les clés des sections réussies et en échec
+    """
+    conn = open_history_db()
+    try:
+        rows = conn.execute(
+            "SELECT doc_hash, file_name, path, options, submitted_at FROM pending_jobs ORDER BY submitted_at"
+        ).fetchall()
+        checkpoints = conn.execute(
+            "SELECT doc_hash, section, status FROM section_checkpoints WHERE doc_hash IN "
+            "(SELECT doc_hash FROM pending_jobs)"
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    jobs = []
+    for doc_hash, file_name, path, options, submitted_at in rows:
+        if not os.path.exists(path):
+            continue
+        sections = {section: status for hash_, section, status in checkpoints if hash_ == doc_hash}
+        jobs.append({
+            "doc_hash": doc_hash,
+            "file_name": file_name,
+            "path": path,
+            "options": json.loads(options),
+            "submitted_at": submitted_at,
+            "done": [key for key in SECTION_COLUMNS if sections.get(key) == CHECKPOINT_OK],
+            "failed": [key for key in SECTION_COLUMNS if sections.get(key) == CHECKPOINT_FAILED],
+        })
+    return jobs
+
+# Analyses prédéfinies proposées dans l'onglet Question : libellé du bouton -> question posée
+PREDEFINED_ANALYSES = {
+    "Analyse du SCR": "Analyse en détail la composition du SCR. Donne la répartition des différents modules de risques (marché, souscription, etc.) et leurs montants, attention à bien convertir les montants qui peuvent être en millions d'euros. Explique quels sont les risques principaux.",
+    "Analyse des fonds propres": "Analyse la composition des fonds propres. Détaille les différents tiers (Tier 1, 2, 3) et leur montant (attention à bien convertir si en millions d'euros). Compare avec l'année précédente si disponible et explique l'évolution.",
+    "Analyse du ratio de solvabilité": "Explique le ratio de solvabilité actuel et son évolution. Compare avec l'année précédente et explique les facteurs qui ont influencé ce ratio. Précise si des mesures particulières ont été prises pour maintenir ou améliorer ce ratio.",
+    "Analyse du MCR": "Donne les détails sur le MCR (Minimum Capital Requirement). Précise son montant (attention à bien convertir si en millions d'euros), explique son calcul et son évolution par rapport à l'année précédente.",
+    "Analyse des actifs": "Analyse les actifs détenus par l'entreprise. Détaille les différents types d'actifs et leur montant (attention à bien convertir si en millions d'euros). Compare avec l'année précédente si disponible et explique l'évolution."
+}
+
+def save_prepared_analysis(doc_hash, prompt, answer):
+    """
+    Enregistre la réponse d'une analyse prédéfinie pour un document ; une réponse déjà
+    enregistrée pour la même question est remplacée.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+        prompt (str): Le texte de la question posée
+        answer (str): La réponse de ChatPDF
+    """
+    conn = open_history_db()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO prepared_analyses (doc_hash, prompt, answer, created_at) VALUES (?, ?, ?, ?)",
+                (doc_hash, prompt, answer, time.time())
+            )
+    finally:
+        conn.close()
+
+def get_prepared_analyses(doc_hash):
+    """
+    Retourne les réponses des analyses prédéfinies déjà préparées pour un document.
+    
+    Args:
+        doc_hash (str): L'empreinte SHA-256 du document
+    
+    Returns:
+        dict: Par texte de question, un tuple (réponse, horodatage de la réponse)
+    """
+    conn = open_history_db()
+    try:
+        rows = conn.execute(
+            "SELECT prompt, answer, created_at FROM prepared_analyses WHERE doc_hash = ?", (doc_hash,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {prompt: (answer, created_at) for prompt, answer, created_at in rows}
+
+def prepare_predefined_analyses(pdf_file, prompts=None, refresh=False, use_cache=True, on_prepared=None):
+    """
+    Pose à l'avance les questions d'analyse prédéfinies sur un document et enregistre leurs
+    réponses, pour qu'elles s'affichent immédiatement dans l'interface. Les questions sont
+    posées l'une après l'autre, avec la priorité la plus basse auprès de l'ordonnanceur ;
+    le sourceId en cache est réutilisé.
+    
+    Cette fonction peut être exécutée depuis un thread de travail.
+    
+    Args:
+        pdf_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        prompts (list, optional): Les questions à poser (toutes les analyses prédéfinies par défaut)
+        refresh (bool): Si True, pose à nouveau les questions dont la réponse est déjà enregistrée
+        use_cache (bool): Si False, ignore le cache des réponses
+        on_prepared (callable, optional): Fonction appelée avec (nombre de réponses prêtes, nombre de questions)
+    
+    Returns:
+        int: Le nombre de questions posées avec succès
+    """
+    prompts = list(PREDEFINED_ANALYSES.values()) if prompts is None else list(prompts)
+    doc_hash = compute_file_hash(pdf_file)
+    prepared = get_prepared_analyses(doc_hash)
+    nb_ready = 0 if refresh else sum(prompt in prepared for prompt in prompts)
+    nb_asked = 0
+    for prompt in prompts:
+        if prompt in prepared and not refresh:
+            continue
+        try:
+            with timed("Analyse prédéfinie", document=document_name(pdf_file)):
+                answer = chat_with_uploaded_pdf(
+                    pdf_file, prompt, use_cache=use_cache and not refresh, priority=PRIORITY_PREPARATION
+                )
+        except requests.exceptions.RequestException as e:
+            logger.warning("Analyse prédéfinie non préparée pour %s : %s", document_name(pdf_file), e)
+            continue
+        save_prepared_analysis(doc_hash, prompt, answer)
+        nb_asked += 1
+        nb_ready += 1
+        if on_prepared is not None:
+            on_prepared(nb_ready, len(prompts))
+    return nb_asked
+
+# Résultat du traitement complet d'un PDF : nom du fichier, DataFrame d'une ligne, erreurs par section,
+# pages envoyées à ChatPDF (None si le document complet est envoyé), nombre de pages du document,
+# durée de chaque étape en secondes, exercice du rapport (None s'il n'a pas pu être déterminé),
+# empreinte du document et provenance (True si le résultat a été lu dans l'historique)
+DocumentResult = namedtuple(
+    "DocumentResult",
+    ["name", "data", "errors", "pages", "page_count", "timings", "year", "doc_hash", "from_history"],
+    defaults=(None, False)
+)
+
+# Exercice d'un rapport : année explicitement rattachée à l'exercice, sinon première année citée
+REPORT_YEAR_RE = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+REPORT_FISCAL_YEAR_RE = re.compile(r"(?:exercice|31\s+d[ée]cembre|ann[ée]e)\s+(20\d{2})(?!\d)", re.IGNORECASE)
+
+def infer_report_year(file_name, first_page_text=""):
+    """
+    Détermine l'exercice d'un rapport à partir du nom du fichier, ou à défaut de sa première page.
+    
+    Args:
+        file_name (str): Le nom du fichier
+        first_page_text (str): Le texte de la première page, s'il est disponible
+    
+    Returns:
+        int: L'année de l'exercice, ou None si elle n'a pas pu être déterminée
+    """
+    match = (
+        REPORT_YEAR_RE.search(os.path.basename(file_name))
+        or REPORT_FISCAL_YEAR_RE.search(first_page_text)
+        or REPORT_YEAR_RE.search(first_page_text)
+    )
+    return int(match.group(1)) if match else None
+
+def load_history_result(name, file_hash):
+    """
+    Retourne le résultat d'un document déjà extrait entièrement, lu dans l'historique.
+    
+    Args:
+        name (str): Le nom du fichier
+        file_hash (str): L'empreinte SHA-256 du document
+    
+    Returns:
+        DocumentResult: Le résultat, ou None si le document n'est pas complet dans l'historique
+    """
+    start = time.perf_counter()
+    with timed("Lecture de l'historique", name):
+        history = load_from_history([file_hash], complete_only=True)
+    if not history:
+        return None
+    _, _, history_year, df_history = history[0]
+    timings = {"Historique": time.perf_counter() - start}
+    return DocumentResult(name, df_history, {}, None, None, timings, history_year, file_hash, True)
+
+def process_document(pdf_file, max_workers=MAX_SECTION_WORKERS, use_cache=True, mode=EXTRACTION_MODE_SECTIONS,
+                     use_local=True, select_pages=True, on_status=None, use_history=True, resume=True,
+                     fill_gaps=True, recheck=True, recheck_from_cache=True):
+    """
+    Traite un PDF de bout en bout : lecture locale des QRT et présélection des pages,
+    téléversement (ou réutilisation du sourceId en cache), puis extraction via ChatPDF.
+    Le téléversement n'a lieu qu'à la première question dont la réponse ne figure ni dans
+    le cache des réponses ni dans les points de reprise.
+    Si ChatPDF ne reconnaît plus le sourceId en cache, le fichier est téléversé à nouveau
+    une seule fois. Un document déjà extrait entièrement est lu dans l'historique, sans
+    aucun appel à ChatPDF ; chaque nouvelle extraction y est enregistrée.
+    
+    Le résultat de chaque section est enregistré dans des points de reprise, indexés par
+    l'empreinte du document : une extraction interrompue ou incomplète, relancée, n'interroge
+    que les sections manquantes. Les points de reprise sont supprimés lorsque toutes les
+    sections ont été extraites. Les métriques restées vides sont ensuite complétées par
+    des requêtes ciblées (fill_missing_fields), puis les sections à l'origine d'un contrôle
+    de cohérence non respecté sont réinterrogées (recheck_inconsistent_sections).
+    
+    Args:
+        pdf_file: L'objet fichier PDF binaire (fichier Streamlit ou fichier ouvert avec open)
+        max_workers (int): Le nombre maximal de requêtes simultanées pour ce document
+        use_cache (bool): Si False, ignore le cache des réponses
+        mode (str): EXTRACTION_MODE_SECTIONS ou EXTRACTION_MODE_COMBINED
+        use_local (bool): Si True, lit d'abord localement les QRT du PDF
+        select_pages (bool): Si True, n'envoie à ChatPDF que les pages utiles des documents longs
+        on_status (callable, optional): Fonction appelée avec (étape, nombre d'étapes terminées)
+            à chaque changement d'étape, depuis le thread de traitement ; le nombre total
+            d'étapes est len(EXTRACTION_SECTIONS) + 1
+        use_history (bool): Si False, extrait le document même s'il figure dans l'historique
+        resume (bool): Si False, interroge à nouveau toutes les sections, même celles déjà réussies
+        fill_gaps (bool): Si True, redemande les métriques restées vides après l'extraction
+        recheck (bool): Si True, réinterroge les sections dont les montants sont incohérents
+        recheck_from_cache (bool): Si False, les questions de vérification ignorent le cache des
+            réponses, même si use_cache est vrai
+    
+    Returns:
+        DocumentResult: Le résultat du traitement
+    
+    Raises:
+        requests.exceptions.RequestException: En cas d'échec du téléversement
+    """
+    name = document_name(pdf_file)
+    timings = {}
+    
+    def set_status(stage, steps_done):
+        if on_status is not None:
+            on_status(stage, steps_done)
+    
+    with timed("Empreinte du fichier", name):
+        file_hash = compute_file_hash(pdf_file)
+    if use_history:
+        history_result = load_history_result(name, file_hash)
+        if history_result is not None:
+            return history_result
+    
+    local_values, pages, page_count = {}, None, None
+    year = infer_report_year(name)
+    if use_local or select_pages:
+        set_status("Lecture locale du PDF", 0)
+        start = time.perf_counter()
+        with timed("Lecture du texte", name) as timer:
+            page_texts = extract_page_texts(pdf_file)
+            timer.size = sum(len(text) for text in page_texts)
+        page_count = len(page_texts) or None
+        if year is None and page_texts:
+            year = infer_report_year(name, page_texts[0])
+        if use_local:
+            with timed("Lecture des QRT", name):
+                local_values = extract_qrt_metrics(page_texts)
+        if select_pages:
+            with timed("Sélection des pages", name):
+                pages = select_relevant_pages(page_texts)
+        if pages is not None:
+            record_page_selection(file_hash, pages, page_count, name)
+        timings["Lecture locale"] = time.perf_counter() - start
+    
+    # Clé du cache des réponses, connue sans téléversement : le fichier n'est téléversé qu'à la
+    # première question absente du cache et des points de reprise
+    doc_hash = file_hash if pages is None else page_selection_key(file_hash, pages)
+    source_lock = threading.Lock()
+    force_upload = False
+    while True:
+        source = {"id": None, "from_cache": False, "error": None}
+        
+        def source_id():
+            with source_lock:
+                if source["error"] is not None:
+                    raise source["error"]
+                if source["id"] is None:
+                    set_status("Téléversement", 1)
+                    start = time.perf_counter()
+                    try:
+                        _, source["id"], source["from_cache"] = get_or_upload_source(
+                            pdf_file,
+                            force_upload=force_upload,
+                            pages=pages,
+                            on_progress=lambda sent, total: set_status(
+                                f"Téléversement : {format_size(sent)} sur {format_size(total)}", 1
+                            ),
+                            doc_hash=file_hash
+                        )
+                    except requests.exceptions.RequestException as e:
+                        source["error"] = e
+                        raise
+                    finally:
+                        timings["Téléversement"] = timings.get("Téléversement", 0.0) + time.perf_counter() - start
+                return source["id"]
+        
+        sections_done = [0]
+        
+        def on_section_done(key, success):
+            sections_done[0] += 1
+            set_status(f"Extraction : section {sections_done[0]} sur {len(EXTRACTION_SECTIONS)} terminée",
+                       1 + sections_done[0])
+        
+        set_status(f"Extraction : section 0 sur {len(EXTRACTION_SECTIONS)} terminée", 1)
+        start = time.perf_counter()
+        raw_responses = {}
+        df_pdf, errors = extract_pdf_data(
+            source_id,
+            name,
+            max_workers=max_workers,
+            on_section_done=on_section_done,
+            doc_hash=doc_hash,
+            use_cache=use_cache,
+            mode=mode,
+            prefilled=local_values,
+            raw_responses=raw_responses,
+            checkpoint_hash=file_hash,
+            resume=resume
+        )
+        timings["Extraction"] = timings.get("Extraction", 0.0) + time.perf_counter() - start
+        if source["error"] is not None:
+            raise source["error"]
+        
+        # sourceId en cache supprimé côté ChatPDF : on téléverse à nouveau le fichier
+        if source["from_cache"] and errors and all(is_unknown_source_error(e) for e in errors.values()):
+            logger.info("sourceId inconnu de ChatPDF pour %s, nouveau téléversement", name)
+            invalidate_source_id(doc_hash)
+            force_upload = True
+            continue
+        
+        if fill_gaps and not df_pdf.empty:
+            missing = missing_metric_fields(df_pdf, skip_sections=errors)
+            if missing:
+                set_status(f"Compléments : {len(missing)} champ(s) manquant(s)", len(EXTRACTION_SECTIONS) + 1)
+                start = time.perf_counter()
+                fill_missing_fields(
+                    source_id,
+                    df_pdf,
+                    name,
+                    doc_hash=doc_hash,
+                    use_cache=use_cache,
+                    skip_sections=errors,
+                    raw_responses=raw_responses
+                )
+                timings["Compléments"] = time.perf_counter() - start
+        
+        local_columns = [column for column, value in local_values.items() if not is_missing_value(value)]
+        if recheck and not df_pdf.empty:
+            failed = failed_cross_checks(df_pdf)
+            if failed:
+                set_status(f"Vérification : {len(failed)} contrôle(s) de cohérence en écart", len(EXTRACTION_SECTIONS) + 1)
+                start = time.perf_counter()
+                recheck_inconsistent_sections(
+                    source_id,
+                    df_pdf,
+                    name,
+                    doc_hash=doc_hash,
+                    use_cache=use_cache and recheck_from_cache,
+                    skip_sections=errors,
+                    locked_columns=local_columns,
+                    raw_responses=raw_responses
+                )
+                timings["Vérification"] = time.perf_counter() - start
+        
+        if not df_pdf.empty:
+            with timed("Écriture de l'historique", name):
+                save_to_history(
+                    file_hash,
+                    name,
+                    df_pdf,
+                    year=year,
+                    mode=mode,
+                    complete=not errors,
+                    local_columns=local_columns,
+                    raw_responses=raw_responses
+                )
+        if not errors:
+            clear_section_checkpoints(file_hash)
+        perf_recorder.export_prometheus()
+        return DocumentResult(name, df_pdf, errors, pages, page_count, timings, year, file_hash)
+
+# États d'une extraction en arrière-plan
+JOB_PENDING = "En attente"
+JOB_RUNNING = "En cours"
+JOB_DONE = "Terminé"
+JOB_FAILED = "Échec"
+
+# Étape affichée pour un document lu dans l'historique, sans appel à ChatPDF
+STAGE_FROM_HISTORY = "Lu dans l'historique"
+
+# Photographie de l'état d'une extraction en arrière-plan : identifiant, nom du fichier, état,
+# étape en cours (libellé), nombre d'étapes terminées, résultat (DocumentResult), erreur et
+# avancement de la préparation des analyses prédéfinies (None si elle n'est pas demandée)
+JobStatus = namedtuple(
+    "JobStatus",
+    ["job_id", "name", "state", "stage", "steps_done", "result", "error", "analyses"],
+    defaults=(None,)
+)
+
+class ExtractionJobManager:
+    """
+    Exécute les extractions de documents en arrière-plan, dans un pool de threads partagé par
+    toutes les sessions du processus : une extraction se poursuit quand l'interface se
+    réexécute ou que la page est fermée.
+    
+    Chaque extraction appartient à un propriétaire (par exemple une session de l'interface),
+    qui en suit l'avancement avec jobs() et récupère les résultats terminés avec collect().
+    Le fichier est copié sur disque par blocs à la soumission, sans être chargé en mémoire :
+    l'objet d'origine peut disparaître. La copie est conservée tant que toutes les sections
+    du document n'ont pas été extraites : resume_pending() relance, même après un redémarrage,
+    les extractions interrompues ou incomplètes, qui n'interrogent alors que les sections manquantes.
+    
+    Args:
+        max_workers (int): Le nombre maximal de documents traités simultanément, toutes
+            sessions confondues
+    """
+    
+    def __init__(self, max_workers=MAX_BACKGROUND_PDFS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sfcr-extraction")
+        self.jobs_by_id = {}
+        self.sequence = 0
+        self.running = {}
+        # Extractions en attente d'une place, par propriétaire : aucun thread du pool n'attend
+        self.queued = {}
+        self._condition = threading.Condition()
+    
+    def submit(self, owner, pdf_file, max_parallel=MAX_PARALLEL_PDFS, prepare_analyses=False, file_name=None,
+               **options):
+        """
+        Soumet l'extraction d'un document.
+        
+        Args:
+            owner (str): Le propriétaire de l'extraction
+            pdf_file: Le fichier PDF (objet fichier binaire avec un attribut name)
+            max_parallel (int): Le nombre maximal de documents de ce propriétaire traités simultanément
+            prepare_analyses (bool): Si True, prépare ensuite les analyses prédéfinies du document
+            file_name (str, optional): Le nom du document (par défaut, celui de pdf_file)
+            **options: Les arguments transmis à process_document (use_cache, mode, use_local...)
+        
+        Returns:
+            int: L'identifiant de l'extraction
+        """
+        file_name = file_name or document_name(pdf_file)
+        doc_hash = compute_file_hash(pdf_file)
+        # Un document complet dans l'historique (analyses comprises si demandées) est servi
+        # immédiatement, sans copie sur disque ni passage par le pool
+        history_result = None
+        analyses_ready = not prepare_analyses or set(PREDEFINED_ANALYSES.values()) <= get_prepared_analyses(doc_hash).keys()
+        if options.get("use_history", True) and analyses_ready:
+            history_result = load_history_result(file_name, doc_hash)
+        path = None
+        if history_result is None:
+            path = record_pending_job(
+                doc_hash, file_name, pdf_file,
+                {"max_parallel": max_parallel, "prepare_analyses": prepare_analyses, **options}
+            )
+        
+        with self._condition:
+            self.sequence += 1
+            job = {
+                "job_id": self.sequence,
+                "owner": owner,
+                "name": file_name,
+                "doc_hash": doc_hash,
+                "state": JOB_PENDING,
+                "stage": JOB_PENDING,
+                "steps_done": 0,
+                "result": None,
+                "error": None,
+                "analyses": JOB_PENDING if prepare_analyses else None,
+                "delivered": False,
+            }
+            self.jobs_by_id[job["job_id"]] = job
+            if history_result is not None:
+                job.update(
+                    state=JOB_DONE,
+                    stage=STAGE_FROM_HISTORY,
+                    steps_done=len(EXTRACTION_SECTIONS) + 1,
+                    result=history_result,
+                    analyses=f"{len(PREDEFINED_ANALYSES)} / {len(PREDEFINED_ANALYSES)}" if prepare_analyses else None
+                )
+                return job["job_id"]
+            self.queued.setdefault(owner, deque()).append((job, path, max(1, max_parallel), options))
+            self._dispatch(owner)
+        return job["job_id"]
+    
+    def _dispatch(self, owner):
+        # Appelée avec le verrou : confie au pool les extractions en attente du propriétaire,
+        # dans l'ordre de soumission, tant qu'il reste des places
+        queue = self.queued.get(owner)
+        while queue and self.running.get(owner, 0) < queue[0][2]:
+            job, path, _, options = queue.popleft()
+            self.running[owner] = self.running.get(owner, 0) + 1
+            job["state"] = JOB_RUNNING
+            self.executor.submit(self._run, job, path, options)
+        if not queue:
+            self.queued.pop(owner, None)
+    
+    def _update(self, job, **fields):
+        with self._condition:
+            job.update(fields)
+    
+    def _run(self, job, path, options):
+        owner = job["owner"]
+        try:
+            with open(path, "rb") as content:
+                result = process_document(
+                    content,
+                    on_status=lambda stage, steps_done: self._update(job, stage=stage, steps_done=steps_done),
+                    **options
+                )
+        except Exception as e:
+            logger.warning("Extraction en échec pour %s : %s", job["name"], e)
+            self._update(job, state=JOB_FAILED, stage=f"Échec : {e}", error=e)
+        else:
+            if result.data.empty:
+                stage = "Échec : aucune donnée extraite"
+            elif result.from_history:
+                stage = STAGE_FROM_HISTORY
+            elif result.errors:
+                missing = ", ".join(SECTION_LABELS.get(key, key) for key in result.errors)
+                stage = f"Terminé, sections non extraites : {missing}"
+            else:
+                stage = JOB_DONE
+            self._update(
+                job,
+                state=JOB_FAILED if result.data.empty else JOB_DONE,
+                stage=stage,
+                steps_done=len(EXTRACTION_SECTIONS) + 1,
+                result=result
+            )
+            complete = not result.data.empty and not result.errors
+            prepare = job["analyses"] is not None and not result.data.empty
+            if complete:
+                # La copie sur disque sert encore à la préparation des analyses
+                remove_pending_job(job["doc_hash"], keep_copy=prepare)
+            if prepare:
+                # La préparation libère la place de l'extraction pour le document suivant
+                self.executor.submit(self._prepare, job, path, complete, options.get("use_cache", True))
+        finally:
+            if job["analyses"] == JOB_PENDING and job["state"] == JOB_FAILED:
+                self._update(job, analyses=None)
+            with self._condition:
+                self.running[owner] -= 1
+                self._dispatch(owner)
+    
+    def _prepare(self, job, path, discard_copy, use_cache):
+        self._update(job, analyses=JOB_RUNNING)
+        try:
+            with open(path, "rb") as content:
+                prepare_predefined_analyses(
+                    content,
+                    use_cache=use_cache,
+                    on_prepared=lambda nb_ready, nb_prompts: self._update(job, analyses=f"{nb_ready} / {nb_prompts}")
+                )
+        except Exception as e:
+            logger.warning("Préparation des analyses en échec pour %s : %s", job["name"], e)
+            self._update(job, analyses=f"Échec : {e}")
+        else:
+            nb_prepared = len(get_prepared_analyses(job["doc_hash"]).keys() & set(PREDEFINED_ANALYSES.values()))
+            self._update(job, analyses=f"{nb_prepared} / {len(PREDEFINED_ANALYSES)}")
+        finally:
+            if discard_copy:
+                discard_pending_copy(job["doc_hash"], path)
+    
+    def pending(self):
+        """
+        Liste les extractions interrompues ou incomplètes qui ne sont pas en cours.
+        
+        Returns:
+            list: Les documents à reprendre (voir list_pending_jobs)
+        """
+        with self._condition:
+            active = {
+                job["doc_hash"] for job in self.jobs_by_id.values() if job["state"] in (JOB_PENDING, JOB_RUNNING)
+            }
+        return [job for job in list_pending_jobs() if job["doc_hash"] not in active]
+    
+    def resume_pending(self, owner):
+        """
+        Relance les extractions interrompues ou incomplètes pour un propriétaire. Seules les
+        sections qui n'ont pas encore été extraites sont interrogées.
+        
+        Args:
+            owner (str): Le propriétaire des extractions relancées
+        
+        Returns:
+            int: Le nombre d'extractions relancées
+        """
+        pending = self.pending()
+        for job in pending:
+            options = dict(job["options"], resume=True)
+            with open(job["path"], "rb") as content:
+                self.submit(owner, content, file_name=job["file_name"], **options)
+        return len(pending)
+    
+    def jobs(self, owner):
+        """
+        Retourne l'état des extractions d'un propriétaire, dans l'ordre de soumission.
+        
+        Args:
+            owner (str): Le propriétaire des extractions
+        
+        Returns:
+            list: Une liste de JobStatus
+        """
+        with self._condition:
+            return [
+                JobStatus(*(job[field] for field in JobStatus._fields))
+                for job in self.jobs_by_id.values() if job["owner"] == owner
+            ]
+    
+    def is_busy(self, owner):
+        """
+        Indique si des extractions d'un propriétaire sont en attente ou en cours.
+        
+        Args:
+            owner (str): Le propriétaire des extractions
+        
+        Returns:
+            bool: True si au moins une extraction n'est pas terminée
+        """
+        with self._condition:
+            return any(
+                job["owner"] == owner and job["state"] in (JOB_PENDING, JOB_RUNNING)
+                for job in self.jobs_by_id.values()
+            )
+    
+    def collect(self, owner):
+        """
+        Retourne les extractions terminées (en succès ou en échec) qui n'ont pas encore été
+        récupérées, et les marque comme récupérées.
+        
+        Args:
+            owner (str): Le propriétaire des extractions
+        
+        Returns:
+            list: Une liste de JobStatus
+        """
+        collected = []
+        with self._condition:
+            for job in self.jobs_by_id.values():
+                if job["owner"] == owner and job["state"] in (JOB_DONE, JOB_FAILED) and not job["delivered"]:
+                    job["delivered"] = True
+                    collected.append(JobStatus(*(job[field] for field in JobStatus._fields)))
+        return collected
+    
+    def forget(self, owner):
+        """
+        Oublie les extractions terminées d'un propriétaire ; celles en cours se poursuivent.
+        
+        Args:
+            owner (str): Le propriétaire des extractions
+        """
+        with self._condition:
+            self.jobs_by_id = {
+                job_id: job for job_id, job in self.jobs_by_id.items()
+                if job["owner"] != owner or job["state"] in (JOB_PENDING, JOB_RUNNING)
+            }
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """
+    Retourne le gestionnaire des extractions en arrière-plan partagé par tout le processus.
+    
+    Returns:
+        ExtractionJobManager: Le gestionnaire partagé
+    """
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = ExtractionJobManager()
+        return _job_manager
+
+class ResultsStore:
+    """
+    Table des résultats d'extraction, une ligne par rapport, stockée par colonnes.
+    
+    Les métriques sont conservées dans un tableau float64 dont la capacité double au besoin
+    (ajout en temps constant amorti) ; la société, le fichier et l'exercice sont des clés
+    catégorielles (codes entiers et liste des valeurs). Un rapport déjà présent est mis à jour
+    en place. Les agrégats par colonne sont mis en cache jusqu'à la modification suivante.
+    
+    Args:
+        capacity (int): Le nombre de lignes réservées initialement
+    """
+    
+    def __init__(self, capacity=16):
+        self.columns = list(METRIC_COLUMNS)
+        self._values = np.full((max(1, capacity), len(self.columns)), np.nan)
+        self._company_codes = np.full(max(1, capacity), -1, dtype=np.int32)
+        self._year_codes = np.full(max(1, capacity), -1, dtype=np.int32)
+        self._files = []
+        self._rows = {}
+        self._row_hashes = {}
+        self._companies, self._company_index = [], {}
+        self._years, self._year_index = [], {}
+        self._aggregates = {}
+        self._lock = threading.Lock()
+        self.version = 0
+    
+    def __len__(self):
+        return len(self._files)
+    
+    def __contains__(self, file_name):
+        return file_name in self._rows
+    
+    def files(self):
+        """
+        Returns:
+            list: Les noms des fichiers, dans l'ordre d'ajout
+        """
+        return list(self._files)
+    
+    def row_hash(self, file_name):
+        """
+        Retourne l'empreinte du contenu de la ligne d'un rapport, pour les clés de cache.
+        
+        Args:
+            file_name (str): Le nom du fichier
+        
+        Returns:
+            str: L'empreinte SHA-256 des valeurs, de la société et de l'exercice
+        """
+        return self._row_hashes[file_name]
+    
+    @staticmethod
+    def _code(categories, index, value):
+        if value is None:
+            return -1
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        return code
+    
+    def _grow(self):
+        capacity = len(self._values) * 2
+        values = np.full((capacity, len(self.columns)), np.nan)
+        values[:len(self._values)] = self._values
+        self._values = values
+        for name in ("_company_codes", "_year_codes"):
+            codes = np.full(capacity, -1, dtype=np.int32)
+            codes[:len(self._files)] = getattr(self, name)[:len(self._files)]
+            setattr(self, name, codes)
+    
+    def upsert(self, file_name, entry, year=None):
+        """
+        Ajoute la ligne d'un rapport, ou la remplace si le fichier est déjà présent.
+        
+        Args:
+            file_name (str): Le nom du fichier
+            entry (dict | Series | DataFrame): Les valeurs par nom de colonne (un DataFrame
+                d'une ligne est accepté) ; les valeurs absentes ou non numériques deviennent NaN
+            year (int, optional): L'exercice du rapport
+        """
+        if isinstance(entry, pd.DataFrame):
+            entry = entry.iloc[0]
+        vector = pd.to_numeric(
+            pd.Series([entry.get(column) for column in self.columns], dtype=object), errors="coerce"
+        ).to_numpy(dtype=np.float64)
+        company = entry.get('Société') or f"Société inconnue ({file_name})"
+        
+        with self._lock:
+            row = self._rows.get(file_name)
+            if row is None:
+                if len(self._files) == len(self._values):
+                    self._grow()
+                row = self._rows[file_name] = len(self._files)
+                self._files.append(file_name)
+            self._values[row] = vector
+            self._company_codes[row] = self._code(self._companies, self._company_index, company)
+            self._year_codes[row] = self._code(self._years, self._year_index, year)
+            self._row_hashes[file_name] = hashlib.sha256(
+                vector.tobytes() + f"\x1f{company}\x1f{year}".encode("utf-8")
+            ).hexdigest()
+            self._aggregates.clear()
+            self.version += 1
+    
+    def _row_indices(self, files=None):
+        if files is None:
+            return np.arange(len(self._files))
+        return np.array([self._rows[name] for name in files], dtype=np.intp)
+    
+    def frame(self, files=None, with_keys=False):
+        """
+        Retourne les résultats sous forme de DataFrame.
+        
+        Args:
+            files (list, optional): Les fichiers à inclure, dans cet ordre (tous par défaut)
+            with_keys (bool): Si True, ajoute les colonnes catégorielles "Fichier" et "Exercice"
+        
+        Returns:
+            DataFrame: Une ligne par rapport, avec la colonne "Société" puis les métriques
+        """
+        with self._lock:
+            rows = self._row_indices(files)
+            df = pd.DataFrame(self._values[rows], columns=self.columns)
+            companies = np.array(self._companies, dtype=object)
+            df.insert(0, 'Société', companies[self._company_codes[rows]] if len(rows) else [])
+            if with_keys:
+                df.insert(0, 'Exercice', pd.Categorical.from_codes(self._year_codes[rows], self._years))
+                df.insert(0, 'Fichier', pd.Categorical.from_codes(rows, self._files))
+        return df
+    
+    def aggregates(self, files=None):
+        """
+        Retourne la moyenne, la médiane, l'écart-type, le minimum et le maximum de chaque métrique,
+        en ignorant les valeurs absentes. Le résultat est conservé jusqu'à la modification suivante.
+        
+        Args:
+            files (list, optional): Les fichiers à inclure (tous par défaut)
+        
+        Returns:
+            DataFrame: Une ligne par statistique, une colonne par métrique
+        """
+        key = None if files is None else tuple(files)
+        with self._lock:
+            cached = self._aggregates.get(key)
+            if cached is None:
+                values = pd.DataFrame(self._values[self._row_indices(files)], columns=self.columns)
+                cached = values.agg(["mean", "median", "std", "min", "max"])
+                cached.index = ["Moyenne", "Médiane", "Écart-type", "Minimum", "Maximum"]
+                self._aggregates[key] = cached
+        return cached.copy()
+
+# Feuilles du classeur Excel exporté : nom et métriques présentées (None : toutes les colonnes)
+EXCEL_SHEETS = [
+    ("Données", None),
+    ("Fonds propres", [
+        'Éléments éligibles (€)', 'Capital et primes (€)', 'Réserve de réconciliation (€)',
+        'Dettes subordonnées (€)', 'Fonds excédentaires (€)',
+    ]),
+    ("SCR", [
+        'SCR (€)', 'MCR (€)', 'Ratio de solvabilité (%)', 'SCR Risque de Marché (€)',
+        'SCR Risque de Contrepartie (€)', 'SCR Risque de Souscription Vie (€)',
+        'SCR Risque de Souscription Santé (€)', 'SCR Risque de Souscription Non-Vie (€)',
+        'SCR Risque Opérationnel (€)', 'Effet de Diversification (€)',
+    ]),
+    ("Actifs", [
+        'Total des actifs (€)', 'Obligations (€)', 'Actions (€)', 'Fonds d\'investissement (€)',
+        'Produits dérivés (€)', 'Immobilier (€)', 'Trésorerie et dépôts (€)', 'Participations (€)',
+        'Autres actifs (€)',
+    ]),
+]
+
+# Formats numériques Excel par type de métrique ; les ratios sont exprimés en points de pourcentage
+EXCEL_NUMBER_FORMATS = {
+    "euros": '#,##0 "€";-#,##0 "€"',
+    "pourcentage": '0.00" %"',
+}
+
+def excel_text_widths(values, kind):
+    """
+    Calcule, sans boucle sur les cellules, la longueur affichée de chaque valeur d'un tableau
+    selon le format Excel de son type.
+    
+    Args:
+        values (ndarray): Les valeurs (nombres, NaN ou textes)
+        kind (str): Le type de la métrique ("euros", "pourcentage" ou autre)
+    
+    Returns:
+        ndarray: La longueur en caractères de chaque valeur (0 pour une valeur absente)
+    """
+    numbers = pd.to_numeric(pd.Series(values.ravel(), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    if kind not in EXCEL_NUMBER_FORMATS:
+        texts = pd.Series(values.ravel(), dtype=object)
+        widths = texts.where(texts.notna(), "").astype(str).str.len().to_numpy()
+        return widths.reshape(values.shape)
+    
+    magnitude = np.abs(np.nan_to_num(numbers))
+    digits = np.where(magnitude >= 1, np.floor(np.log10(np.maximum(magnitude, 1))) + 1, 1)
+    if kind == "euros":
+        widths = digits + (digits - 1) // 3 + 2
+    else:
+        widths = digits + 5
+    widths = widths + (numbers < 0)
+    return np.where(np.isnan(numbers), 0, widths).reshape(values.shape)
+
+# Largeur maximale (en caractères) des colonnes de la feuille des réponses ; le texte est renvoyé à la ligne
+EXCEL_ANSWER_WIDTH = 80
+
+def write_excel_answers(workbook, answers):
+    """
+    Ajoute au classeur la feuille "Questions" : une ligne par document, une colonne par question,
+    le texte des réponses renvoyé à la ligne.
+    
+    Args:
+        workbook (Workbook): Le classeur openpyxl (mode write_only)
+        answers (DataFrame): La grille des réponses (colonnes d'identification puis une colonne par question)
+    """
+    worksheet = workbook.create_sheet("Questions")
+    header_font = Font(bold=True)
+    wrap = Alignment(wrap_text=True, vertical="top")
+    text = answers.astype(object).where(answers.notna(), "").astype(str)
+    widths = np.maximum(
+        text.apply(lambda column: column.str.len().max()).to_numpy(dtype=float),
+        np.array([len(str(column)) for column in answers.columns], dtype=float)
+    )
+    for index, width in enumerate(np.minimum(widths, EXCEL_ANSWER_WIDTH), 1):
+        worksheet.column_dimensions[get_column_letter(index)].width = (width + 2) * 1.2
+    
+    header = []
+    for column in answers.columns:
+        cell = WriteOnlyCell(worksheet, str(column))
+        cell.font = header_font
+        cell.alignment = wrap
+        header.append(cell)
+    worksheet.append(header)
+    for values in answers.itertuples(index=False):
+        row = []
+        for value in values:
+            cell = WriteOnlyCell(worksheet, None if is_missing_value(value) else str(value))
+            cell.alignment = wrap
+            row.append(cell)
+        worksheet.append(row)
+
+def write_excel_report(df, output, answers=None):
+    """
+    Écrit le classeur Excel des résultats : une feuille par thème, une colonne par société,
+    avec formats monétaires et de pourcentage. Le classeur est écrit en flux (mode write_only
+    d'openpyxl) et la largeur des colonnes est calculée à partir du DataFrame avant l'écriture :
+    la durée et la mémoire restent proportionnelles au nombre de sociétés. La ligne "Moyenne"
+    n'est pas exportée.
+    
+    Args:
+        df (DataFrame): Une ligne par société, avec la colonne "Société"
+        output: Le chemin ou l'objet fichier binaire de destination
+        answers (DataFrame, optional): La grille des réponses aux questions posées à tous les
+            documents (une ligne par document, une colonne par question), exportée dans la
+            feuille "Questions"
+    """
+    with timed("Export Excel") as timer:
+        column_kinds = {field.column: field.kind for field in METRIC_FIELDS}
+        df_societes = df[df['Société'] != 'Moyenne']
+        companies = df_societes['Société'].astype(str).to_numpy()
+        company_widths = pd.Series(companies, dtype=object).str.len().to_numpy()
+        header_font = Font(bold=True)
+        
+        workbook = openpyxl.Workbook(write_only=True)
+        for sheet_name, metrics in EXCEL_SHEETS:
+            if metrics is None:
+                metrics = [column for column in df_societes.columns if column != 'Société']
+            worksheet = workbook.create_sheet(sheet_name)
+            
+            # Largeur des colonnes : libellés des métriques, puis noms des sociétés et valeurs formatées
+            value_widths = np.zeros(len(companies))
+            for metric in metrics:
+                widths = excel_text_widths(df_societes[metric].to_numpy(dtype=object), column_kinds.get(metric))
+                value_widths = np.maximum(value_widths, widths)
+            worksheet.column_dimensions['A'].width = (max(len('Métrique'), *map(len, metrics)) + 2) * 1.2
+            for index, width in enumerate(np.maximum(value_widths, company_widths), 2):
+                worksheet.column_dimensions[get_column_letter(index)].width = (float(width) + 2) * 1.2
+            
+            header = [WriteOnlyCell(worksheet, 'Métrique')] + [WriteOnlyCell(worksheet, name) for name in companies]
+            for cell in header:
+                cell.font = header_font
+            worksheet.append(header)
+            
+            for metric in metrics:
+                number_format = EXCEL_NUMBER_FORMATS.get(column_kinds.get(metric))
+                label = WriteOnlyCell(worksheet, metric)
+                label.font = header_font
+                row = [label]
+                for value in df_societes[metric].tolist():
+                    if is_missing_value(value):
+                        row.append(None)
+                        continue
+                    cell = WriteOnlyCell(worksheet, value.item() if isinstance(value, np.generic) else value)
+                    if number_format:
+                        cell.number_format = number_format
+                    row.append(cell)
+                worksheet.append(row)
+        
+        if answers is not None and not answers.empty:
+            write_excel_answers(workbook, answers)
+        workbook.save(output)
+        if hasattr(output, "tell"):
+            timer.size = output.tell()
+        elif isinstance(output, (str, os.PathLike)):
+            timer.size = os.path.getsize(output)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SFCR_CACHE_DIR", tempfile.mkdtemp())
+
+import sfcr_core
+
+# Réponse combinée sans MCR (section "base") ni total des actifs (section "actifs")
+COMBINED_RESPONSE = "```json\n" + json.dumps({
+    "Société": "Assur Test",
+    "SCR (€)": 1000000,
+    "MCR (€)": None,
+    "Ratio de solvabilité (%)": "215,5 %",
+    "Éléments éligibles (€)": 2150000,
+    "Capital et primes (€)": 500000,
+    "Réserve de réconciliation (€)": 1200000,
+    "Dettes subordonnées (€)": 0,
+    "Fonds excédentaires (€)": 450000,
+    "SCR Risque de Marché (€)": 800000,
+    "SCR Risque de Contrepartie (€)": 100000,
+    "SCR Risque de Souscription Vie (€)": 300000,
+    "SCR Risque de Souscription Santé (€)": 50000,
+    "SCR Risque de Souscription Non-Vie (€)": 0,
+    "SCR Risque Opérationnel (€)": 60000,
+    "Effet de Diversification (€)": -310000,
+    "Total des actifs (€)": None,
+}) + "\n```"
+
+BASE_RESPONSE = (
+    "0) Nom de la société : Assur Test\n1) SCR : 1 000 000€\n2) MCR : 450 000€\n"
+    "3) Ratio de solvabilité : 215,5 %"
+)
+
+ACTIFS_RESPONSE = (
+    "1) Total des actifs : 10 M€\n2) Obligations : 6 000 000€\n3) Actions : 1 000 000€\n"
+    "4) Fonds d'investissement : 1 500 000€\n5) Produits dérivés : 0€\n6) Immobilier : 500 000€\n"
+    "7) Trésorerie et dépôts : 400 000€\n8) Participations : 300 000€\n9) Autres actifs : 300 000€"
+)
+
+
+def test_combined_resume_skips_checkpointed_sections(monkeypatch):
+    checkpoints = {
+        "combined": {"status": sfcr_core.CHECKPOINT_OK, "response": COMBINED_RESPONSE},
+        "base": {"status": sfcr_core.CHECKPOINT_OK, "response": BASE_RESPONSE},
+    }
+    questions = []
+
+    def get_chat_response(source_id, question, prompt=None, doc_hash=None, use_cache=True, priority=None):
+        questions.append(question)
+        if question == sfcr_core.QUESTION_TEMPLATE_ACTIFS:
+            return ACTIFS_RESPONSE
+        raise AssertionError(f"Question inattendue : {question[:60]}")
+
+    monkeypatch.setattr(sfcr_core, "get_section_checkpoints", lambda doc_hash: checkpoints)
+    monkeypatch.setattr(sfcr_core, "save_section_checkpoint", lambda *args, **kwargs: None)
+    monkeypatch.setattr(sfcr_core, "get_chat_response", get_chat_response)
+
+    df, errors = sfcr_core.extract_pdf_data(
+        "src", "a.pdf", mode=sfcr_core.EXTRACTION_MODE_COMBINED, use_cache=False, checkpoint_hash="h"
+    )
+
+    assert errors == {}
+    assert questions == [sfcr_core.QUESTION_TEMPLATE_ACTIFS]
+    assert df.iloc[0]["MCR (€)"] == 450000
+    assert df.iloc[0]["Total des actifs (€)"] == 10000000